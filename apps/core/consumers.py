@@ -34,8 +34,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         message = event['message']
         status = event['status']
 
-        # 發送給前端 WebSocket
-        await self.send(text_data=json.dumps({
+        payload = {
             'status': status,
             'message': message
-        }))
\ No newline at end of file
+        }
+        # 估價任務另外帶有 kind / task_id / redirect_url，匯入進度帶有 progress，原樣轉給前端
+        for key in ('kind', 'task_id', 'redirect_url', 'progress'):
+            if key in event:
+                payload[key] = event[key]
+
+        # 發送給前端 WebSocket
+        await self.send(text_data=json.dumps(payload))
\ No newline at end of file
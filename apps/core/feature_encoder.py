@@ -0,0 +1,109 @@
+"""
+單筆估價的快速特徵編碼
+
+模型是 sklearn Pipeline (ColumnTransformer + XGBRegressor)，
+逐筆估價時建立 pandas DataFrame、跑 ColumnTransformer 的成本比樹模型推論本身還高。
+這裡在模型載入時從 Pipeline 取出 one-hot 的類別對照表與欄位順序，
+估價時直接把輸入填進預先配置好的 NumPy 陣列，再呼叫 booster 的 inplace_predict。
+
+Pipeline 的結構若不是預期的樣子 (例如換了 encoder)，from_pipeline 回傳 None，
+呼叫端改走原本的 pandas 路徑；測試也以 pandas 路徑作為正確答案比對。
+"""
+import threading
+
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer, OneHotEncoder
+
+
+class FastFeatureEncoder:
+    """將一列特徵 (dict) 直接編碼成模型輸入並預測"""
+
+    def __init__(self, n_features, one_hot, transforms, booster, iteration_range, missing):
+        self.n_features = n_features
+        # [(欄位名稱, {類別: 位置})]
+        self.one_hot = one_hot
+        # [(欄位名稱, 位置, 函式或 None)]
+        self.transforms = transforms
+        self.booster = booster
+        self.iteration_range = iteration_range
+        self.missing = missing
+        # 每個執行緒各自一份輸入陣列 (threads pool 下不會互相覆蓋)
+        self._local = threading.local()
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """由訓練好的 Pipeline 建立編碼器，結構不支援時回傳 None"""
+        if not isinstance(pipeline, Pipeline) or len(pipeline.steps) != 2:
+            return None
+        preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[1][1]
+        if not isinstance(preprocessor, ColumnTransformer) or not hasattr(regressor, 'get_booster'):
+            return None
+
+        one_hot, transforms = [], []
+        offset = 0
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop':
+                continue
+            if name == 'remainder' and len(columns) == 0:
+                continue
+
+            if isinstance(transformer, OneHotEncoder):
+                if transformer.handle_unknown != 'ignore' or transformer.drop_idx_ is not None:
+                    return None
+                if getattr(transformer, '_infrequent_enabled', False):
+                    return None
+                for column, categories in zip(columns, transformer.categories_):
+                    one_hot.append((column, {category: offset + i for i, category in enumerate(categories)}))
+                    offset += len(categories)
+            elif transformer == 'passthrough' or isinstance(transformer, FunctionTransformer):
+                func = None if transformer == 'passthrough' else transformer.func
+                if func is not None and (not isinstance(func, np.ufunc) or transformer.kw_args):
+                    return None
+                for column in columns:
+                    transforms.append((column, offset, func))
+                    offset += 1
+            else:
+                return None
+
+        booster = regressor.get_booster()
+        if booster.num_features() != offset:
+            return None
+
+        # 與 XGBRegressor.predict 相同：有 early stopping 時只用到最佳的迭代
+        try:
+            iteration_range = (0, regressor.best_iteration + 1)
+        except AttributeError:
+            iteration_range = (0, 0)
+
+        return cls(offset, one_hot, transforms, booster, iteration_range, regressor.missing)
+
+    def _buffer(self):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = self._local.buffer = np.zeros((1, self.n_features), dtype=np.float32)
+        return buffer
+
+    def encode(self, row):
+        """將一列特徵填入輸入陣列 (未知類別與 OneHotEncoder 一樣全部為 0)"""
+        buffer = self._buffer()
+        buffer.fill(0)
+        values = buffer[0]
+        for column, positions in self.one_hot:
+            position = positions.get(row[column])
+            if position is not None:
+                values[position] = 1
+        for column, position, func in self.transforms:
+            value = float(row[column])
+            values[position] = func(value) if func is not None else value
+        return buffer
+
+    def predict(self, row):
+        """回傳模型的原始輸出 (log 價格)，形狀與 model.predict 相同"""
+        return self.booster.inplace_predict(
+            self.encode(row),
+            iteration_range=self.iteration_range,
+            missing=self.missing,
+            validate_features=False,
+        )
@@ -0,0 +1,36 @@
+"""
+切換使用中的估價模型版本
+
+使用方式:
+    python manage.py activate_model --list
+    python manage.py activate_model 2025-06
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import model_registry
+
+
+class Command(BaseCommand):
+    help = '切換使用中的模型版本 (worker 不需重啟，會在下一次估價時載入)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help='要啟用的版本名稱')
+        parser.add_argument('--list', action='store_true', help='列出所有已登錄的版本')
+
+    def handle(self, *args, **options):
+        if options['list'] or not options['version']:
+            active = model_registry.active_version() or model_registry.LEGACY_VERSION
+            for manifest in model_registry.list_versions():
+                marker = '*' if manifest['version'] == active else ' '
+                self.stdout.write(
+                    f"{marker} {manifest['version']}  {manifest['created_at']}  {manifest.get('note', '')}"
+                )
+            self.stdout.write(f"使用中: {active}")
+            return
+
+        try:
+            model_registry.activate_version(options['version'])
+        except model_registry.ModelRegistryError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"已切換為模型版本 {options['version']}"))
@@ -0,0 +1,85 @@
+"""
+由 House 既有的經緯度建立道路中心點 (RoadCentroid)
+
+使用方式:
+    python manage.py build_road_gazetteer
+    python manage.py build_road_gazetteer --city 臺北市 --min-samples 3
+"""
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.house.models import House
+from apps.core.models import RoadCentroid
+from apps.core.services import extract_road
+
+
+class Command(BaseCommand):
+    help = '以 House 的經緯度計算每條路 (縣市, 行政區, 路名) 的中位數座標'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--city', help='只重建指定縣市 (預設為全部)')
+        parser.add_argument(
+            '--min-samples', type=int, default=1,
+            help='路段至少需要幾筆房屋才會建立中心點 (預設 1)'
+        )
+
+    def handle(self, *args, **options):
+        city = options.get('city')
+        min_samples = options['min_samples']
+
+        houses = House.objects.exclude(
+            latitude__isnull=True
+        ).exclude(
+            longitude__isnull=True
+        ).exclude(
+            city__isnull=True
+        ).exclude(
+            town__isnull=True
+        )
+        if city:
+            houses = houses.filter(city__in={city, city.replace('台', '臺'), city.replace('臺', '台')})
+
+        # 1. 逐批讀取並取出路名 (不要一次把整張表載入成 Model 物件)
+        rows = []
+        for address, house_city, house_town, lat, lon in houses.values_list(
+            'address', 'city', 'town', 'latitude', 'longitude'
+        ).iterator(chunk_size=5000):
+            road = extract_road(house_city, house_town, address)
+            if not road:
+                continue
+            rows.append((house_city.replace('台', '臺'), house_town.replace('台', '臺'), road, float(lat), float(lon)))
+
+        if not rows:
+            self.stdout.write(self.style.WARNING('沒有可用的房屋經緯度資料'))
+            return
+
+        # 2. 每條路取中位數座標 (中位數比平均值不受離群的錯誤座標影響)
+        df = pd.DataFrame(rows, columns=['city', 'town', 'road', 'latitude', 'longitude'])
+        grouped = df.groupby(['city', 'town', 'road']).agg(
+            latitude=('latitude', 'median'),
+            longitude=('longitude', 'median'),
+            sample_count=('latitude', 'size'),
+        ).reset_index()
+        grouped = grouped[grouped['sample_count'] >= min_samples]
+
+        centroids = [
+            RoadCentroid(
+                city=row.city, town=row.town, road=row.road[:100],
+                latitude=row.latitude, longitude=row.longitude,
+                sample_count=row.sample_count,
+            )
+            for row in grouped.itertuples(index=False)
+        ]
+
+        # 3. 整批替換 (在同一個交易中，查詢端不會看到半套資料)
+        with transaction.atomic():
+            existing = RoadCentroid.objects.all()
+            if city:
+                existing = existing.filter(city=city.replace('台', '臺'))
+            existing.delete()
+            RoadCentroid.objects.bulk_create(centroids, batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已建立 {len(centroids)} 條道路中心點 (來源房屋 {len(rows)} 筆)'
+        ))
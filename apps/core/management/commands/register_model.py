@@ -0,0 +1,35 @@
+"""
+登錄新的估價模型版本
+
+使用方式:
+    python manage.py register_model 2025-06 path/to/model.pkl --activate
+    python manage.py register_model v3 path/to/model.pkl --note "加入 2024 Q4 資料"
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core import model_registry
+
+
+class Command(BaseCommand):
+    help = '將訓練好的模型檔登錄為新版本 (記錄 SHA-256)，可選擇立即啟用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model_version', help='版本名稱 (英數字、-、_、.)')
+        parser.add_argument('path', help='模型檔 (joblib pickle) 路徑')
+        parser.add_argument('--note', default='', help='備註 (訓練資料範圍、評估指標等)')
+        parser.add_argument('--activate', action='store_true', help='登錄後立即切換為使用中的版本')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = model_registry.register(
+                options['path'], options['model_version'],
+                note=options['note'], activate=options['activate'],
+            )
+        except (model_registry.ModelRegistryError, OSError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已登錄模型版本 {manifest['version']} (sha256 {manifest['sha256'][:12]}…)"
+        ))
+        if options['activate']:
+            self.stdout.write(self.style.SUCCESS("已切換為使用中的版本，worker 會在下一次估價時載入"))
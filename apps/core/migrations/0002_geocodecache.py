@@ -0,0 +1,28 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address_key', models.CharField(max_length=255, unique=True, verbose_name='正規化地址')),
+                ('latitude', models.FloatField(blank=True, null=True, verbose_name='緯度')),
+                ('longitude', models.FloatField(blank=True, null=True, verbose_name='經度')),
+                ('precision', models.CharField(choices=[('exact', '門牌'), ('road', '路名'), ('miss', '查無結果')], max_length=10, verbose_name='定位精確度')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '地理編碼快取',
+                'verbose_name_plural': '地理編碼快取',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_geocodecache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoadCentroid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=10, verbose_name='縣市')),
+                ('town', models.CharField(max_length=10, verbose_name='行政區')),
+                ('road', models.CharField(max_length=100, verbose_name='路名')),
+                ('latitude', models.FloatField(verbose_name='緯度')),
+                ('longitude', models.FloatField(verbose_name='經度')),
+                ('sample_count', models.IntegerField(default=0, verbose_name='樣本數')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+            ],
+            options={
+                'verbose_name': '道路中心點',
+                'verbose_name_plural': '道路中心點',
+                'constraints': [models.UniqueConstraint(fields=('city', 'town', 'road'), name='unique_road_centroid')],
+            },
+        ),
+    ]
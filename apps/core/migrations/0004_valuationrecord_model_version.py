@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_roadcentroid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='valuationrecord',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=50, verbose_name='模型版本'),
+        ),
+    ]
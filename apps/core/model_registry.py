@@ -0,0 +1,158 @@
+"""
+估價模型登錄 (Model Registry)
+
+每個版本的模型存在自己的目錄，並記錄檔案的 SHA-256，
+ACTIVE 檔案記錄目前使用的版本。切換版本只需要改寫 ACTIVE，
+worker 會在下一次估價時發現版本改變並載入新模型，不必重新啟動。
+
+目錄結構 (預設為 apps/core/ml_models/registry/):
+    registry/
+        ACTIVE                  # 目前使用的版本名稱
+        <version>/
+            model.pkl
+            manifest.json       # {"version", "sha256", "created_at", "note"}
+
+還沒有登錄任何版本 (沒有 ACTIVE) 時，沿用舊的 ml_models/smartval_model.pkl，版本名稱為 'legacy'
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from django.conf import settings
+from django.utils import timezone
+
+LEGACY_VERSION = 'legacy'
+ACTIVE_FILE = 'ACTIVE'
+ARTIFACT_FILE = 'model.pkl'
+MANIFEST_FILE = 'manifest.json'
+
+VERSION_PATTERN = re.compile(r'^[\w.\-]+$')
+
+
+class ModelRegistryError(Exception):
+    """模型登錄相關的錯誤 (版本不存在、檢查碼不符等)"""
+
+
+def registry_dir():
+    return settings.VALUATION_MODEL_REGISTRY_DIR
+
+
+def legacy_model_path():
+    return os.path.join(settings.BASE_DIR, 'apps/core/ml_models/smartval_model.pkl')
+
+
+def file_sha256(path):
+    """計算檔案的 SHA-256 (分段讀取，不會一次載入整個檔案)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, content):
+    """先寫入暫存檔再 rename，讀取端不會讀到寫到一半的內容"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _version_dir(version):
+    if not VERSION_PATTERN.match(version or ''):
+        raise ModelRegistryError(f'版本名稱不合法: {version!r}')
+    return os.path.join(registry_dir(), version)
+
+
+def read_manifest(version):
+    path = os.path.join(_version_dir(version), MANIFEST_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ModelRegistryError(f'找不到模型版本: {version}')
+
+
+def list_versions():
+    """列出所有已登錄的版本 (依建立時間排序)"""
+    if not os.path.isdir(registry_dir()):
+        return []
+    manifests = []
+    for name in os.listdir(registry_dir()):
+        if os.path.isfile(os.path.join(registry_dir(), name, MANIFEST_FILE)):
+            manifests.append(read_manifest(name))
+    return sorted(manifests, key=lambda manifest: manifest.get('created_at', ''))
+
+
+def active_version():
+    """目前使用的版本名稱，尚未登錄任何版本時回傳 None"""
+    try:
+        with open(os.path.join(registry_dir(), ACTIVE_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_version():
+    """目前使用的版本名稱 (含 legacy)，不載入模型，Web 端也能便宜地取得"""
+    return active_version() or LEGACY_VERSION
+
+
+def resolve_active():
+    """
+    取得目前使用的模型
+
+    Returns:
+        tuple: (版本名稱, 模型檔路徑, SHA-256)；legacy 模型沒有檢查碼，回傳 None
+    """
+    version = active_version()
+    if version is None:
+        return LEGACY_VERSION, legacy_model_path(), None
+
+    manifest = read_manifest(version)
+    return version, os.path.join(_version_dir(version), ARTIFACT_FILE), manifest['sha256']
+
+
+def register(source_path, version, note='', activate=False):
+    """
+    登錄新的模型版本：複製模型檔並記錄檢查碼
+
+    Args:
+        source_path (str): 訓練好的模型檔 (joblib pickle)
+        version (str): 版本名稱，例如 2025-06-01 或 v3
+        note (str): 備註 (訓練資料範圍、評估指標等)
+        activate (bool): 登錄後是否立即切換為使用中的版本
+    """
+    target_dir = _version_dir(version)
+    if os.path.exists(target_dir):
+        raise ModelRegistryError(f'模型版本已存在: {version}')
+
+    os.makedirs(target_dir)
+    target_path = os.path.join(target_dir, ARTIFACT_FILE)
+    shutil.copyfile(source_path, target_path)
+
+    manifest = {
+        'version': version,
+        'sha256': file_sha256(target_path),
+        'size': os.path.getsize(target_path),
+        'created_at': timezone.now().isoformat(),
+        'note': note,
+    }
+    _write_atomic(os.path.join(target_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    if activate:
+        activate_version(version)
+    return manifest
+
+
+def activate_version(version):
+    """切換使用中的版本 (先驗證檢查碼，避免切換到損毀的檔案)"""
+    manifest = read_manifest(version)
+    artifact_path = os.path.join(_version_dir(version), ARTIFACT_FILE)
+    if file_sha256(artifact_path) != manifest['sha256']:
+        raise ModelRegistryError(f'模型檔檢查碼不符，拒絕切換: {version}')
+
+    _write_atomic(os.path.join(registry_dir(), ACTIVE_FILE), version)
+    return manifest
@@ -30,6 +30,8 @@ class ValuationRecord(models.Model):
     # =====================================================
     predicted_price = models.DecimalField("預估總價(萬)", max_digits=12, decimal_places=2)
     unit_price = models.DecimalField("預估單價(萬/坪)", max_digits=10, decimal_places=2, null=True, blank=True)
+    # 產生這筆估價的模型版本 (見 apps/core/model_registry.py)
+    model_version = models.CharField("模型版本", max_length=50, blank=True, default='')
     
     # =====================================================
     # 3. 視覺化快照 (Snapshot Data) - 關鍵修改
@@ -60,4 +62,58 @@ class ValuationRecord(models.Model):
         verbose_name_plural = "估價收藏紀錄"
 
     def __str__(self):
-        return f"{self.user} - {self.city}{self.town} ({self.predicted_price}萬)"
\ No newline at end of file
+        return f"{self.user} - {self.city}{self.town} ({self.predicted_price}萬)"
+
+class GeocodeCache(models.Model):
+    """
+    地理編碼快取 (Nominatim 查詢結果)
+    以「正規化後的地址」為 key，讓同一個地址不必重複呼叫外部服務
+    Redis 是第一層快取，這張表是持久化的第二層 (重啟後仍然有效)
+    """
+    PRECISION_EXACT = 'exact'  # 精確定位到門牌
+    PRECISION_ROAD = 'road'    # 只定位到路名
+    PRECISION_MISS = 'miss'    # 查無結果 (負面快取)
+    PRECISION_CHOICES = [
+        (PRECISION_EXACT, '門牌'),
+        (PRECISION_ROAD, '路名'),
+        (PRECISION_MISS, '查無結果'),
+    ]
+
+    address_key = models.CharField("正規化地址", max_length=255, unique=True)
+    latitude = models.FloatField("緯度", null=True, blank=True)
+    longitude = models.FloatField("經度", null=True, blank=True)
+    precision = models.CharField("定位精確度", max_length=10, choices=PRECISION_CHOICES)
+    updated_at = models.DateTimeField("更新時間", auto_now=True)
+
+    class Meta:
+        verbose_name = "地理編碼快取"
+        verbose_name_plural = "地理編碼快取"
+
+    def __str__(self):
+        return f"{self.address_key} ({self.precision})"
+
+
+class RoadCentroid(models.Model):
+    """
+    道路中心點 (離線 gazetteer)
+    由 House 既有的經緯度計算出每條路的「中位數座標」，
+    讓估價時不必呼叫 Nominatim 也能定位到路段。
+    資料由 `python manage.py build_road_gazetteer` 產生
+    """
+    city = models.CharField("縣市", max_length=10)
+    town = models.CharField("行政區", max_length=10)
+    road = models.CharField("路名", max_length=100)
+    latitude = models.FloatField("緯度")
+    longitude = models.FloatField("經度")
+    sample_count = models.IntegerField("樣本數", default=0)
+    updated_at = models.DateTimeField("更新時間", auto_now=True)
+
+    class Meta:
+        verbose_name = "道路中心點"
+        verbose_name_plural = "道路中心點"
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'town', 'road'], name='unique_road_centroid'),
+        ]
+
+    def __str__(self):
+        return f"{self.city}{self.town}{self.road} ({self.sample_count} 筆)"
@@ -1,27 +1,182 @@
-import os, re
+import os, re, math, time, json, hashlib, unicodedata
+from datetime import timedelta
 import joblib
 import pandas as pd
 import numpy as np
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
 from geopy.geocoders import Nominatim # 免費的地理編碼服務 (OpenStreetMap)
-from geopy.distance import geodesic # 【新增】用於計算距離
 from apps.house.models import House # 【新增】引入房屋模型
+from . import model_registry
+from .feature_encoder import FastFeatureEncoder
+from .models import GeocodeCache, RoadCentroid
+from .spatial import city_variants, columns_from_rows, get_city_index, get_city_version, haversine_km, rank_by_tier, strictness_tier
+
+
+def strip_floor(street):
+    """去掉「樓層」相關資訊，例如: "大德路151號12樓" -> "大德路151號" """
+    return re.sub(r'\d+[樓Ff].*', '', street)
+
+
+def normalize_address(city, town, street):
+    """
+    將地址正規化，作為地理編碼快取的 key
+
+    1. 全形數字/英文轉半形 (NFKC)，例如 "１５１號" -> "151號"
+    2. 統一「台」為「臺」
+    3. 去除空白與樓層資訊 (與 clean_street 的規則相同)
+    """
+    text = unicodedata.normalize('NFKC', f"{city}{town}{street}")
+    text = re.sub(r'\s+', '', text)
+    return strip_floor(text).replace('台', '臺')
+
+
+def extract_road(city, town, street):
+    """
+    從地址中取出「路名」(道路中心點的 key)
+
+    去掉縣市、行政區前綴，以及巷、弄、門牌號碼之後的內容
+    例如: "臺北市大安區復興南路一段151巷3號5樓" -> "復興南路一段"
+    """
+    city = (city or '').replace('台', '臺')
+    town = (town or '').replace('台', '臺')
+    text = normalize_address('', '', street or '')
+    if city and text.startswith(city):
+        text = text[len(city):]
+    if town and text.startswith(town):
+        text = text[len(town):]
+    return re.sub(r'\d+(?:之\d+)?[巷弄號].*', '', text)
+
+
+def current_rss_bytes():
+    """目前 process 的常駐記憶體 (RSS)，非 Linux 環境回傳 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
 
 class HousePriceService:
-    _model = None
+    # (模型, 版本, 快速編碼器) 放在同一個 tuple 中，換版時一次替換，
+    # 進行中的估價仍使用它一開始取得的模型
+    _model_bundle = (None, None, None)
+    _model_checked_at = 0.0
     _geolocator = None
 
+    # 模型載入的監控指標 (同時寫入 cache，讓 Web 端也能查看 worker 的狀況)
+    MODEL_METRICS_CACHE_KEY = 'valuation_model_metrics'
+    model_metrics = {}
+
+    # 暖機用的範例房屋 (只用來觸發一次完整的預測流程)
+    WARM_UP_INPUT = {
+        'city': '臺北市', 'town': '大安區', 'house_type': '公寓（無電梯）',
+        'floor_number': 3, 'total_floors': 5, 'land_area': 10.0,
+        'floor_area': 30.0, 'house_age': 20.0, 'room_count': 3,
+    }
+
     @classmethod
     def _get_model(cls):
-        if cls._model is None:
-            # 讀取您訓練好的最佳模型 (請確認檔名是否一致)
-            model_path = os.path.join(settings.BASE_DIR, 'apps/core/ml_models/smartval_model.pkl')
-            try:
-                cls._model = joblib.load(model_path)
-            except Exception as e:
-                print(f"❌ 模型載入失敗: {e}")
-                return None
-        return cls._model
+        return cls._get_model_bundle()[0]
+
+    @classmethod
+    def _get_model_bundle(cls):
+        """
+        取得 (模型, 版本, 快速編碼器)；模型結構不支援快速編碼時編碼器為 None
+
+        每隔 MODEL_REGISTRY_CHECK_INTERVAL 秒檢查一次模型登錄的使用中版本，
+        版本改變時載入新模型並替換；新模型載入失敗則繼續使用舊模型
+        """
+        now = time.monotonic()
+        if cls._model_bundle[0] is None or now - cls._model_checked_at >= settings.MODEL_REGISTRY_CHECK_INTERVAL:
+            cls._model_checked_at = now
+            cls._refresh_model()
+        return cls._model_bundle
+
+    @classmethod
+    def _refresh_model(cls):
+        try:
+            version, model_path, sha256 = model_registry.resolve_active()
+        except Exception as e:
+            print(f"❌ 無法讀取模型登錄: {e}")
+            return
+
+        current_model, current_version, _ = cls._model_bundle
+        if current_model is not None and version == current_version:
+            return
+
+        try:
+            # 登錄的模型需先核對檢查碼，避免載入複製到一半或損毀的檔案
+            if sha256 and model_registry.file_sha256(model_path) != sha256:
+                raise model_registry.ModelRegistryError('模型檔檢查碼不符')
+
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            model = joblib.load(model_path)
+            load_seconds = time.perf_counter() - started
+        except Exception as e:
+            print(f"❌ 模型載入失敗 ({version}): {e}")
+            return
+
+        # 在載入時就從 Pipeline 取出類別對照表，逐筆估價時不必再經過 pandas
+        encoder = FastFeatureEncoder.from_pipeline(model)
+        if encoder is None:
+            print(f"⚠️ 模型 {version} 不支援快速特徵編碼，改用 pandas 路徑")
+
+        cls._model_bundle = (model, version, encoder)
+
+        rss_after = current_rss_bytes()
+        cls._record_model_metrics(
+            version=version,
+            load_seconds=round(load_seconds, 3),
+            memory_bytes=rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+            file_bytes=os.path.getsize(model_path),
+            pid=os.getpid(),
+        )
+        if current_version is None:
+            print(f"🧠 模型載入完成: {version} ({load_seconds:.2f} 秒)")
+        else:
+            print(f"🔄 模型已切換: {current_version} → {version} ({load_seconds:.2f} 秒)")
+
+    @classmethod
+    def _record_model_metrics(cls, **metrics):
+        """更新模型監控指標，並寫入 cache (Redis 無法連線時只保留在記憶體)"""
+        cls.model_metrics.update(metrics, updated_at=timezone.now().isoformat())
+        try:
+            cache.set(cls.MODEL_METRICS_CACHE_KEY, cls.model_metrics, timeout=None)
+        except Exception as e:
+            print(f"⚠️ 無法寫入模型監控指標: {e}")
+
+    @classmethod
+    def get_model_metrics(cls):
+        """取得最近一次模型載入 / 暖機的監控指標"""
+        try:
+            metrics = cache.get(cls.MODEL_METRICS_CACHE_KEY)
+        except Exception:
+            metrics = None
+        return metrics or dict(cls.model_metrics)
+
+    @classmethod
+    def load_model(cls):
+        """只載入模型、不做預測 (在 Celery worker fork 子行程之前呼叫)"""
+        return cls._get_model() is not None
+
+    @classmethod
+    def warm_up(cls):
+        """
+        載入模型並執行一次預測，讓第一筆真正的估價不必負擔冷啟動成本
+        """
+        model, _, encoder = cls._get_model_bundle()
+        if model is None:
+            return False
+
+        started = time.perf_counter()
+        cls._predict_price(model, encoder, cls._feature_row(cls.WARM_UP_INPUT, 121.5436, 25.0330))
+        warm_up_seconds = time.perf_counter() - started
+        cls._record_model_metrics(warm_up_seconds=round(warm_up_seconds, 3))
+        print(f"🔥 模型暖機完成 ({warm_up_seconds:.2f} 秒)")
+        return True
 
     @classmethod
     def _get_geolocator(cls):
@@ -31,17 +186,125 @@ class HousePriceService:
             cls._geolocator = Nominatim(user_agent="smartval_app")
         return cls._geolocator
 
+    @classmethod
+    def _geocode_cache_key(cls, address_key):
+        """Redis 的 key 使用雜湊，避免中文與過長的字串"""
+        digest = hashlib.sha1(address_key.encode('utf-8')).hexdigest()
+        return f'geocode:{digest}'
+
+    @classmethod
+    def _get_cached_geocode(cls, address_key):
+        """
+        依序查詢 Redis -> 資料庫，回傳 (經度, 緯度, 精確度)，沒有快取則回傳 None
+        """
+        redis_key = cls._geocode_cache_key(address_key)
+        try:
+            cached = cache.get(redis_key)
+            if cached is not None:
+                return tuple(cached)
+        except Exception as e:
+            print(f"⚠️ Redis 讀取地理編碼快取失敗: {e}")
+
+        record = GeocodeCache.objects.filter(address_key=address_key).first()
+        if record is None:
+            return None
+
+        # 檢查資料庫中的快取是否已過期 (各精確度的存活時間不同)
+        ttl = settings.GEOCODE_CACHE_TTL[record.precision]
+        remaining = (record.updated_at + timedelta(seconds=ttl) - timezone.now()).total_seconds()
+        if remaining <= 0:
+            return None
+
+        value = (record.longitude, record.latitude, record.precision)
+        # 回填 Redis，剩餘的存活時間與資料庫一致
+        try:
+            cache.set(redis_key, value, timeout=int(remaining))
+        except Exception:
+            pass
+        return value
+
+    @classmethod
+    def _set_cached_geocode(cls, address_key, longitude, latitude, precision):
+        """同時寫入資料庫與 Redis"""
+        GeocodeCache.objects.update_or_create(
+            address_key=address_key,
+            defaults={'longitude': longitude, 'latitude': latitude, 'precision': precision},
+        )
+        try:
+            cache.set(
+                cls._geocode_cache_key(address_key),
+                (longitude, latitude, precision),
+                timeout=settings.GEOCODE_CACHE_TTL[precision],
+            )
+        except Exception as e:
+            print(f"⚠️ Redis 寫入地理編碼快取失敗: {e}")
+
+    @classmethod
+    def _lookup_road_centroid(cls, city, town, street):
+        """
+        從離線的道路中心點表查詢座標，回傳 (經度, 緯度)，查不到則回傳 None
+        """
+        road = extract_road(city, town, street)
+        if not road:
+            return None
+        return RoadCentroid.objects.filter(
+            city=city.replace('台', '臺'),
+            town=town.replace('台', '臺'),
+            road=road,
+        ).values_list('longitude', 'latitude').first()
+
     @classmethod
     def _get_lat_lon(cls, city, town, street):
         """
-        將地址轉換為經緯度 (嚴格模式)
+        將地址轉換為經緯度
+
+        查詢順序：快取 -> 道路中心點 -> Nominatim -> 道路中心點 (備援)
+        """
+        address_key = normalize_address(city, town, street)
+        cached = cls._get_cached_geocode(address_key)
+        if cached is not None and cached[2] != GeocodeCache.PRECISION_MISS:
+            longitude, latitude, precision = cached
+            return longitude, latitude, precision == GeocodeCache.PRECISION_EXACT
+
+        # 道路中心點只定位到路段，因此 is_exact 一律為 False
+        road_point = cls._lookup_road_centroid(city, town, street)
+        if road_point and settings.GEOCODE_GAZETTEER_FIRST:
+            return road_point[0], road_point[1], False
+
+        if cached is None:
+            longitude, latitude, precision, had_error = cls._geocode_nominatim(city, town, street)
+
+            # 逾時或連線錯誤不做負面快取，避免暫時性的故障被記住
+            if precision != GeocodeCache.PRECISION_MISS or not had_error:
+                cls._set_cached_geocode(address_key, longitude, latitude, precision)
+
+            if precision != GeocodeCache.PRECISION_MISS:
+                return longitude, latitude, precision == GeocodeCache.PRECISION_EXACT
+        else:
+            print(f"⚠️ [快取] 該地址先前查無結果: {address_key}")
+
+        # Nominatim 查無結果或無法連線時，改用道路中心點
+        if road_point:
+            print(f"⚠️ 改用道路中心點定位: {city}{town}{extract_road(city, town, street)}")
+            return road_point[0], road_point[1], False
+
+        return None, None, False
+
+    @classmethod
+    def _geocode_nominatim(cls, city, town, street):
+        """
+        呼叫 Nominatim 將地址轉換為經緯度 (嚴格模式)
+
+        Returns:
+            tuple: (經度, 緯度, 精確度, 是否發生連線錯誤)
         """
         geolocator = cls._get_geolocator()
+        had_error = False
         
         # 1. 處理地址字串
         # 我們只去掉「樓層」相關資訊，保留「路名」與「門牌號碼」
         # 例如: "大德路151號12樓" -> "大德路151號"
-        clean_street = re.sub(r'\d+[樓Ff].*', '', street) 
+        clean_street = strip_floor(street)
         
         # 組合完整地址
         full_address = f"{city}{town}{clean_street}"
@@ -68,10 +331,10 @@ class HousePriceService:
             # timeout 設為 3 秒
             location = geolocator.geocode(f"{full_address}, Taiwan", timeout=3)
             if location:
-                # 找到了！回傳座標，並標記 is_exact = True
-                return location.longitude, location.latitude, True 
+                # 找到了！回傳座標，並標記為門牌精確定位
+                return location.longitude, location.latitude, GeocodeCache.PRECISION_EXACT, had_error
         except Exception:
-            pass # 失敗就繼續往下試
+            had_error = True # 失敗就繼續往下試
 
         # --- 嘗試 2：退一步搜尋路名 (去除號碼) ---
         # 邏輯：去掉 "數字+號" 及其後面的所有內容
@@ -85,17 +348,73 @@ class HousePriceService:
                 print(f"⚠️ 精確定位失敗，嘗試路名定位: {road_address}")
                 location = geolocator.geocode(f"{road_address}, Taiwan", timeout=3)
                 if location and is_city_match(location, city):
-                    return location.longitude, location.latitude, False
+                    return location.longitude, location.latitude, GeocodeCache.PRECISION_ROAD, had_error
             except Exception:
-                pass
+                had_error = True
 
         # --- 3. 真的全部失敗 ---
         print(f"⚠️ 全部 Geocode 失敗: {full_address}")
-        return None, None, False
+        return None, None, GeocodeCache.PRECISION_MISS, had_error
     
+    @classmethod
+    def _comparable_filters(cls, criteria, strict=True):
+        """
+        將篩選條件轉換為 Django ORM 的 filter kwargs (不含縣市)
+        空間索引也使用相同的格式篩選，兩邊的條件才會一致
+
+        Args:
+            criteria (dict): 篩選條件字典
+            strict (bool): True 為嚴格模式，False 為寬鬆模式 (僅看類型與屋齡範圍)
+        """
+        # 【修正】確保範圍值不會是負數
+        house_age = float(criteria.get('house_age', 0))
+
+        if not strict:
+            return {
+                'house_type': criteria.get('house_type'),
+                # 屋齡放寬到 ±10 年
+                'house_age__range': (max(0, house_age - 10), house_age + 10),
+            }
+
+        total_floors = float(criteria.get('total_floors', 0))
+        floor_number = float(criteria.get('floor_number', 0))
+        floor_area = float(criteria.get('floor_area', 0))
+        land_area = float(criteria.get('land_area', 0))
+
+        return {
+            # 條件 1: 房屋類型一樣
+            'house_type': criteria.get('house_type'),
+            # 條件 7: 房間數一樣
+            'room_count': criteria.get('room_count'),
+            # 條件 2: 屋齡 ±5 年
+            'house_age__range': (max(0, house_age - 5), house_age + 5),
+            # 條件 3: 總樓層 ±5 層
+            'total_floors__range': (max(1, total_floors - 5), total_floors + 5),
+            # 條件 4: 所在樓層 ±5 層
+            'floor_number__range': (max(1, floor_number - 5), floor_number + 5),
+            # 條件 5: 建坪 ±10 坪
+            'floor_area__range': (max(0, floor_area - 10), floor_area + 10),
+            # 條件 6: 地坪 ±5 坪
+            'land_area__range': (max(0, land_area - 5), land_area + 5),
+        }
+
+    @staticmethod
+    def _to_house_data(house, dist):
+        """將查詢結果整理成前端使用的格式"""
+        return {
+            'address': house['address'],
+            'price': house['total_price'],
+            'type': house['house_type'],
+            'age': house['house_age'],
+            'area': house['floor_area'],
+            'lat': float(house['latitude']),
+            'lng': float(house['longitude']),
+            'distance_km': round(dist, 2)
+        }
+
     # 【修改】擴充參數，接收所有篩選條件
     @classmethod
-    def find_nearby_houses(cls, target_lat, target_lon, criteria, limit=10):
+    def find_nearby_houses(cls, target_lat, target_lon, criteria, limit=10, radius_km=None):
         """
         找出符合條件且距離最近的房屋
         
@@ -104,130 +423,17 @@ class HousePriceService:
             target_lon (float): 目標經度
             criteria (dict): 篩選條件字典 (包含 city, house_type, age 等)
             limit (int): 回傳筆數
+            radius_km (float): 資料庫查詢的起始搜尋半徑，None 表示直接查詢整個縣市
+                               (只影響查詢範圍，不影響結果；空間索引模式下不需要)
         """
         try:
-            city = criteria.get('city')
-            
             # 【調試】印出搜尋條件
             print(f"🔍 [DEBUG] 搜尋條件: {criteria}")
-            
-            # 1. 執行篩選 (Database Filtering)
-            # 使用 Django ORM 的 range 查詢，這是在資料庫層級做的，效能最好
-            
-            # 【修正】確保範圍值不會是負數
-            room_count = float(criteria.get('room_count', 0))
-            house_age = float(criteria.get('house_age', 0))
-            total_floors = float(criteria.get('total_floors', 0))
-            floor_number = float(criteria.get('floor_number', 0))
-            floor_area = float(criteria.get('floor_area', 0))
-            land_area = float(criteria.get('land_area', 0))
-            
-            candidates = House.objects.filter(
-                city=city, # 基本條件：同縣市
-                
-                # 條件 1: 房屋類型一樣
-                house_type=criteria.get('house_type'),
-                
-                # 條件 7: 房間數一樣
-                room_count=criteria.get('room_count'),
-                
-                # 條件 2: 屋齡 ±5 年
-                house_age__range=(
-                    max(0, house_age - 5), 
-                    house_age + 5
-                ),
-                
-                # 條件 3: 總樓層 ±5 層
-                total_floors__range=(
-                    max(1, total_floors - 5), 
-                    total_floors + 5
-                ),
-                
-                # 條件 4: 所在樓層 ±5 層
-                floor_number__range=(
-                    max(1, floor_number - 5), 
-                    floor_number + 5
-                ),
-                
-                # 條件 5: 建坪 ±20 坪
-                floor_area__range=(
-                    max(0, floor_area - 10), 
-                    floor_area + 10
-                ),
-                
-                # 條件 6: 地坪 ±10 坪
-                land_area__range=(
-                    max(0, land_area - 5), 
-                    land_area + 5
-                )
-            ).exclude(
-                # 排除經緯度為 NULL 的資料
-                latitude__isnull=True
-            ).exclude(
-                longitude__isnull=True
-            ).values(
-                'id', 'address', 'total_price', 'house_type', 
-                'house_age', 'floor_area', 'latitude', 'longitude'
-            )
-            
-            print(f"🔍 [find_nearby_houses] 嚴格篩選後，找到 {candidates.count()} 筆房屋")
-            
-            # 【調試】印出前3筆資料看看
-            for i, house in enumerate(list(candidates)[:3]):
-                print(f"  房屋 {i+1}: {house['address']}, 經緯度: ({house['latitude']}, {house['longitude']})")
-
-            # --- 退路機制 (Fallback) ---
-            # 如果嚴格篩選找不到足夠資料 (例如少於 5 筆)，自動放寬條件
-            # 這是為了避免地圖上空空如也，讓使用者體驗變差
-            if candidates.count() < 5:
-                print("⚠️ 符合條件的房屋過少，改為寬鬆模式 (僅看類型與屋齡範圍)")
-                candidates = House.objects.filter(
-                    city=city,
-                    house_type=criteria.get('house_type'),
-                    # 屋齡放寬到 ±10 年
-                    house_age__range=(
-                        max(0, house_age - 10), 
-                        house_age + 10
-                    )
-                    # 移除其他嚴格限制
-                ).exclude(
-                    latitude__isnull=True
-                ).exclude(
-                    longitude__isnull=True
-                ).values(
-                    'id', 'address', 'total_price', 'house_type', 
-                    'house_age', 'floor_area', 'latitude', 'longitude'
-                )
-                print(f"🔍 [find_nearby_houses] 寬鬆模式後，找到 {candidates.count()} 筆房屋")
-
 
-            # 2. 計算距離並排序 (與原本邏輯相同)
-            nearby_list = []
-            target_point = (target_lat, target_lon)
-
-            for house in candidates:
-                if not house['latitude'] or not house['longitude']:
-                    print(f"⚠️ 跳過無經緯度的房屋: {house['address']}")
-                    continue
-                
-                house_point = (house['latitude'], house['longitude'])
-                dist = geodesic(target_point, house_point).km
-                
-                house_data = {
-                    'address': house['address'],
-                    'price': house['total_price'],
-                    'type': house['house_type'],
-                    'age': house['house_age'],
-                    'area': house['floor_area'],
-                    'lat': float(house['latitude']),
-                    'lng': float(house['longitude']),
-                    'distance_km': round(dist, 2)
-                }
-                nearby_list.append(house_data)
-
-            # 3. 依照距離排序 (由近到遠)，取前 limit 筆
-            nearby_list.sort(key=lambda x: x['distance_km'])
-            result = nearby_list[:limit]
+            if settings.COMPARABLE_SPATIAL_INDEX:
+                result = cls._find_nearby_from_index(target_lat, target_lon, criteria, limit)
+            else:
+                result = cls._find_nearby_from_db(target_lat, target_lon, criteria, limit, radius_km)
             
             print(f"✅ [find_nearby_houses] 最終回傳 {len(result)} 筆房屋資料")
             if result:
@@ -242,110 +448,415 @@ class HousePriceService:
             # 如果出錯，回傳空列表，不要讓整個預測掛掉
             return []
 
+    @classmethod
+    def _find_nearby_from_index(cls, target_lat, target_lon, criteria, limit):
+        """
+        使用縣市的空間索引 (BallTree) 直接找出最近的 limit 筆房屋
+        """
+        index = get_city_index(criteria.get('city'))
+
+        # 以寬鬆條件為候選範圍，依「符合幾項嚴格條件、距離」排序
+        matches = index.nearest(
+            target_lat, target_lon,
+            cls._comparable_filters(criteria, strict=False),
+            cls._comparable_filters(criteria, strict=True),
+            limit
+        )
+        print(f"🔍 [find_nearby_houses] 空間索引找到 {len(matches)} 筆房屋")
+
+        # 索引只存篩選欄位，顯示用的資料再以主鍵向資料庫取回 (最多 limit 筆)
+        houses = House.objects.filter(id__in=[house_id for house_id, _ in matches]).values(
+            'id', 'address', 'total_price', 'house_type',
+            'house_age', 'floor_area', 'latitude', 'longitude'
+        )
+        houses = {house['id']: house for house in houses}
+
+        return [
+            cls._to_house_data(houses[house_id], dist)
+            for house_id, dist in matches
+            if house_id in houses  # 索引重建前被刪除的房屋
+        ]
+
+    @staticmethod
+    def _bounding_box(target_lat, target_lon, radius_km):
+        """
+        將搜尋半徑換算成經緯度範圍 (Django ORM 的 filter kwargs)
+        緯度 1 度約 111.32 km，經度 1 度的長度會隨緯度縮小
+        """
+        dlat = radius_km / 111.32
+        dlon = radius_km / (111.32 * max(math.cos(math.radians(target_lat)), 0.01))
+        return {
+            'latitude__range': (target_lat - dlat, target_lat + dlat),
+            'longitude__range': (target_lon - dlon, target_lon + dlon),
+        }
+
+    @classmethod
+    def _find_nearby_from_db(cls, target_lat, target_lon, criteria, limit, radius_km=None):
+        """
+        不使用空間索引：以一次 ORM 查詢取出寬鬆條件的候選房屋，
+        再於記憶體中依「符合幾項嚴格條件 (tier)、距離」排序
+
+        完全符合嚴格條件的房屋永遠排在前面，不足 limit 筆時由條件最接近的房屋補上，
+        取代原本「嚴格查詢 → 不足 5 筆再寬鬆查詢」的多次查詢。
+
+        有 radius_km 時先以 bounding box 縮小查詢範圍；
+        半徑內完全符合的房屋不足 limit 筆才把半徑加倍，超過上限後查詢整個縣市。
+        """
+        target_lat, target_lon = float(target_lat), float(target_lon)
+        strict = cls._comparable_filters(criteria, strict=True)
+        strict_fields = sorted({lookup.partition('__')[0] for lookup in strict})
+
+        # 1. 執行篩選 (Database Filtering)
+        # 使用 Django ORM 的 range 查詢，這是在資料庫層級做的，效能最好
+        candidates = House.objects.filter(
+            city__in=city_variants(criteria.get('city')), # 基本條件：同縣市 (台 / 臺 兩種寫法，與空間索引相同)
+            **cls._comparable_filters(criteria, strict=False)
+        ).exclude(
+            # 排除經緯度為 NULL 的資料
+            latitude__isnull=True
+        ).exclude(
+            longitude__isnull=True
+        ).values(
+            'id', 'address', 'total_price', 'latitude', 'longitude', *strict_fields
+        )
+
+        while True:
+            if radius_km is None:
+                houses = list(candidates)
+            else:
+                houses = list(candidates.filter(**cls._bounding_box(target_lat, target_lon, radius_km)))
+
+            distances = haversine_km(
+                target_lat, target_lon,
+                [house['latitude'] for house in houses],
+                [house['longitude'] for house in houses],
+            )
+            tiers = strictness_tier(columns_from_rows(houses, strict_fields), strict) if houses else np.array([], dtype=int)
+
+            if radius_km is None:
+                break
+
+            # 半徑內已有足夠「完全符合」的房屋，範圍外的房屋不可能排在它們前面
+            exact = int(((tiers == len(strict)) & (distances <= radius_km)).sum())
+            if exact >= limit:
+                break
+
+            print(f"🔍 [find_nearby_houses] 半徑 {radius_km} km 內只有 {exact} 筆完全符合，擴大搜尋範圍")
+            radius_km *= 2
+            if radius_km > settings.COMPARABLE_MAX_RADIUS_KM:
+                radius_km = None
+
+        positions = rank_by_tier(tiers, distances, limit)
+        print(f"🔍 [find_nearby_houses] 候選 {len(houses)} 筆，其中 {int((tiers == len(strict)).sum())} 筆完全符合嚴格條件")
+
+        # 2. 結果已依照「條件接近程度、距離」排序
+        return [cls._to_house_data(houses[i], float(distances[i])) for i in positions]
+
+    # 估價結果快取的 key 前綴
+    RESULT_CACHE_PREFIX = 'valuation_result:'
+    NUMERIC_INPUT_FIELDS = ('house_age', 'total_floors', 'floor_number', 'floor_area', 'land_area', 'room_count')
+
+    @classmethod
+    def _result_cache_key(cls, input_data, model_version, city_version):
+        """
+        以正規化後的輸入 + 模型版本 + 縣市資料版本產生快取 key
+
+        地址先正規化 (全形、台/臺、樓層)，數值統一為小數點後兩位，
+        3 與 3.0、「台北市」與「臺北市」都會對應到同一筆快取
+        """
+        canonical = {
+            'address': normalize_address(
+                str(input_data.get('city', '')), str(input_data.get('town', '')), str(input_data.get('street', ''))
+            ),
+            'house_type': str(input_data.get('house_type', '')),
+            'model_version': model_version,
+            'city_version': city_version,
+        }
+        for field in cls.NUMERIC_INPUT_FIELDS:
+            try:
+                canonical[field] = round(float(input_data.get(field) or 0), 2)
+            except (TypeError, ValueError):
+                canonical[field] = str(input_data.get(field))
+
+        payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+        return cls.RESULT_CACHE_PREFIX + hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def city_data_version(input_data):
+        """該縣市 House 資料的版本號 (資料異動時由 signal 更新)，Redis 無法使用時為 None"""
+        return get_city_version(str(input_data.get('city', '')))
+
+    @classmethod
+    def get_cached_result(cls, input_data):
+        """
+        查詢相同輸入的估價結果 (predict_house_price 任務的回傳格式)，沒有則回傳 None
+        """
+        city_version = cls.city_data_version(input_data)
+        if city_version is None:
+            return None
+        key = cls._result_cache_key(input_data, model_registry.current_version(), city_version)
+        try:
+            return cache.get(key)
+        except Exception as e:
+            print(f"⚠️ 無法讀取估價結果快取: {e}")
+            return None
+
+    @classmethod
+    def set_cached_result(cls, input_data, task_result, city_version):
+        """
+        寫入估價結果快取
+
+        city_version 必須是「估價開始前」取得的版本：
+        估價期間若有房屋異動，版本號已改變，這筆結果就不會再被查到
+        """
+        model_version = task_result.get('data', {}).get('model_version')
+        if city_version is None or model_version is None:
+            return
+        key = cls._result_cache_key(input_data, model_version, city_version)
+        try:
+            cache.set(key, task_result, timeout=settings.VALUATION_RESULT_CACHE_TTL)
+        except Exception as e:
+            print(f"⚠️ 無法寫入估價結果快取: {e}")
+
+    # 模型訓練時的欄位順序 (DataFrame 欄位名稱必須與訓練時完全一致)
+    FEATURE_COLUMNS = [
+        '縣市', '行政區', '建物類型', '所在層數', '地上總層數',
+        '地坪', '建坪', '屋齡（年）', '房間數', '經度', '緯度', '樓層比',
+    ]
+
+    # 批次估價上傳檔案的欄位對照 (中文表頭 -> input_data key)
+    SHEET_COLUMN_MAP = {
+        '縣市': 'city',
+        '行政區': 'town',
+        '地址': 'street',
+        '建物類型': 'house_type',
+        '屋齡': 'house_age',
+        '地上總層數': 'total_floors',
+        '所在層數': 'floor_number',
+        '建坪': 'floor_area',
+        '地坪': 'land_area',
+        '房間數': 'room_count',
+    }
+
+    @staticmethod
+    def _feature_row(input_data, longitude, latitude):
+        """
+        將單筆輸入整理成模型需要的特徵 (一列)
+        """
+        # 計算樓層比
+        try:
+            current_floor = float(input_data.get('floor_number', 0))
+            total_floors = float(input_data.get('total_floors', 1))
+            floor_ratio = current_floor / total_floors if total_floors > 0 else 0
+
+            # 限制上限為 1.0 (與訓練邏輯一致)
+            if floor_ratio > 1.0:
+                floor_ratio = 1.0
+        except:
+            floor_ratio = 0.0
+
+        return {
+            '縣市': str(input_data.get('city')),
+            '行政區': str(input_data.get('town')),
+            '建物類型': str(input_data.get('house_type')), # 注意前端欄位名稱對應
+            '所在層數': str(input_data.get('floor_number')), # 訓練時轉為 str，這裡也要轉
+            '地上總層數': str(input_data.get('total_floors')), # 訓練時轉為 str
+            '地坪': float(input_data.get('land_area', 0)),
+            '建坪': float(input_data.get('floor_area', 0)),
+            '屋齡（年）': float(input_data.get('house_age', 0)),
+            '房間數': float(input_data.get('room_count', 0)),
+            '經度': float(longitude),
+            '緯度': float(latitude),
+            '樓層比': floor_ratio,
+        }
+
+    @classmethod
+    def _predict_prices(cls, model, rows):
+        """
+        一次對多列特徵做預測，回傳每列的總價 (萬)
+
+        注意：訓練目標變數做了 log1p 轉換，模型預測出來的是 log 價格，必須轉回來
+        """
+        df = pd.DataFrame(rows, columns=cls.FEATURE_COLUMNS)
+        log_prediction = model.predict(df)
+        return [round(float(price), 2) for price in np.expm1(log_prediction)]
+
+    @classmethod
+    def _predict_price(cls, model, encoder, row):
+        """
+        單筆預測：有快速編碼器時跳過 DataFrame，直接以 NumPy 陣列呼叫 booster
+        """
+        if encoder is None:
+            return cls._predict_prices(model, [row])[0]
+        return round(float(np.expm1(encoder.predict(row))[0]), 2)
+
+    @staticmethod
+    def _criteria(input_data):
+        """把表單輸入的資料整理成 find_nearby_houses 使用的篩選條件"""
+        return {
+            'city': str(input_data.get('city', '')),
+            'house_type': str(input_data.get('house_type')),
+            'house_age': float(input_data.get('house_age', 0)),
+            'total_floors': float(input_data.get('total_floors', 0)),
+            'floor_number': float(input_data.get('floor_number', 0)),
+            'floor_area': float(input_data.get('floor_area', 0)),
+            'land_area': float(input_data.get('land_area', 0)),
+            'room_count': float(input_data.get('room_count', 0)),
+        }
+
+    @classmethod
+    def _build_result(cls, input_data, price, model_version, longitude, latitude, is_exact, include_nearby=True):
+        """組出與 predict() 相同格式的估價結果"""
+        city = str(input_data.get('city', ''))
+        town = str(input_data.get('town', ''))
+        street = str(input_data.get('street', ''))
+
+        # 搜尋周邊實價登錄行情
+        nearby_houses = []
+        if include_nearby:
+            nearby_houses = cls.find_nearby_houses(
+                latitude, longitude, cls._criteria(input_data), radius_km=settings.COMPARABLE_SEARCH_RADIUS_KM
+            )
+
+        result = {
+            'success': True, # 標記成功
+            'price': price,
+            'model_version': model_version, # 產生這筆估價的模型版本
+            'nearby_houses': nearby_houses,
+            'target_coords': {'lat': latitude, 'lng': longitude}
+        }
+
+        # 如果是模糊定位 (is_exact = False)，加入警告訊息
+        if not is_exact:
+            clean_road = re.sub(r'\d+號.*', '', street)
+            result['warning'] = f"注意：系統無法精確定位至門牌，目前估價結果是基於「{city}{town}{clean_road}」的平均區段行情，僅供參考。"
+
+        return result
+
+    @staticmethod
+    def _locate_error(input_data):
+        city = str(input_data.get('city', ''))
+        town = str(input_data.get('town', ''))
+        street = str(input_data.get('street', ''))
+        return {
+            'error': f'無法定位該地址：「{city}{town}{street}」。請確認地址是否正確，或嘗試輸入更完整的路名。'
+        }
+
     @classmethod
     def predict(cls, input_data: dict):
         """
         接收前端傳來的 cleaned_data，進行特徵工程並預測
         """
-        model = cls._get_model()
+        model, model_version, encoder = cls._get_model_bundle()
         if model is None:
             return {'error': '系統模型載入失敗，請聯繫管理員'}
 
         try:
-            # --- 1. 準備基礎資料 ---
-            # 假設 input_data 包含: city, town, street, floor_number, total_floors, 
-            # building_type, land_area, floor_area, age, room_count
-            
-            # 先把變數提取出來
+            # --- 1. 地址定位 ---
             city = str(input_data.get('city', ''))
             town = str(input_data.get('town', ''))
             street = str(input_data.get('street', ''))
 
-            # 【修正】傳入三個參數 (city, town, street)
             longitude, latitude, is_exact = cls._get_lat_lon(city, town, street)
 
-            # 【修改處 2】檢查經緯度是否為 None
+            # 檢查經緯度是否為 None
             if longitude is None or latitude is None:
                 # 回傳地址錯誤，讓 View 層處理
-                return {
-                    'error': f'無法定位該地址：「{city}{town}{street}」。請確認地址是否正確，或嘗試輸入更完整的路名。'
-                }
-
-            # --- 2. 建立 DataFrame (欄位名稱必須與訓練時完全一致) ---
-            data_dict = {
-                '縣市': [str(input_data.get('city'))],
-                '行政區': [str(input_data.get('town'))],
-                '建物類型': [str(input_data.get('house_type'))], # 注意前端欄位名稱對應
-                '所在層數': [str(input_data.get('floor_number'))], # 訓練時轉為 str，這裡也要轉
-                '地上總層數': [str(input_data.get('total_floors'))], # 訓練時轉為 str
-                '地坪': [float(input_data.get('land_area', 0))],
-                '建坪': [float(input_data.get('floor_area', 0))], # 假設前端叫 building_area
-                '屋齡（年）': [float(input_data.get('house_age', 0))],
-                '房間數': [float(input_data.get('room_count', 0))], # 您提到的新增欄位
-                '經度': [float(longitude)],
-                '緯度': [float(latitude)],
-                # '樓層比' 會在下面計算，這裡先不用填
-            }
-            
-            df = pd.DataFrame(data_dict)
-
-            # --- 3. 重現特徵工程 (Feature Engineering) ---
-            # 這是您問題1的核心：必須在 Service 層重做這些計算
-            
-            # 計算樓層比
-            try:
-                current_floor = float(input_data.get('floor_number', 0))
-                total_floors = float(input_data.get('total_floors', 1))
-                floor_ratio = current_floor / total_floors if total_floors > 0 else 0
-                
-                # 限制上限為 1.0 (與訓練邏輯一致)
-                if floor_ratio > 1.0:
-                    floor_ratio = 1.0
-            except:
-                floor_ratio = 0.0
-            
-            df['樓層比'] = floor_ratio
-
-            # --- 4. 預測 ---
-            # 注意：您的訓練目標變數做了 log1p 轉換 (y_log_train = np.log1p(...))
-            # 所以模型預測出來的是 log 價格，必須轉回來
-            log_prediction = model.predict(df)
-            real_price = np.expm1(log_prediction)[0]
-            predicted_price = round(float(real_price), 2)
-            
-            # 【新增】5. 搜尋周邊實價登錄行情
-            # 【修改】準備篩選條件字典 (criteria)
-            # 這裡把表單輸入的資料整理成好讀的格式傳給 find_nearby_houses
-            criteria = {
-                'city': city,
-                'house_type': str(input_data.get('house_type')),
-                'house_age': float(input_data.get('house_age', 0)),
-                'total_floors': float(input_data.get('total_floors', 0)),
-                'floor_number': float(input_data.get('floor_number', 0)),
-                'floor_area': float(input_data.get('floor_area', 0)),
-                'land_area': float(input_data.get('land_area', 0)),
-                'room_count': float(input_data.get('room_count', 0)),
-            }
-            # 【修改】呼叫新的搜尋方法
-            nearby_houses = cls.find_nearby_houses(latitude, longitude, criteria)
-
-            # 【修改】回傳值多加一個 'nearby_houses' 與 'target_coords'
-            result = {
-                'success': True, # 標記成功
-                'price': predicted_price,
-                'nearby_houses': nearby_houses,
-                'target_coords': {'lat': latitude, 'lng': longitude}
-            }
+                return cls._locate_error(input_data)
 
-            # [新增] 如果是模糊定位 (is_exact = False)，加入警告訊息
-            if not is_exact:
-                clean_road = re.sub(r'\d+號.*', '', street)
-                result['warning'] = f"注意：系統無法精確定位至門牌，目前估價結果是基於「{city}{town}{clean_road}」的平均區段行情，僅供參考。"
+            # --- 2. 特徵工程 + 預測 ---
+            predicted_price = cls._predict_price(model, encoder, cls._feature_row(input_data, longitude, latitude))
 
-            return result
+            # --- 3. 搜尋周邊實價登錄行情 ---
+            return cls._build_result(input_data, predicted_price, model_version, longitude, latitude, is_exact)
 
         except Exception as e:
             import traceback
             print(f"預測錯誤: {e}")
             print(traceback.format_exc())
-            return {'error': '系統發生預期外的錯誤，請稍後再試'}
\ No newline at end of file
+            return {'error': '系統發生預期外的錯誤，請稍後再試'}
+
+    @classmethod
+    def predict_many(cls, inputs, include_nearby=True):
+        """
+        批次估價：一次估算多筆房屋，結果順序與 inputs 相同
+
+        - 相同地址 (正規化後) 只定位一次
+        - 所有定位成功的房屋組成一個 N 列的 DataFrame，模型只呼叫一次
+        - 單筆失敗 (地址無法定位) 只影響該筆，回傳 {'error': ...}
+
+        Args:
+            inputs (list[dict]): 每筆格式與 predict() 的 input_data 相同
+            include_nearby (bool): 是否一併搜尋周邊實價 (大量估價時可關閉)
+        """
+        model, model_version, _ = cls._get_model_bundle()
+        if model is None:
+            return [{'error': '系統模型載入失敗，請聯繫管理員'} for _ in inputs]
+
+        results = [None] * len(inputs)
+        try:
+            # --- 1. 地址定位 (去除重複) ---
+            locations = {}
+            rows, located = [], []
+            for i, input_data in enumerate(inputs):
+                city = str(input_data.get('city', ''))
+                town = str(input_data.get('town', ''))
+                street = str(input_data.get('street', ''))
+
+                address_key = normalize_address(city, town, street)
+                if address_key not in locations:
+                    locations[address_key] = cls._get_lat_lon(city, town, street)
+                longitude, latitude, is_exact = locations[address_key]
+
+                if longitude is None or latitude is None:
+                    results[i] = cls._locate_error(input_data)
+                    continue
+
+                try:
+                    rows.append(cls._feature_row(input_data, longitude, latitude))
+                except (TypeError, ValueError):
+                    results[i] = {'error': '房屋資料格式錯誤，請確認數值欄位。'}
+                    continue
+                located.append((i, longitude, latitude, is_exact))
+
+            print(f"📦 [predict_many] 共 {len(inputs)} 筆，定位 {len(locations)} 個不重複地址，{len(rows)} 筆進行預測")
+
+            # --- 2. 一次預測所有房屋 ---
+            prices = cls._predict_prices(model, rows) if rows else []
+
+            # --- 3. 組合結果 ---
+            for (i, longitude, latitude, is_exact), price in zip(located, prices):
+                results[i] = cls._build_result(
+                    inputs[i], price, model_version, longitude, latitude, is_exact, include_nearby=include_nearby
+                )
+            return results
+
+        except Exception as e:
+            import traceback
+            print(f"批次預測錯誤: {e}")
+            print(traceback.format_exc())
+            return [
+                result if result is not None else {'error': '系統發生預期外的錯誤，請稍後再試'}
+                for result in results
+            ]
+
+    @classmethod
+    def inputs_from_sheet(cls, file_obj, filename=''):
+        """
+        讀取批次估價的 Excel / CSV 檔，轉成 predict_many() 的 inputs
+
+        表頭可使用中文 (見 SHEET_COLUMN_MAP) 或 input_data 的英文 key
+        """
+        if filename.lower().endswith('.csv'):
+            df = pd.read_csv(file_obj)
+        else:
+            df = pd.read_excel(file_obj)
+
+        df = df.rename(columns=cls.SHEET_COLUMN_MAP)
+        missing = set(cls.SHEET_COLUMN_MAP.values()) - set(df.columns)
+        if missing:
+            raise ValueError(f"缺少欄位: {', '.join(sorted(missing))}")
+
+        df = df[list(cls.SHEET_COLUMN_MAP.values())]
+        df = df.astype(object).where(pd.notnull(df), None)
+        return df.to_dict('records')
@@ -0,0 +1,250 @@
+"""
+周邊實價搜尋的空間索引
+
+每個縣市建立一棵 BallTree (haversine 距離，座標為弧度)，
+估價時直接回答「最近的 k 筆符合條件房屋」，不必把整個縣市的資料撈出來逐筆計算距離。
+
+索引存在各個 process 的記憶體中，House 資料異動時由 signal 更新 Redis 上的版本號，
+各 process 在下次查詢時發現版本不同就會重建該縣市的索引。
+"""
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from sklearn.neighbors import BallTree
+
+from apps.house.models import House
+
+EARTH_RADIUS_KM = 6371.0088
+
+# 索引中保留的篩選欄位 (數值欄位以 float 陣列儲存，NULL 以 NaN 表示)
+NUMERIC_FIELDS = ('room_count', 'house_age', 'total_floors', 'floor_number', 'floor_area', 'land_area')
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    一次計算目標點到所有候選點的球面距離 (km)
+
+    Args:
+        lat, lon (float): 目標點經緯度 (度)
+        lats, lons (array-like): 候選點經緯度陣列 (度)
+    """
+    lat1, lon1 = np.radians(float(lat)), np.radians(float(lon))
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_positions(distances, limit):
+    """
+    回傳距離最小的 limit 個位置 (由近到遠)
+
+    先用 argpartition 在 O(n) 內挑出前 limit 個，只對這幾個排序
+    """
+    distances = np.asarray(distances)
+    if limit <= 0 or distances.size == 0:
+        return np.array([], dtype=int)
+    if distances.size > limit:
+        positions = np.argpartition(distances, limit - 1)[:limit]
+    else:
+        positions = np.arange(distances.size)
+    return positions[np.argsort(distances[positions], kind='stable')]
+
+
+def lookup_mask(columns, lookup, value):
+    """
+    單一篩選條件的向量化版本，回傳布林陣列
+
+    條件與 Django ORM 的 filter kwargs 格式相同，
+    支援 `欄位` (等於) 與 `欄位__range` (介於) 兩種寫法；NULL (NaN) 一律不符合
+    """
+    field, _, op = lookup.partition('__')
+    column = columns[field]
+    if op == 'range':
+        low, high = value
+        return (column >= low) & (column <= high)
+    if column.dtype == object:
+        return column == value
+    if value is None:
+        return np.isnan(column)
+    return column == float(value)
+
+
+def strictness_tier(columns, filters):
+    """每一列符合 filters 中的幾個條件 (分數越高越接近目標房屋)"""
+    size = len(next(iter(columns.values())))
+    tiers = np.zeros(size, dtype=int)
+    for lookup, value in filters.items():
+        tiers += lookup_mask(columns, lookup, value)
+    return tiers
+
+
+def rank_by_tier(tiers, distances, limit):
+    """依「符合條件數 (多到少)、距離 (近到遠)」排序，回傳前 limit 個位置"""
+    return np.lexsort((distances, -np.asarray(tiers)))[:limit]
+
+
+def columns_from_rows(rows, fields):
+    """
+    將 ORM .values() 的結果轉成欄位陣列
+    數值欄位轉為 float (NULL 為 NaN)，house_type 保留為字串
+    """
+    columns = {}
+    for field in fields:
+        values = [row[field] for row in rows]
+        if field == 'house_type':
+            columns[field] = np.array(values, dtype=object)
+        else:
+            columns[field] = np.array([np.nan if v is None else float(v) for v in values], dtype=float)
+    return columns
+
+
+def _normalize_city(city):
+    return (city or '').replace('台', '臺')
+
+
+def city_variants(city):
+    """縣市名稱的所有寫法 (台 / 臺)，資料庫查詢用 city__in，空間索引與資料庫兩種查詢的範圍才會一致"""
+    city = city or ''
+    return {city, _normalize_city(city), city.replace('臺', '台')}
+
+
+def _version_key(city):
+    return f'spatial_index_version:{_normalize_city(city)}'
+
+
+def get_city_version(city):
+    """
+    取得縣市資料的版本號 (存在 Redis，所有 process 共用)
+    Redis 無法連線時回傳 None
+    """
+    try:
+        version = cache.get(_version_key(city))
+        if version is None:
+            # add 只在 key 不存在時寫入，避免多個 process 互相覆蓋
+            cache.add(_version_key(city), uuid.uuid4().hex, timeout=None)
+            version = cache.get(_version_key(city))
+        return version
+    except Exception as e:
+        print(f"⚠️ 無法讀取空間索引版本: {e}")
+        return None
+
+
+def invalidate_city(city):
+    """House 資料異動時呼叫，讓該縣市的索引在下次查詢時重建"""
+    if not city:
+        return
+    try:
+        cache.set(_version_key(city), uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        print(f"⚠️ 無法更新空間索引版本: {e}")
+
+
+class CitySpatialIndex:
+    """單一縣市的 BallTree 索引"""
+
+    def __init__(self, city, version):
+        self.city = city
+        self.version = version
+        self.built_at = time.monotonic()
+
+        rows = list(
+            House.objects.filter(
+                city__in=city_variants(city)
+            ).exclude(
+                latitude__isnull=True
+            ).exclude(
+                longitude__isnull=True
+            ).values_list('id', 'latitude', 'longitude', 'house_type', *NUMERIC_FIELDS)
+        )
+        self.size = len(rows)
+        if not rows:
+            self.tree = None
+            return
+
+        columns = list(zip(*rows))
+        self.ids = np.array(columns[0], dtype=np.int64)
+        coords = np.radians(np.column_stack([
+            np.array(columns[1], dtype=float),
+            np.array(columns[2], dtype=float),
+        ]))
+        self.tree = BallTree(coords, metric='haversine')
+
+        self.fields = {'house_type': np.array(columns[3], dtype=object)}
+        for offset, field in enumerate(NUMERIC_FIELDS, start=4):
+            self.fields[field] = np.array(
+                [np.nan if v is None else float(v) for v in columns[offset]], dtype=float
+            )
+
+    def is_stale(self, version):
+        if version is None:
+            # Redis 無法使用時，改以存活時間判斷是否重建
+            return time.monotonic() - self.built_at > settings.SPATIAL_INDEX_MAX_AGE
+        return version != self.version
+
+    def match(self, positions, filters):
+        """回傳 positions 這些列是否符合 filters 全部條件的布林陣列"""
+        columns = self.columns(positions)
+        mask = np.ones(len(positions), dtype=bool)
+        for lookup, value in filters.items():
+            mask &= lookup_mask(columns, lookup, value)
+        return mask
+
+    def columns(self, positions):
+        return {field: column[positions] for field, column in self.fields.items()}
+
+    def nearest(self, lat, lon, filters, strict_filters, limit):
+        """
+        找出符合 filters 的房屋，依「符合 strict_filters 的條件數、距離」排序
+
+        先查詢最近的 k 筆，完全符合嚴格條件的不足 limit 筆時再把 k 放大，
+        通常只需要看過附近一小部分的資料就能回答。
+
+        Returns:
+            list[tuple]: [(house_id, 距離 km), ...]
+        """
+        if self.tree is None or limit <= 0:
+            return []
+
+        point = np.radians([[float(lat), float(lon)]])
+        k = min(self.size, max(limit * 8, 64))
+        while True:
+            distances, positions = self.tree.query(point, k=k)
+            distances, positions = distances[0], positions[0]
+
+            mask = self.match(positions, filters)
+            distances, positions = distances[mask], positions[mask]
+            tiers = strictness_tier(self.columns(positions), strict_filters)
+
+            # 已看過的範圍內有足夠的「完全符合」房屋，更遠的房屋不可能排在它們前面
+            if (tiers == len(strict_filters)).sum() >= limit or k >= self.size:
+                order = rank_by_tier(tiers, distances, limit)
+                ids = self.ids[positions[order]]
+                dists = distances[order] * EARTH_RADIUS_KM
+                return list(zip(ids.tolist(), dists.tolist()))
+            k = min(self.size, k * 4)
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_city_index(city):
+    """取得 (必要時重建) 縣市的空間索引"""
+    key = _normalize_city(city)
+    version = get_city_version(city)
+    index = _indexes.get(key)
+    if index is None or index.is_stale(version):
+        with _lock:
+            index = _indexes.get(key)
+            if index is None or index.is_stale(version):
+                started = time.perf_counter()
+                index = CitySpatialIndex(city, version)
+                _indexes[key] = index
+                print(f"🗺️ [空間索引] {key} 已重建 ({index.size} 筆，{time.perf_counter() - started:.2f} 秒)")
+    return index
@@ -101,6 +101,36 @@ document.addEventListener('DOMContentLoaded', function() {
     if (form) {
         form.setAttribute('novalidate', true);
 
+        // ==========================================
+        // [新] WebSocket：估價任務完成時由後端推播結果
+        // 連線失敗 (或推播遲遲沒到) 時改用 SSE，最後才退回輪詢 task-status
+        // ==========================================
+        const PUSH_FALLBACK_DELAY = 15000; // 推播多久沒到就改為輪詢 (毫秒)
+        let activeTask = null;             // 目前等待中的任務 { id, done, fallbackTimer, pollInterval, eventSource }
+        const earlyMessages = {};          // 在拿到 task_id 之前就先到達的推播
+
+        const wsProtocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+        let valuationSocket = null;
+        try {
+            valuationSocket = new WebSocket(wsProtocol + window.location.host + '/ws/notifications/');
+            valuationSocket.onmessage = function(e) {
+                const data = JSON.parse(e.data);
+                if (data.kind !== 'valuation' || !data.task_id) return;
+
+                if (activeTask && activeTask.id === data.task_id) {
+                    handleTaskMessage(data);
+                } else {
+                    earlyMessages[data.task_id] = data;
+                }
+            };
+        } catch (err) {
+            console.warn("WebSocket 無法連線，改用輪詢:", err);
+        }
+
+        function socketIsOpen() {
+            return valuationSocket && valuationSocket.readyState === WebSocket.OPEN;
+        }
+
         form.addEventListener('submit', function(e) {
             e.preventDefault(); // 1. 阻止預設提交
             clearErrors();
@@ -165,9 +195,13 @@ document.addEventListener('DOMContentLoaded', function() {
                     // 需要登入
                     window.location.href = data.url;
                 }
+                else if (data.status === 'completed' && data.redirect_url) {
+                    // 6. 相同條件已估價過，後端直接回傳結果 (不需要輪詢)
+                    showCompleted(data.redirect_url);
+                }
                 else if (data.task_id) {
-                    // 6. 成功取得 task_id，開始輪詢
-                    pollTaskStatus(data.task_id);
+                    // 6. 成功取得 task_id，等待推播 (必要時輪詢)
+                    waitForTask(data.task_id);
                 }
             })
             .catch(error => {
@@ -178,49 +212,103 @@ document.addEventListener('DOMContentLoaded', function() {
             });
         });
 
-        // 輪詢函式
-        function pollTaskStatus(taskId) {
-            const pollInterval = setInterval(() => {
-                fetch(`/task-status/${taskId}/`) // 注意 URL 前綴
+        // 等待任務結果：優先使用 WebSocket 推播
+        function waitForTask(taskId) {
+            activeTask = { id: taskId, done: false, fallbackTimer: null, pollInterval: null };
+
+            // 推播比 task_id 先到 (任務非常快完成)
+            if (earlyMessages[taskId]) {
+                handleTaskMessage(earlyMessages[taskId]);
+                delete earlyMessages[taskId];
+                return;
+            }
+
+            if (socketIsOpen()) {
+                const task = activeTask;
+                task.fallbackTimer = setTimeout(() => watchTaskEvents(task), PUSH_FALLBACK_DELAY);
+            } else {
+                watchTaskEvents(activeTask);
+            }
+        }
+
+        // 退路 1：Server-Sent Events (WebSocket 被 proxy 擋掉時仍可使用)
+        function watchTaskEvents(task) {
+            if (task.done) return;
+            if (!window.EventSource) {
+                pollTaskStatus(task);
+                return;
+            }
+
+            const source = new EventSource(`/task-events/${task.id}/`);
+            task.eventSource = source;
+            source.onmessage = function(e) {
+                const event = JSON.parse(e.data);
+                console.log("Task Event:", event.state);
+
+                if (event.state === 'SUCCESS') {
+                    const result = event.result || {};
+                    if (result.status === 'success') {
+                        finishTask(task);
+                        showCompleted(`/task-result/${task.id}/`);
+                    } else {
+                        finishTask(task);
+                        showFailure(result.data && result.data.error);
+                    }
+                } else if (event.state === 'FAILURE') {
+                    finishTask(task);
+                    showFailure(event.error);
+                } else if (event.state === 'UNAVAILABLE') {
+                    // 伺服器無法提供事件串流，改為輪詢
+                    source.close();
+                    pollTaskStatus(task);
+                }
+            };
+            source.onerror = function() {
+                // 連線失敗：關閉 SSE，改為輪詢
+                source.close();
+                pollTaskStatus(task);
+            };
+        }
+
+        // 收到推播的估價結果
+        function handleTaskMessage(data) {
+            if (!activeTask || activeTask.done) return;
+            if (data.status === 'success' && data.redirect_url) {
+                finishTask(activeTask);
+                showCompleted(data.redirect_url);
+            } else if (data.status === 'error') {
+                finishTask(activeTask);
+                showFailure(data.message);
+            }
+        }
+
+        function finishTask(task) {
+            if (!task) return;
+            task.done = true;
+            clearTimeout(task.fallbackTimer);
+            clearInterval(task.pollInterval);
+            if (task.eventSource) task.eventSource.close();
+        }
+
+        // 退路 2：輪詢函式 (WebSocket 與 SSE 都無法使用時)
+        function pollTaskStatus(task) {
+            if (task.done || task.pollInterval) return;
+            task.pollInterval = setInterval(() => {
+                fetch(`/task-status/${task.id}/`) // 注意 URL 前綴
                     .then(r => r.json())
                     .then(data => {
+                        if (task.done) return;
                         console.log("Task Status:", data.state);
                         
                         if (data.status === 'completed' && data.redirect_url) {
                             // === 成功 ===
-                            clearInterval(pollInterval);
-                            
-                            // [新] 任務完成！不自動跳轉，而是變更卡片狀態
-                            window.resultRedirectUrl = data.redirect_url;
-                            
-                            // 切換卡片內容：隱藏轉圈圈，顯示綠色勾勾
-                            if (statusProcessing && statusCompleted) {
-                                statusProcessing.classList.add('hidden');
-                                statusCompleted.classList.remove('hidden');
-                                // 加個彈跳特效吸引注意
-                                statusCompleted.classList.add('animate-bounce-in'); 
-                            }
-                            
-                            // 恢復表單按鈕 (讓使用者可以再填一次)
-                            resetBtn();
-                            
+                            finishTask(task);
+                            showCompleted(data.redirect_url);
                         } 
                         else if (data.state === 'FAILURE' || (data.data && data.data.error)) {
                             // === 失敗 (例如定位不到) ===
-                            clearInterval(pollInterval);
-                            hideFloatingCard();
-                            resetBtn();
-                            
-                            // 顯示原本的紅色錯誤彈窗
-                            if (errorModal) {
-                                const msgContainer = errorModal.querySelector('.text-slate-600');
-                                const errorMsg = data.error || "無法定位該地址，請檢查輸入是否正確。";
-                                if (msgContainer) msgContainer.innerHTML = `<p class="font-medium text-red-700">${errorMsg}</p>`;
-                                
-                                errorModal.classList.remove('hidden');
-                            } else {
-                                alert(data.error);
-                            }
+                            finishTask(task);
+                            showFailure(data.error);
                         }
                     })
                     .catch(err => {
@@ -229,6 +317,38 @@ document.addEventListener('DOMContentLoaded', function() {
             }, 1500); // 每 1.5 秒問一次
         }
 
+        // 估價失敗：顯示原本的紅色錯誤彈窗
+        function showFailure(message) {
+            hideFloatingCard();
+            resetBtn();
+            
+            if (errorModal) {
+                const msgContainer = errorModal.querySelector('.text-slate-600');
+                const errorMsg = message || "無法定位該地址，請檢查輸入是否正確。";
+                if (msgContainer) msgContainer.innerHTML = `<p class="font-medium text-red-700">${errorMsg}</p>`;
+                
+                errorModal.classList.remove('hidden');
+            } else {
+                alert(message);
+            }
+        }
+
+        // 估價完成：不自動跳轉，而是變更卡片狀態
+        function showCompleted(redirectUrl) {
+            window.resultRedirectUrl = redirectUrl;
+            
+            // 切換卡片內容：隱藏轉圈圈，顯示綠色勾勾
+            if (statusProcessing && statusCompleted) {
+                statusProcessing.classList.add('hidden');
+                statusCompleted.classList.remove('hidden');
+                // 加個彈跳特效吸引注意
+                statusCompleted.classList.add('animate-bounce-in'); 
+            }
+            
+            // 恢復表單按鈕 (讓使用者可以再填一次)
+            resetBtn();
+        }
+
         // 隱藏懸浮卡片的輔助函式
         function hideFloatingCard() {
             if (floatingCard) {
@@ -0,0 +1,135 @@
+"""
+Celery 任務狀態事件 (Redis pub/sub)
+
+任務狀態改變時 (開始、進度、完成 / 失敗) 發布到 task_events:<task_id> 頻道，
+SSE 端點 (views.task_events_stream) 訂閱後即時轉給瀏覽器，
+一條長連線取代前端每 1.5 秒一次的 task-status 輪詢。
+
+最後一個事件另外存成一個 key，晚一步才連線的客戶端也能先拿到目前的狀態。
+"""
+import asyncio
+import json
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+CHANNEL_PREFIX = 'task_events:'
+LAST_EVENT_PREFIX = 'task_events:last:'
+
+# 收到這些狀態後 SSE 串流就結束
+FINAL_STATES = {'SUCCESS', 'FAILURE', 'REVOKED'}
+
+_client = None
+
+
+def channel_name(task_id):
+    return f'{CHANNEL_PREFIX}{task_id}'
+
+
+def last_event_key(task_id):
+    return f'{LAST_EVENT_PREFIX}{task_id}'
+
+
+def _get_client():
+    """發布端使用的同步 Redis 連線 (每個 process 一份，fork 後才會建立)"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.REDIS_URI, socket_connect_timeout=1, socket_timeout=1)
+    return _client
+
+
+def publish_task_event(task_id, state, **data):
+    """
+    發布任務狀態事件
+
+    Args:
+        task_id (str): Celery 任務 ID
+        state (str): STARTED / PROGRESS / SUCCESS / FAILURE ...
+        **data: 其他要一起送出的資料 (例如進度 current / total、任務結果)
+    """
+    if not task_id:
+        return
+    payload = json.dumps({'task_id': task_id, 'state': state, **data}, ensure_ascii=False, default=str)
+    try:
+        pipe = _get_client().pipeline()
+        pipe.set(last_event_key(task_id), payload, ex=settings.TASK_EVENTS_TTL)
+        pipe.publish(channel_name(task_id), payload)
+        pipe.execute()
+    except Exception as e:
+        # 發布失敗不影響任務本身，前端仍可以輪詢 task-status
+        print(f"⚠️ 任務事件發布失敗: {e}")
+
+
+def task_finished(task_id):
+    """最後一個事件是否已經是最終狀態 (讀取失敗時視為尚未結束)"""
+    try:
+        last = _get_client().get(last_event_key(task_id))
+    except Exception:
+        return False
+    return last is not None and _is_final(last)
+
+
+def format_sse(payload):
+    """包成 SSE 格式 (一個事件以空行結尾)"""
+    return f'data: {payload}\n\n'
+
+
+def _is_final(payload):
+    try:
+        return json.loads(payload).get('state') in FINAL_STATES
+    except (TypeError, ValueError):
+        return False
+
+
+async def stream_task_events(task_id):
+    """
+    非同步產生某個任務的 SSE 事件，直到任務結束或逾時
+
+    先訂閱頻道再讀取「最後一個事件」，兩者之間發生的事件不會漏掉；
+    沒有新事件時定期送出註解行當作 keep-alive，避免被 proxy 斷線。
+    """
+    client = aioredis.from_url(settings.REDIS_URI)
+    pubsub = client.pubsub()
+    try:
+        # 瀏覽器斷線後幾秒自動重連
+        yield 'retry: 3000\n\n'
+
+        try:
+            await pubsub.subscribe(channel_name(task_id))
+            last = await client.get(last_event_key(task_id))
+        except Exception as e:
+            print(f"⚠️ 無法訂閱任務事件: {e}")
+            yield format_sse(json.dumps({'task_id': task_id, 'state': 'UNAVAILABLE'}))
+            return
+
+        if last is None:
+            yield format_sse(json.dumps({'task_id': task_id, 'state': 'PENDING'}))
+        else:
+            last = last.decode('utf-8')
+            yield format_sse(last)
+            if _is_final(last):
+                return
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.TASK_EVENTS_SSE_TIMEOUT
+        while loop.time() < deadline:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=settings.TASK_EVENTS_SSE_HEARTBEAT
+            )
+            if message is None:
+                yield ': keep-alive\n\n'
+                continue
+
+            payload = message['data']
+            if isinstance(payload, bytes):
+                payload = payload.decode('utf-8')
+            yield format_sse(payload)
+            if _is_final(payload):
+                return
+    finally:
+        try:
+            await pubsub.aclose()
+            await client.aclose()
+        except Exception:
+            pass
@@ -1,27 +1,126 @@
+from asgiref.sync import async_to_sync
 from celery import shared_task
+from channels.layers import get_channel_layer
+from django.urls import reverse
+
 from .services import HousePriceService
+from .uploads import StagedUploadError, cleanup_staged_uploads, discard_staged, open_staged
 
-@shared_task
-def predict_house_price(input_data):
+
+def notify_valuation_done(user_id, task_id, task_result):
+    """
+    估價完成 (或失敗) 時推播給使用者的 user_<id> 群組
+    前端收到後直接顯示結果，不必再輪詢 task-status
+    """
+    if not user_id:
+        return
+
+    if task_result.get('status') == 'success':
+        payload = {
+            'status': 'success',
+            'message': '估價完成',
+            'redirect_url': reverse('core:task_result', args=[task_id]),
+        }
+    else:
+        payload = {
+            'status': 'error',
+            'message': task_result.get('data', {}).get('error', '未知錯誤'),
+        }
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f"user_{user_id}",
+            {
+                'type': 'task_message',
+                'kind': 'valuation', # 讓後台的通知 Toast 忽略估價訊息
+                'task_id': task_id,
+                **payload,
+            }
+        )
+    except Exception as e:
+        # 推播失敗時前端仍會以輪詢取得結果
+        print(f"⚠️ 估價結果推播失敗: {e}")
+
+
+@shared_task(bind=True)
+def predict_house_price(self, input_data, user_id=None):
     """
     非同步執行的估價任務
     """
     try:
+        # 估價前先記下縣市資料版本，估價期間有房屋異動時這筆快取就會失效
+        city_version = HousePriceService.city_data_version(input_data)
+
         # 呼叫原本的 Service 邏輯
         result = HousePriceService.predict(input_data)
         
         # 為了讓結果能存入 Session (JSON 序列化)，需要確保回傳的都是基本型別
         # Service 目前回傳的已經是 dict，但如果有 Decimal 需要注意
         # 這裡我們回傳一個標準結構
-        return {
+        task_result = {
             'status': 'success' if 'error' not in result else 'error',
             'data': result,
             'input_data': input_data
         }
+
+        # 只快取成功的結果 (地址定位失敗可能是暫時性的)
+        if task_result['status'] == 'success':
+            HousePriceService.set_cached_result(input_data, task_result, city_version)
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return {
+        task_result = {
             'status': 'error',
             'data': {'error': '系統發生未預期的錯誤，請稍後再試。'}
-        }
\ No newline at end of file
+        }
+
+    notify_valuation_done(user_id, self.request.id, task_result)
+    return task_result
+
+
+@shared_task
+def predict_house_prices_batch(inputs=None, upload=None, include_nearby=True):
+    """
+    批次估價任務：一次估算多筆房屋 (例如經紀人的整批物件重新估價)
+
+    Args:
+        inputs (list[dict]): 每筆格式與 predict_house_price 的 input_data 相同
+        upload (dict): 或是上傳的 Excel / CSV 檔的暫存 handle (見 apps/core/uploads.py)
+        include_nearby (bool): 是否一併搜尋周邊實價
+    """
+    try:
+        if upload is not None:
+            with open_staged(upload) as file_obj:
+                inputs = HousePriceService.inputs_from_sheet(file_obj, upload['filename'])
+            discard_staged(upload)
+        inputs = inputs or []
+
+        results = HousePriceService.predict_many(inputs, include_nearby=include_nearby)
+        success_count = sum(1 for result in results if 'error' not in result)
+
+        return {
+            'status': 'success',
+            'message': f'批次估價完成：成功 {success_count} 筆，失敗 {len(results) - success_count} 筆',
+            'data': results,
+            'inputs': inputs,
+        }
+    except StagedUploadError as e:
+        return {'status': 'error', 'error': str(e)}
+    except ValueError as e:
+        return {'status': 'error', 'error': f'檔案格式錯誤：{e}'}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {'status': 'error', 'error': '系統發生未預期的錯誤，請稍後再試。'}
+
+
+@shared_task
+def cleanup_staged_uploads_task():
+    """
+    定時任務：清除超過 STAGED_UPLOAD_MAX_AGE 仍未被處理的上傳暫存檔
+    (排程見 settings 的 CELERY_BEAT_SCHEDULE)
+    """
+    removed = cleanup_staged_uploads()
+    if removed:
+        print(f"🧹 已清除 {removed} 個過期的上傳暫存檔")
+    return removed
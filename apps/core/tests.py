@@ -1,3 +1,664 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from geopy.distance import geodesic
+
+from . import model_registry, task_events, uploads
+from .feature_encoder import FastFeatureEncoder
+from apps.house.models import House
+
+from .models import GeocodeCache, RoadCentroid
+from .services import HousePriceService, extract_road, normalize_address
+from .tasks import predict_house_price
+from .views import HomeView, import_callback_status
+from .spatial import (
+    columns_from_rows, get_city_index, get_city_version, haversine_km, invalidate_city, lookup_mask,
+    nearest_positions, rank_by_tier, strictness_tier,
+)
+
+
+class HaversineKernelTests(SimpleTestCase):
+    """向量化 haversine 與 geodesic 的誤差需在可接受範圍內"""
+
+    def test_matches_geodesic_within_tolerance(self):
+        rng = np.random.default_rng(42)
+        target = (25.0330, 121.5654)  # 臺北 101
+        # 臺灣本島範圍內的隨機點
+        lats = rng.uniform(21.9, 25.3, size=500)
+        lons = rng.uniform(120.0, 122.0, size=500)
+
+        distances = haversine_km(target[0], target[1], lats, lons)
+        expected = np.array([geodesic(target, (lat, lon)).km for lat, lon in zip(lats, lons)])
+
+        # 球體近似與橢球體的差距在 0.5% 以內
+        np.testing.assert_allclose(distances, expected, rtol=5e-3)
+
+    def test_short_distance_is_accurate(self):
+        # 周邊實價通常在幾公里內，誤差要小於 10 公尺
+        target = (24.1477, 120.6736)
+        point = (24.1520, 120.6800)
+        distance = haversine_km(target[0], target[1], [point[0]], [point[1]])[0]
+        self.assertAlmostEqual(distance, geodesic(target, point).km, delta=0.01)
+
+    def test_nearest_positions_sorted(self):
+        distances = np.array([5.0, 1.0, 3.0, 0.5, 4.0, 2.0])
+        self.assertEqual(nearest_positions(distances, 3).tolist(), [3, 1, 5])
+        # limit 大於資料筆數時回傳全部
+        self.assertEqual(nearest_positions(distances, 10).tolist(), [3, 1, 5, 2, 4, 0])
+        self.assertEqual(nearest_positions(np.array([]), 3).tolist(), [])
+
+
+class StrictnessTierTests(SimpleTestCase):
+    """周邊實價依「符合幾項嚴格條件、距離」排序"""
+
+    def test_rank_prefers_tier_then_distance(self):
+        columns = {
+            'house_type': np.array(['公寓', '公寓', '公寓', '公寓'], dtype=object),
+            'room_count': np.array([3.0, 2.0, 3.0, np.nan]),
+            'house_age': np.array([10.0, 12.0, 30.0, 11.0]),
+        }
+        filters = {'house_type': '公寓', 'room_count': 3, 'house_age__range': (5, 15)}
+
+        tiers = strictness_tier(columns, filters)
+        self.assertEqual(tiers.tolist(), [3, 2, 2, 2])
+
+        distances = np.array([4.0, 1.0, 3.0, 2.0])
+        # 完全符合的排第一，其餘同分者由近到遠
+        self.assertEqual(rank_by_tier(tiers, distances, 3).tolist(), [0, 1, 3])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PredictManyTests(TestCase):
+    """批次估價與逐筆估價的結果需一致，且相同地址只定位一次"""
+
+    def test_matches_single_predictions(self):
+        base = {
+            'city': '臺北市', 'town': '大安區', 'street': '復興南路一段1號',
+            'house_type': '公寓（無電梯）', 'house_age': 20.0, 'total_floors': 5.0,
+            'floor_number': 3.0, 'floor_area': 30.0, 'land_area': 10.0, 'room_count': 3,
+        }
+        inputs = [dict(base, floor_area=20 + i, street=f'復興南路一段{i % 3}號') for i in range(6)]
+        inputs.append(dict(base, street='查無此路'))
+
+        def fake_geocode(city, town, street):
+            return (None, None, False) if street == '查無此路' else (121.54, 25.03, True)
+
+        with mock.patch.object(HousePriceService, '_get_lat_lon', side_effect=fake_geocode) as geocode:
+            results = HousePriceService.predict_many(inputs)
+            self.assertEqual(geocode.call_count, 4)
+            expected = [HousePriceService.predict(input_data) for input_data in inputs]
+
+        self.assertEqual([r.get('price') for r in results], [r.get('price') for r in expected])
+        self.assertIn('error', results[-1])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    MODEL_REGISTRY_CHECK_INTERVAL=0,
+)
+class ModelRegistryTests(SimpleTestCase):
+    """切換使用中的版本後，下一次估價就會改用新模型"""
+
+    def setUp(self):
+        self.registry = tempfile.mkdtemp()
+        override = override_settings(VALUATION_MODEL_REGISTRY_DIR=self.registry)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.registry, ignore_errors=True)
+
+    def test_hot_swap_to_active_version(self):
+        _, version, _ = HousePriceService._get_model_bundle()
+        self.assertEqual(version, model_registry.LEGACY_VERSION)
+
+        model_registry.register(model_registry.legacy_model_path(), 'v2', activate=True)
+        model, version, _ = HousePriceService._get_model_bundle()
+        self.assertIsNotNone(model)
+        self.assertEqual(version, 'v2')
+
+    def test_rejects_corrupted_artifact(self):
+        model_registry.register(model_registry.legacy_model_path(), 'v3')
+        with open(f'{self.registry}/v3/{model_registry.ARTIFACT_FILE}', 'ab') as f:
+            f.write(b'corrupted')
+
+        with self.assertRaises(model_registry.ModelRegistryError):
+            model_registry.activate_version('v3')
+        self.assertIsNone(model_registry.active_version())
+
+
+class FastFeatureEncoderTests(SimpleTestCase):
+    """快速編碼器的預測結果需與 pandas Pipeline 路徑完全一致"""
+
+    def test_matches_pandas_pipeline(self):
+        model = joblib.load(model_registry.legacy_model_path())
+        encoder = FastFeatureEncoder.from_pipeline(model)
+        self.assertIsNotNone(encoder)
+
+        rng = np.random.default_rng(7)
+        towns = ['大安區', '信義區', '板橋區', '不存在區']
+        for _ in range(50):
+            input_data = {
+                'city': rng.choice(['臺北市', '新北市', '臺中市', '火星市']),
+                'town': rng.choice(towns),
+                'house_type': rng.choice(['公寓（無電梯）', '大樓（有電梯）']),
+                # 表單送來的可能是整數或浮點數，字串化後的類別要與 pandas 路徑相同
+                'floor_number': rng.choice([3, 3.0, 12, 45]),
+                'total_floors': rng.choice([5, 5.0, 14, 60]),
+                'land_area': float(rng.uniform(0, 80)),
+                'floor_area': float(rng.uniform(5, 120)),
+                'house_age': float(rng.uniform(0, 60)),
+                'room_count': int(rng.integers(0, 6)),
+            }
+            row = HousePriceService._feature_row(
+                input_data, float(rng.uniform(120, 122)), float(rng.uniform(22, 25.3))
+            )
+            expected = model.predict(pd.DataFrame([row], columns=HousePriceService.FEATURE_COLUMNS))
+            np.testing.assert_array_equal(encoder.predict(row), expected)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class GeocodeCacheTests(TestCase):
+    """地理編碼快取：地址正規化、命中時不呼叫 Nominatim、依精確度決定存活時間、連線錯誤不快取"""
+
+    ADDRESS = ('台北市', '大安區', '復興南路一段151號')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_normalize_address(self):
+        expected = '臺北市大安區復興南路一段151號'
+        # 全形數字、空白、台 / 臺、樓層
+        self.assertEqual(normalize_address('台北市', '大安區', ' 復興南路一段 １５１號 ５樓'), expected)
+        self.assertEqual(normalize_address('臺北市', '大安區', '復興南路一段151號12F'), expected)
+        self.assertEqual(normalize_address(*self.ADDRESS), expected)
+
+    def test_cache_hit_skips_network(self):
+        HousePriceService._set_cached_geocode(
+            normalize_address(*self.ADDRESS), 121.54, 25.03, GeocodeCache.PRECISION_EXACT
+        )
+        with mock.patch.object(HousePriceService, '_geocode_nominatim') as geocode:
+            # 寫法不同的同一個地址
+            self.assertEqual(
+                HousePriceService._get_lat_lon('臺北市', '大安區', '復興南路一段１５１號3樓'), (121.54, 25.03, True)
+            )
+            # Redis 沒有時由資料庫回填
+            cache.clear()
+            self.assertEqual(HousePriceService._get_lat_lon(*self.ADDRESS), (121.54, 25.03, True))
+        geocode.assert_not_called()
+
+    def test_ttl_depends_on_precision(self):
+        for precision in (GeocodeCache.PRECISION_EXACT, GeocodeCache.PRECISION_ROAD, GeocodeCache.PRECISION_MISS):
+            with mock.patch('apps.core.services.cache') as redis:
+                HousePriceService._set_cached_geocode('地址', 121.5, 25.0, precision)
+            self.assertEqual(redis.set.call_args.kwargs['timeout'], settings.GEOCODE_CACHE_TTL[precision])
+        self.assertLess(settings.GEOCODE_CACHE_TTL['miss'], settings.GEOCODE_CACHE_TTL['exact'])
+
+    def test_expired_database_record_is_ignored(self):
+        key = normalize_address(*self.ADDRESS)
+        HousePriceService._set_cached_geocode(key, None, None, GeocodeCache.PRECISION_MISS)
+        cache.clear()
+        GeocodeCache.objects.filter(address_key=key).update(
+            updated_at=timezone.now() - timedelta(seconds=settings.GEOCODE_CACHE_TTL['miss'] + 1)
+        )
+        self.assertIsNone(HousePriceService._get_cached_geocode(key))
+
+    @override_settings(GEOCODE_GAZETTEER_FIRST=False)
+    def test_network_errors_are_not_cached(self):
+        error = (None, None, GeocodeCache.PRECISION_MISS, True)
+        with mock.patch.object(HousePriceService, '_geocode_nominatim', return_value=error) as geocode:
+            self.assertEqual(HousePriceService._get_lat_lon(*self.ADDRESS), (None, None, False))
+            self.assertEqual(HousePriceService._get_lat_lon(*self.ADDRESS), (None, None, False))
+        # 連線錯誤不記住，下次仍會重試
+        self.assertEqual(geocode.call_count, 2)
+        self.assertFalse(GeocodeCache.objects.exists())
+
+        # 真的查無結果則做負面快取，存活時間內不再呼叫
+        miss = (None, None, GeocodeCache.PRECISION_MISS, False)
+        with mock.patch.object(HousePriceService, '_geocode_nominatim', return_value=miss) as geocode:
+            HousePriceService._get_lat_lon(*self.ADDRESS)
+            HousePriceService._get_lat_lon(*self.ADDRESS)
+        geocode.assert_called_once()
+        self.assertEqual(GeocodeCache.objects.get().precision, GeocodeCache.PRECISION_MISS)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class RoadGazetteerTests(TestCase):
+    """道路中心點：路名擷取、build_road_gazetteer 建表，以及 Nominatim 查無結果時的備援"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_extract_road(self):
+        cases = [
+            (('臺北市', '大安區', '臺北市大安區復興南路一段151巷3號5樓'), '復興南路一段'),
+            (('台北市', '大安區', '忠孝東路四段216巷27弄5號'), '忠孝東路四段'),
+            (('臺北市', '大安區', '永康街10巷5號'), '永康街'),
+            (('臺北市', '大安區', '仁愛路二段3之1號'), '仁愛路二段'),
+            (('台中市', '西屯區', '台中市西屯區台灣大道三段９９號'), '臺灣大道三段'),
+            (('臺中市', '北屯區', '崇德路100號'), '崇德路'),
+        ]
+        for args, road in cases:
+            self.assertEqual(extract_road(*args), road, args)
+
+    def test_build_gazetteer_uses_median(self):
+        House.objects.bulk_create([
+            House(
+                address=f'臺北市大安區復興南路一段{number}號', city=city, town='大安區', house_type='公寓',
+                total_price=1000, latitude=lat, longitude=121.54,
+            )
+            # 中位數不受離群的錯誤座標影響
+            for number, city, lat in [(1, '臺北市', 25.030), (2, '台北市', 25.032), (3, '臺北市', 26.5)]
+        ])
+        call_command('build_road_gazetteer', stdout=io.StringIO())
+
+        centroid = RoadCentroid.objects.get()
+        self.assertEqual((centroid.city, centroid.road, centroid.sample_count), ('臺北市', '復興南路一段', 3))
+        self.assertAlmostEqual(centroid.latitude, 25.032)
+        self.assertEqual(
+            HousePriceService._lookup_road_centroid('台北市', '大安區', '復興南路一段99巷2號'), (121.54, 25.032)
+        )
+        self.assertIsNone(HousePriceService._lookup_road_centroid('臺北市', '大安區', '和平東路一段1號'))
+
+    @override_settings(GEOCODE_GAZETTEER_FIRST=False)
+    def test_centroid_used_when_geocoder_misses(self):
+        RoadCentroid.objects.create(
+            city='臺北市', town='大安區', road='復興南路一段', latitude=25.03, longitude=121.54, sample_count=5
+        )
+        miss = (None, None, GeocodeCache.PRECISION_MISS, False)
+        with mock.patch.object(HousePriceService, '_geocode_nominatim', return_value=miss) as geocode:
+            self.assertEqual(
+                HousePriceService._get_lat_lon('台北市', '大安區', '復興南路一段151號'), (121.54, 25.03, False)
+            )
+            # 查無結果已快取，第二次直接改用中心點
+            self.assertEqual(
+                HousePriceService._get_lat_lon('台北市', '大安區', '復興南路一段151號'), (121.54, 25.03, False)
+            )
+            # 沒有中心點的路段
+            self.assertEqual(HousePriceService._get_lat_lon('臺北市', '大安區', '和平東路一段1號'), (None, None, False))
+        self.assertEqual(geocode.call_count, 2)
+
+    def test_gazetteer_first_skips_network(self):
+        RoadCentroid.objects.create(
+            city='臺北市', town='大安區', road='復興南路一段', latitude=25.03, longitude=121.54, sample_count=5
+        )
+        with mock.patch.object(HousePriceService, '_geocode_nominatim') as geocode:
+            self.assertEqual(
+                HousePriceService._get_lat_lon('臺北市', '大安區', '復興南路一段151號'), (121.54, 25.03, False)
+            )
+        geocode.assert_not_called()
+
+
+TARGET = (25.0330, 121.5430)  # 臺北市大安區
+
+
+def create_comparables(count=300, seed=7):
+    """在目標點附近建立隨機的房屋 (縣市混用 台 / 臺 兩種寫法)，bulk_create 不觸發 signal"""
+    rng = np.random.default_rng(seed)
+    House.objects.bulk_create([
+        House(
+            address=f'臺北市大安區測試路{index}號',
+            city=rng.choice(['臺北市', '台北市']), town='大安區',
+            house_type=rng.choice(['公寓（無電梯）', '大樓（有電梯）']),
+            total_price=int(rng.integers(800, 3000)),
+            house_age=round(float(rng.uniform(0, 40)), 2),
+            total_floors=int(rng.integers(4, 20)), floor_number=int(rng.integers(1, 12)),
+            floor_area=round(float(rng.uniform(15, 60)), 2), land_area=round(float(rng.uniform(5, 20)), 2),
+            room_count=int(rng.integers(1, 5)),
+            latitude=TARGET[0] + float(rng.normal(0, 0.02)), longitude=TARGET[1] + float(rng.normal(0, 0.02)),
+        )
+        for index in range(count)
+    ])
+    # 正式環境由 signal 在交易提交後呼叫 (bulk_create 與 TestCase 都不會觸發)
+    invalidate_city('臺北市')
+
+
+COMPARABLE_CRITERIA = {
+    'city': '台北市', 'house_type': '公寓（無電梯）', 'house_age': 20.0, 'total_floors': 8,
+    'floor_number': 4, 'floor_area': 35.0, 'land_area': 12.0, 'room_count': 3,
+}
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ComparableSearchTests(TestCase):
+    """周邊實價：空間索引與資料庫查詢兩種路徑的結果必須相同"""
+
+    def setUp(self):
+        create_comparables()
+
+    def assertSameComparables(self, first, second):
+        self.assertEqual([house['address'] for house in first], [house['address'] for house in second])
+        for a, b in zip(first, second):
+            self.assertAlmostEqual(a['distance_km'], b['distance_km'], delta=0.011)
+
+    def test_index_and_db_paths_agree(self):
+        # 台北市 / 臺北市 兩種寫法都要找到兩種寫法的房屋
+        for city in ('台北市', '臺北市'):
+            criteria = dict(COMPARABLE_CRITERIA, city=city)
+            from_index = HousePriceService._find_nearby_from_index(*TARGET, criteria, 10)
+            self.assertEqual(len(from_index), 10)
+            self.assertSameComparables(from_index, HousePriceService._find_nearby_from_db(*TARGET, criteria, 10))
+            self.assertSameComparables(
+                from_index, HousePriceService._find_nearby_from_db(*TARGET, criteria, 10, radius_km=0.5)
+            )
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class BoundingBoxSearchTests(TestCase):
+    """資料庫查詢先以 bounding box 縮小範圍，完全符合的房屋不足時把半徑加倍"""
+
+    # 與 COMPARABLE_CRITERIA 完全符合的房屋，放在目標點北方 / 東方指定距離 (km)
+    NEAR_KM = [0.2, 0.3, 0.4]
+    MID_KM = [1.5, 1.6, 1.7, 1.8, 1.9]
+    FAR_KM = [50.0]
+
+    def setUp(self):
+        def house(name, north_km=0.0, east_km=0.0):
+            lon_km = 111.32 * np.cos(np.radians(TARGET[0]))
+            return House(
+                address=name, city='臺北市', town='大安區', house_type='公寓（無電梯）', total_price=1000,
+                house_age=20, total_floors=8, floor_number=4, floor_area=35, land_area=12, room_count=3,
+                latitude=TARGET[0] + north_km / 111.32, longitude=TARGET[1] + east_km / lon_km,
+            )
+
+        House.objects.bulk_create(
+            [house(f'近{km}', north_km=km) for km in self.NEAR_KM]
+            + [house(f'中{km}', east_km=km) for km in self.MID_KM]
+            + [house(f'遠{km}', north_km=km) for km in self.FAR_KM]
+        )
+
+    def search(self, limit, radius_km):
+        with mock.patch.object(
+            HousePriceService, '_bounding_box', wraps=HousePriceService._bounding_box
+        ) as bounding_box:
+            result = HousePriceService._find_nearby_from_db(*TARGET, COMPARABLE_CRITERIA, limit, radius_km)
+        return [house['address'] for house in result], [c.args[2] for c in bounding_box.call_args_list]
+
+    def test_bounding_box_excludes_outside_rows(self):
+        box = HousePriceService._bounding_box(*TARGET, 1.0)
+        inside = set(House.objects.filter(**box).values_list('address', flat=True))
+        self.assertEqual(inside, {f'近{km}' for km in self.NEAR_KM})
+
+    def test_enough_matches_inside_first_radius(self):
+        addresses, radii = self.search(3, 0.5)
+        self.assertEqual(addresses, [f'近{km}' for km in self.NEAR_KM])
+        self.assertEqual(radii, [0.5])
+
+    def test_radius_doubles_until_enough_matches(self):
+        addresses, radii = self.search(6, 0.5)
+        self.assertEqual(addresses, [f'近{km}' for km in self.NEAR_KM] + [f'中{km}' for km in self.MID_KM[:3]])
+        self.assertEqual(radii, [0.5, 1.0, 2.0])
+
+    @override_settings(COMPARABLE_MAX_RADIUS_KM=8.0)
+    def test_falls_back_to_whole_city(self):
+        addresses, radii = self.search(20, 0.5)
+        # 超過上限後不再以 bounding box 限制，整個縣市的房屋都會列入
+        self.assertEqual(radii, [0.5, 1.0, 2.0, 4.0, 8.0])
+        self.assertEqual(len(addresses), len(self.NEAR_KM + self.MID_KM + self.FAR_KM))
+        self.assertEqual(addresses[-1], '遠50.0')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class CitySpatialIndexTests(TestCase):
+    """縣市空間索引：建立、最近鄰查詢與版本失效"""
+
+    def setUp(self):
+        create_comparables()
+
+    def test_nearest_matches_brute_force(self):
+        index = get_city_index('台北市')
+        self.assertEqual(index.size, House.objects.count())
+
+        loose = HousePriceService._comparable_filters(COMPARABLE_CRITERIA, strict=False)
+        strict = HousePriceService._comparable_filters(COMPARABLE_CRITERIA, strict=True)
+        matches = index.nearest(*TARGET, loose, strict, 10)
+
+        # 逐筆計算所有房屋的距離與符合條件數，結果要與索引相同
+        fields = sorted({lookup.partition('__')[0] for lookup in {**loose, **strict}})
+        rows = list(House.objects.values('id', 'latitude', 'longitude', *fields))
+        columns = columns_from_rows(rows, fields)
+        candidates = np.ones(len(rows), dtype=bool)
+        for lookup, value in loose.items():
+            candidates &= lookup_mask(columns, lookup, value)
+        rows = [row for row, keep in zip(rows, candidates) if keep]
+        columns = columns_from_rows(rows, fields)
+        distances = haversine_km(*TARGET, [row['latitude'] for row in rows], [row['longitude'] for row in rows])
+        order = rank_by_tier(strictness_tier(columns, strict), distances, 10)
+
+        self.assertEqual([house_id for house_id, _ in matches], [rows[i]['id'] for i in order])
+        np.testing.assert_allclose([dist for _, dist in matches], distances[order], atol=1e-6)
+
+    def test_invalidate_city_forces_rebuild(self):
+        index = get_city_index('臺北市')
+        version = get_city_version('臺北市')
+        # 版本沒變時沿用同一個索引 (台 / 臺 共用)
+        self.assertIs(get_city_index('台北市'), index)
+
+        House.objects.create(
+            address='臺北市大安區新增路1號', city='臺北市', town='大安區', house_type='公寓（無電梯）',
+            total_price=1000, latitude=TARGET[0], longitude=TARGET[1],
+        )
+        invalidate_city('台北市')
+        self.assertNotEqual(get_city_version('臺北市'), version)
+
+        rebuilt = get_city_index('臺北市')
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.size, index.size + 1)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ValuationResultCacheTests(TestCase):
+    """相同輸入直接命中快取；該縣市房屋資料異動後失效"""
+
+    input_data = {
+        'city': '臺北市', 'town': '大安區', 'street': '復興南路一段1號',
+        'house_type': '公寓（無電梯）', 'house_age': 20.0, 'total_floors': 5.0,
+        'floor_number': 3.0, 'floor_area': 30.0, 'land_area': 10.0, 'room_count': 3,
+    }
+
+    def test_hit_and_invalidate_on_house_change(self):
+        task_result = {
+            'status': 'success',
+            'data': {'price': 1234.5, 'model_version': model_registry.current_version()},
+            'input_data': self.input_data,
+        }
+        city_version = HousePriceService.city_data_version(self.input_data)
+        HousePriceService.set_cached_result(self.input_data, task_result, city_version)
+
+        # 台/臺、整數/浮點數的寫法不同，仍是同一筆
+        equivalent = dict(self.input_data, city='台北市', floor_number=3, room_count=3.0)
+        self.assertEqual(HousePriceService.get_cached_result(equivalent), task_result)
+
+        # 快取在交易提交後才失效
+        with self.captureOnCommitCallbacks(execute=True):
+            House.objects.create(
+                address='臺北市大安區復興南路一段2號', city='臺北市', town='大安區',
+                house_type='公寓（無電梯）', total_price=1000, latitude=25.03, longitude=121.54,
+            )
+        self.assertIsNone(HousePriceService.get_cached_result(self.input_data))
+
+    def test_hit_keeps_this_users_input(self):
+        task_result = {'status': 'success', 'data': {'price': 1234.5}, 'input_data': self.input_data}
+        request = RequestFactory().post('/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        view = HomeView(request=request)
+        form = mock.Mock(cleaned_data=dict(self.input_data, city='台北市', street='復興南路一段1號 3樓'))
+
+        with mock.patch.object(HousePriceService, 'get_cached_result', return_value=task_result):
+            response = view.form_valid(form)
+
+        self.assertEqual(json.loads(response.content)['status'], 'completed')
+        self.assertEqual(request.session['valuation_result'], {'price': 1234.5})
+        self.assertEqual(request.session['valuation_input']['city'], '台北市')
+        self.assertEqual(request.session['valuation_input']['street'], '復興南路一段1號 3樓')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ValuationPushTests(SimpleTestCase):
+    """估價任務完成後推播結果到 user_<id> 群組"""
+
+    def receive(self, result):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)('user_42', channel)
+
+        with mock.patch.object(HousePriceService, 'predict', return_value=result):
+            predict_house_price.apply(args=[{'city': '臺北市'}], kwargs={'user_id': 42}, task_id='task-1')
+        return async_to_sync(channel_layer.receive)(channel)
+
+    def test_push_success_with_redirect_url(self):
+        message = self.receive({'price': 1000.0, 'model_version': 'legacy'})
+        self.assertEqual(message['kind'], 'valuation')
+        self.assertEqual(message['task_id'], 'task-1')
+        self.assertEqual(message['status'], 'success')
+        self.assertEqual(message['redirect_url'], '/task-result/task-1/')
+
+    def test_push_error_message(self):
+        message = self.receive({'error': '無法定位該地址'})
+        self.assertEqual(message['status'], 'error')
+        self.assertEqual(message['message'], '無法定位該地址')
+
+
+class ImportCallbackStatusTests(SimpleTestCase):
+    """平行匯入的 chord callback：完成、失敗、進行中三種結果的欄位相同"""
+
+    def status(self, state, result=None):
+        callback = mock.Mock(state=state, result=result)
+        with mock.patch('apps.core.views.AsyncResult', return_value=callback):
+            return import_callback_status({'callback_id': 'cb-1', 'message': '平行寫入中...'})
+
+    def test_same_keys_for_every_outcome(self):
+        completed = self.status('SUCCESS', {'message': '資料匯入成功！'})
+        failed = self.status('FAILURE', RuntimeError('分割失敗'))
+        running = self.status('STARTED')
+
+        self.assertEqual(set(completed), set(failed))
+        self.assertEqual(set(completed), set(running))
+        self.assertEqual((completed['state'], completed['status']), ('SUCCESS', 'completed'))
+        self.assertEqual((failed['state'], failed['error']), ('FAILURE', '分割失敗'))
+        self.assertEqual((running['state'], running['message']), ('PROGRESS', '平行寫入中...'))
+
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = list(messages)
+
+    async def subscribe(self, channel):
+        self.channel = channel
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=None):
+        if not self.messages:
+            return None
+        return {'type': 'message', 'data': self.messages.pop(0)}
+
+    async def aclose(self):
+        pass
+
+
+class FakeAsyncRedis:
+    def __init__(self, last, messages):
+        self.last = last
+        self._pubsub = FakePubSub(messages)
+
+    def pubsub(self):
+        return self._pubsub
+
+    async def get(self, key):
+        return self.last
+
+    async def aclose(self):
+        pass
+
+
+class TaskEventStreamTests(SimpleTestCase):
+    """SSE 串流依序轉送任務事件，收到最終狀態後結束"""
+
+    def collect(self, client):
+        async def run():
+            return [chunk async for chunk in task_events.stream_task_events('task-1')]
+
+        with mock.patch.object(task_events.aioredis, 'from_url', return_value=client):
+            chunks = asyncio.run(run())
+        return [json.loads(chunk[len('data: '):]) for chunk in chunks if chunk.startswith('data: ')]
+
+    def test_streams_until_final_state(self):
+        client = FakeAsyncRedis(None, [
+            b'{"task_id": "task-1", "state": "STARTED"}',
+            b'{"task_id": "task-1", "state": "SUCCESS", "result": {"status": "success"}}',
+            b'{"task_id": "task-1", "state": "IGNORED"}',
+        ])
+        states = [event['state'] for event in self.collect(client)]
+        self.assertEqual(states, ['PENDING', 'STARTED', 'SUCCESS'])
+
+    def test_finished_task_returns_last_event(self):
+        client = FakeAsyncRedis(b'{"task_id": "task-1", "state": "FAILURE"}', [])
+        self.assertEqual([event['state'] for event in self.collect(client)], ['FAILURE'])
+
+
+class StagedUploadTests(SimpleTestCase):
+    """上傳檔案經由暫存區交給任務，內容不符或過期時拒絕讀取"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+    def test_stage_open_and_discard(self):
+        upload = uploads.stage_upload(SimpleUploadedFile('房屋.xlsx', b'excel-bytes'))
+        self.assertTrue(upload['name'].startswith('tmp/'))
+        self.assertEqual(upload['filename'], '房屋.xlsx')
+
+        with uploads.open_staged(upload) as f:
+            self.assertEqual(f.read(), b'excel-bytes')
+
+        uploads.discard_staged(upload)
+        with self.assertRaises(uploads.StagedUploadError):
+            uploads.open_staged(upload)
+
+    def test_rejects_modified_file(self):
+        upload = uploads.stage_upload(SimpleUploadedFile('a.csv', b'1,2,3'))
+        with open(f"{self.media_root}/{upload['name']}", 'ab') as f:
+            f.write(b'4')
+        with self.assertRaises(uploads.StagedUploadError):
+            uploads.open_staged(upload)
+
+    def test_cleanup_only_removes_expired_files(self):
+        uploads.stage_upload(SimpleUploadedFile('a.csv', b'1,2,3'))
+        self.assertEqual(uploads.cleanup_staged_uploads(max_age=3600), 0)
+        self.assertEqual(uploads.cleanup_staged_uploads(max_age=-1), 1)
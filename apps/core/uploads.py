@@ -0,0 +1,100 @@
+"""
+上傳檔案暫存區 (Staging)
+
+上傳的檔案先分段寫入 default_storage 的 tmp/ 目錄，Celery 任務只收到一個小小的 handle：
+    {'name': 'tmp/<sha256>_<隨機碼>.xlsx', 'sha256': ..., 'size': ..., 'filename': ...}
+
+不再把整個檔案 base64 編碼後塞進 Redis broker，broker 的記憶體用量與檔案大小無關，
+任務重試時也不必重新傳送檔案。任務完成後刪除暫存檔，沒被處理的檔案由定時任務清除。
+"""
+import hashlib
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+STAGING_DIR = 'tmp'
+
+
+class StagedUploadError(Exception):
+    """暫存檔不存在、已過期或內容與上傳時不符"""
+
+
+def stage_upload(uploaded_file):
+    """
+    將上傳的檔案寫入暫存區，回傳任務使用的 handle
+
+    先計算 SHA-256 (分段讀取)，再交給 storage 分段寫入；
+    檔名加上隨機碼，同一個檔案重複上傳也不會互相覆蓋或被提早刪除
+    """
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    sha256 = digest.hexdigest()
+
+    ext = os.path.splitext(uploaded_file.name)[1].lower()
+    uploaded_file.seek(0)
+    name = default_storage.save(f'{STAGING_DIR}/{sha256}_{uuid.uuid4().hex[:8]}{ext}', uploaded_file)
+
+    return {
+        'name': name,
+        'sha256': sha256,
+        'size': uploaded_file.size,
+        'filename': uploaded_file.name,
+    }
+
+
+def open_staged(handle, verify=True):
+    """
+    開啟暫存檔 (binary 模式)，預設會先核對 SHA-256
+
+    Raises:
+        StagedUploadError: 檔案不存在 (已被清除) 或內容不符
+    """
+    name = handle['name']
+    if not name.startswith(f'{STAGING_DIR}/') or not default_storage.exists(name):
+        raise StagedUploadError('上傳的檔案已過期或不存在，請重新上傳。')
+
+    file_obj = default_storage.open(name, 'rb')
+    if verify:
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: file_obj.read(1024 * 1024), b''):
+            digest.update(chunk)
+        if digest.hexdigest() != handle['sha256']:
+            file_obj.close()
+            raise StagedUploadError('上傳的檔案內容已損毀，請重新上傳。')
+        file_obj.seek(0)
+    return file_obj
+
+
+def discard_staged(handle):
+    """刪除暫存檔 (任務處理完畢後呼叫)"""
+    try:
+        default_storage.delete(handle['name'])
+    except Exception as e:
+        print(f"⚠️ 無法刪除暫存檔 {handle.get('name')}: {e}")
+
+
+def cleanup_staged_uploads(max_age=None):
+    """
+    刪除超過 max_age 秒仍未被處理的暫存檔，回傳刪除的檔案數
+    """
+    max_age = settings.STAGED_UPLOAD_MAX_AGE if max_age is None else max_age
+    if not default_storage.exists(STAGING_DIR):
+        return 0
+
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    _, files = default_storage.listdir(STAGING_DIR)
+    removed = 0
+    for filename in files:
+        name = f'{STAGING_DIR}/{filename}'
+        try:
+            if default_storage.get_modified_time(name) < cutoff:
+                default_storage.delete(name)
+                removed += 1
+        except (OSError, NotImplementedError) as e:
+            print(f"⚠️ 無法清除暫存檔 {name}: {e}")
+    return removed
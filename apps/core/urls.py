@@ -10,7 +10,16 @@ urlpatterns = [
 
     # [新增] 任務狀態查詢
     path('task-status/<str:task_id>/', views.TaskStatusView.as_view(), name='task_status'),
+
+    # [新增] 任務狀態 SSE 串流 (WebSocket 無法使用時)
+    path('task-events/<str:task_id>/', views.task_events_stream, name='task_events'),
+
+    # [新增] 任務結果 (存入 Session 後導向結果頁，WebSocket 推播時使用)
+    path('task-result/<str:task_id>/', views.TaskResultView.as_view(), name='task_result'),
     
+    # [新增] 批次估價
+    path('batch-valuation/', views.BatchValuationView.as_view(), name='batch_valuation'),
+
     # 【新增】估價結果頁
     path('result/', views.ValuationResultView.as_view(), name='valuation_result'),
     
@@ -20,6 +29,9 @@ urlpatterns = [
     # 後台首頁
     path('dashboard/', views.DashboardHomeView.as_view(), name='dashboard_home'),
 
+    # [新增] 估價模型監控指標
+    path('dashboard/model-metrics/', views.ModelMetricsView.as_view(), name='model_metrics'),
+
     # 【新增】獨立的匯入頁面路徑
     path('dashboard/import/', views.DataImportView.as_view(), name='import_data'),
     
@@ -2,7 +2,7 @@
 from decimal import Decimal  # <--- 1. 記得在檔案最上方加入這個 import
 from django.shortcuts import render, redirect
 from django.views.generic import FormView, TemplateView, View, ListView, DetailView
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse
 from django.http import Http404
@@ -10,12 +10,14 @@ from django.contrib import messages # 用來顯示 "請先登入" 的訊息
 
 # 引入 Celery 相關
 from celery.result import AsyncResult
-from .tasks import predict_house_price
+from .tasks import predict_house_price, predict_house_prices_batch
 
 # 引入你的 Form, Service 和 Model
 from .forms import EstimationForm, city_districts
 from .services import HousePriceService
 from .models import ValuationRecord
+from .task_events import stream_task_events
+from .uploads import stage_upload
 
 from django.db.models import Count
 from django.utils import timezone
@@ -41,6 +43,13 @@ def convert_decimal_to_float(data):
     else:
         return data
 
+def store_valuation_in_session(request, task_result):
+    """
+    將估價任務的結果存入 Session，讓結果頁 / 加入收藏讀取
+    """
+    request.session['valuation_result'] = convert_decimal_to_float(task_result['data'])
+    request.session['valuation_input'] = convert_decimal_to_float(task_result['input_data'])
+
 # ==========================================
 # 1. 首頁 View (修改為非同步派發)
 # ==========================================
@@ -82,10 +91,22 @@ class HomeView(FormView):
             'room_count': int(serializable_data.get('room_count') or 0),
         }
 
-        # 3. [關鍵修改] 派發 Celery 任務
-        task = predict_house_price.delay(input_data)
+        # 3. 相同輸入已經估價過 (且模型、周邊資料都沒變)，直接回傳結果，不必派發任務
+        cached = HousePriceService.get_cached_result(input_data)
+        if cached is not None:
+            # 快取以正規化後的輸入為 key，結果頁 / 收藏要顯示這位使用者實際輸入的地址
+            store_valuation_in_session(self.request, {**cached, 'input_data': input_data})
+            return JsonResponse({
+                'status': 'completed',
+                'redirect_url': reverse('core:valuation_result'),
+                'msg': '估價完成',
+            })
 
-        # 4. 回傳 task_id 給前端
+        # 4. [關鍵修改] 派發 Celery 任務
+        # 傳入 user_id，任務完成時會透過 WebSocket 推播給這位使用者
+        task = predict_house_price.delay(input_data, user_id=self.request.user.id)
+
+        # 5. 回傳 task_id 給前端
         return JsonResponse({
             'task_id': task.id,
             'status': 'processing',
@@ -101,6 +122,45 @@ class HomeView(FormView):
             }, status=400)
         return super().form_invalid(form)
     
+# ==========================================
+# [新增] 批次估價 View (派發 Celery 任務)
+# ==========================================
+class BatchValuationView(LoginRequiredMixin, View):
+    """
+    一次估算多筆房屋，可上傳 Excel / CSV (欄位 file)，
+    或以 JSON body 傳入 {"inputs": [...], "include_nearby": false}
+    回傳 task_id，前端以 task-status 查詢結果
+    """
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload:
+            # 檔案寫入暫存區，任務只收到 handle
+            task = predict_house_prices_batch.delay(
+                upload=stage_upload(upload),
+                include_nearby=request.POST.get('include_nearby') == 'true',
+            )
+        else:
+            try:
+                payload = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'status': 'error', 'error': 'JSON 格式錯誤'}, status=400)
+
+            inputs = payload.get('inputs')
+            if not isinstance(inputs, list) or not inputs:
+                return JsonResponse({'status': 'error', 'error': '請提供 inputs 列表或上傳檔案'}, status=400)
+
+            task = predict_house_prices_batch.delay(
+                inputs=inputs,
+                include_nearby=bool(payload.get('include_nearby', False)),
+            )
+
+        return JsonResponse({
+            'task_id': task.id,
+            'status': 'processing',
+            'msg': '批次估價計算中...'
+        })
+
+
 # 新增這個簡單的 view
 def coming_soon(request):
     """顯示「功能建置中」的幽默頁面"""
@@ -127,11 +187,7 @@ class TaskStatusView(LoginRequiredMixin, View):
             # A. 估價任務 (有 'input_data' 欄位)
             if isinstance(task_result, dict) and 'input_data' in task_result:
                 if task_result.get('status') == 'success':
-                    # ... (原本的 session 處理邏輯) ...
-                    safe_result = convert_decimal_to_float(task_result['data'])
-                    safe_input = convert_decimal_to_float(task_result['input_data'])
-                    request.session['valuation_result'] = safe_result
-                    request.session['valuation_input'] = safe_input
+                    store_valuation_in_session(request, task_result)
                     
                     response_data['status'] = 'completed'
                     response_data['redirect_url'] = reverse('core:valuation_result')
@@ -141,9 +197,15 @@ class TaskStatusView(LoginRequiredMixin, View):
 
             # B. Excel 匯入任務 (有 'message' 欄位，沒有 input_data)
             elif isinstance(task_result, dict) and 'message' in task_result:
-                if task_result.get('status') == 'success':
+                if task_result.get('status') == 'started':
+                    # 房屋分成多份平行寫入中，改看 chord callback 的狀態
+                    response_data.update(import_callback_status(task_result))
+                elif task_result.get('status') == 'success':
                     response_data['status'] = 'completed'
                     response_data['message'] = task_result.get('message')
+                    # 批次估價任務另外帶有每筆的估價結果
+                    if 'data' in task_result:
+                        response_data['data'] = convert_decimal_to_float(task_result['data'])
                 else:
                     response_data['state'] = 'FAILURE'
                     response_data['error'] = task_result.get('error')
@@ -152,11 +214,68 @@ class TaskStatusView(LoginRequiredMixin, View):
             else:
                 response_data['data'] = task_result # 直接回傳原本結果
 
+        elif result.state == 'PROGRESS':
+            # 匯入任務以 update_state 記錄的進度 (已處理列數、速度、預估剩餘時間)
+            response_data['progress'] = result.info
+
         elif result.state == 'FAILURE':
             response_data['error'] = str(result.result)
         
         return JsonResponse(response_data)
 
+
+def import_callback_status(task_result):
+    """
+    匯入任務已分派平行寫入時，以 chord callback 的結果決定整體狀態
+
+    三種結果都回傳相同的欄位 (state / status / message / error)，前端只需判斷 state
+    """
+    callback = AsyncResult(task_result['callback_id'])
+    if callback.state == 'SUCCESS':
+        return {'state': 'SUCCESS', 'status': 'completed', 'message': callback.result.get('message'), 'error': None}
+    if callback.state == 'FAILURE':
+        return {'state': 'FAILURE', 'status': 'failed', 'message': None, 'error': str(callback.result)}
+    return {'state': 'PROGRESS', 'status': 'processing', 'message': task_result.get('message'), 'error': None}
+
+# ==========================================
+# [新增] 任務狀態 SSE 串流 (非同步 View)
+# ==========================================
+async def task_events_stream(request, task_id):
+    """
+    以 Server-Sent Events 串流任務狀態 (PENDING → STARTED → PROGRESS → SUCCESS / FAILURE)
+
+    給 WebSocket 被 proxy 擋掉的客戶端使用。這是 async view，
+    在 Daphne (ASGI) 下等待 Redis pub/sub 時不會佔用 worker thread。
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'status': 'redirect', 'url': reverse('account_login')}, status=401)
+
+    response = StreamingHttpResponse(stream_task_events(task_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # 關閉 nginx 的緩衝，事件才會即時送出
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# ==========================================
+# [新增] 任務結果 View (WebSocket 推播的 redirect_url)
+# ==========================================
+class TaskResultView(LoginRequiredMixin, View):
+    """
+    估價任務完成後，WebSocket 推播的網址指向這裡：
+    讀取一次任務結果存入 Session，再導向結果頁
+    """
+    def get(self, request, task_id):
+        result = AsyncResult(task_id)
+        task_result = result.result if result.state == 'SUCCESS' else None
+
+        if isinstance(task_result, dict) and task_result.get('status') == 'success' and 'input_data' in task_result:
+            store_valuation_in_session(request, task_result)
+            return redirect('core:valuation_result')
+
+        messages.error(request, "找不到估價結果，請重新估價。")
+        return redirect('core:home')
+
 # ==========================================
 # 2. 結果頁 View (從 Session 讀取並顯示)
 # ==========================================
@@ -221,6 +340,7 @@ class AddFavoriteView(LoginRequiredMixin, View):
                 # 估價結果
                 predicted_price=result['price'],
                 unit_price=result.get('price') / input_data['floor_area'] if input_data['floor_area'] else 0,
+                model_version=result.get('model_version', ''),
                 
                 # 視覺化快照
                 latitude=result.get('target_coords', {}).get('lat'),
@@ -391,6 +511,18 @@ class DashboardHomeView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
 
         return context
 
+# ==========================================
+# [新增] 估價模型監控指標 (JSON)
+# ==========================================
+class ModelMetricsView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """回傳模型載入耗時、記憶體用量與暖機耗時"""
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(HousePriceService.get_model_metrics())
+
+
 # ==========================================
 # 6. 其他既有功能 (Dashboard, Ajax) - 保留原樣
 # ==========================================
@@ -1,20 +1,45 @@
 from django.contrib import admin
-from .models import House, Agent, Buyer
+from .models import House, Agent, Buyer, ImportJob, ImportCheckpoint
+from .signals import coalesce_signals
+
+class CoalescedSignalsMixin:
+    """批次刪除 / 批次 action 時不逐筆推播，結束後送出一則摘要"""
+    def delete_queryset(self, request, queryset):
+        with coalesce_signals():
+            super().delete_queryset(request, queryset)
+
+    def response_action(self, request, queryset):
+        with coalesce_signals():
+            return super().response_action(request, queryset)
 
 @admin.register(House)
-class HouseAdmin(admin.ModelAdmin):
+class HouseAdmin(CoalescedSignalsMixin, admin.ModelAdmin):
     list_display = ('address', 'house_type', 'total_price', 'city', 'town', 'agent', 'created_at',)
     list_filter = ('house_type', 'city',)
     search_fields = ('address', 'city', 'town', 'house_type',)
     ordering = ('-created_at', '-total_price',)
 
 @admin.register(Agent)
-class AgentAdmin(admin.ModelAdmin):
+class AgentAdmin(CoalescedSignalsMixin, admin.ModelAdmin):
     list_display = ('name', 'phone', 'email', 'company', 'branch', 'city', 'town',)
     list_filter = ('city', 'town', 'company',)
     search_fields = ('name', 'company', 'branch', 'city', 'town',)
 
 @admin.register(Buyer)
-class BuyerAdmin(admin.ModelAdmin):
+class BuyerAdmin(CoalescedSignalsMixin, admin.ModelAdmin):
     list_display = ('name', 'phone', 'email',)
-    search_fields = ('name', 'phone', 'email',)
\ No newline at end of file
+    search_fields = ('name', 'phone', 'email',)
+
+class ImportCheckpointInline(admin.TabularInline):
+    model = ImportCheckpoint
+    extra = 0
+    readonly_fields = ('key', 'batches_done', 'updated_at',)
+    can_delete = False
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'dataset', 'status', 'user', 'created_at', 'updated_at',)
+    list_filter = ('status', 'dataset',)
+    search_fields = ('filename', 'sha256',)
+    readonly_fields = ('sha256', 'task_id', 'error', 'created_at', 'updated_at',)
+    inlines = [ImportCheckpointInline]
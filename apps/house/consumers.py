@@ -9,6 +9,12 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
 
+def _is_staff(scope):
+    """與列表頁 (test_func) 相同：只有 staff 可以接收列表的即時更新"""
+    user = scope.get('user')
+    return user is not None and user.is_authenticated and user.is_staff
+
+
 class HouseListConsumer(AsyncWebsocketConsumer):
     """
     房屋列表 WebSocket Consumer
@@ -28,6 +34,11 @@ class HouseListConsumer(AsyncWebsocketConsumer):
 
         相當於 View 的 GET 請求
         """
+        # 通知附有列表的單列 (含聯絡資料)，與列表頁相同只開放 staff
+        if not _is_staff(self.scope):
+            await self.close()
+            return
+
         # 將此連線加入群組（像是加入聊天室）
         await self.channel_layer.group_add(
             self.GROUP_NAME,
@@ -73,8 +84,11 @@ class HouseListConsumer(AsyncWebsocketConsumer):
         # 將訊息發送給客戶端（瀏覽器）
         await self.send(text_data=json.dumps({
             'type': 'house_update',
-            'action': event['action'],    # 'create', 'update', 'delete'
+            'action': event['action'],    # 'create', 'update', 'delete', 'bulk' (批次異動摘要)
             'message': event['message'],  # 顯示給使用者的訊息
+            'counts': event.get('counts'),  # 批次異動時各動作的筆數
+            'id': event.get('id'),          # 單筆異動的 id
+            'html': event.get('html'),      # 渲染好的單列 (_house_table_row.html)，前端直接替換
         }))
 
         print(f"[WebSocket] 已發送給客戶端: {event['action']}")
@@ -84,6 +98,9 @@ class AgentListConsumer(AsyncWebsocketConsumer):
     GROUP_NAME = 'agent_updates'
 
     async def connect(self):
+        if not _is_staff(self.scope):
+            await self.close()
+            return
         await self.channel_layer.group_add(self.GROUP_NAME, self.channel_name)
         await self.accept()
 
@@ -96,6 +113,9 @@ class AgentListConsumer(AsyncWebsocketConsumer):
             'type': 'agent_update',
             'action': event['action'],
             'message': event['message'],
+            'counts': event.get('counts'),
+            'id': event.get('id'),
+            'html': event.get('html'),
         }))
 
 # 【新增】BuyerListConsumer
@@ -103,6 +123,9 @@ class BuyerListConsumer(AsyncWebsocketConsumer):
     GROUP_NAME = 'buyer_updates'
 
     async def connect(self):
+        if not _is_staff(self.scope):
+            await self.close()
+            return
         await self.channel_layer.group_add(self.GROUP_NAME, self.channel_name)
         await self.accept()
 
@@ -115,4 +138,7 @@ class BuyerListConsumer(AsyncWebsocketConsumer):
             'type': 'buyer_update',
             'action': event['action'],
             'message': event['message'],
+            'counts': event.get('counts'),
+            'id': event.get('id'),
+            'html': event.get('html'),
         }))
\ No newline at end of file
@@ -0,0 +1,707 @@
+# apps/house/importers.py
+"""
+仲介 / 買家 / 房屋 資料匯入
+
+資料來源 (Source) 負責「逐批」讀出資料列，匯入函式負責把每一批寫入資料庫。
+來源以串流方式讀取，不會把整張工作表載入成 DataFrame，
+50 萬列的房屋工作表，worker 的記憶體用量也只和批次大小有關。
+
+支援的格式：
+    .xlsx              一個活頁簿包含 仲介 / 買家 / 房屋 三個工作表
+    .csv / .parquet    一個檔案只包含一個資料集 (由欄位判斷，或上傳時指定)
+"""
+import csv
+import io
+import itertools
+import os
+import re
+import tempfile
+from array import array
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .models import House, Agent, Buyer
+from .signals import record_bulk_change
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 為選用套件，沒有安裝時 CSV 改用 pandas 讀取
+    pa = None
+
+# 資料集名稱 (Excel 的工作表名稱)
+AGENT_DATASET = '仲介'
+BUYER_DATASET = '買家'
+HOUSE_DATASET = '房屋'
+
+# 定義欄位對照 (與原本 View 相同)
+AGENT_COLUMN_MAP = {
+    '姓名': 'name', '聯絡電話': 'phone', '電子郵件': 'email',
+    '隸屬公司': 'company', '分行名稱': 'branch', '分行縣市': 'city', '分行行政區': 'town',
+}
+BUYER_COLUMN_MAP = {
+    '姓名': 'name', '聯絡電話': 'phone', '電子郵件': 'email',
+}
+HOUSE_COLUMN_MAP = {
+    '縣市': 'city', '行政區': 'town', '房屋類型': 'house_type', '地址': 'address',
+    '所在層數': 'floor_number', '地坪': 'land_area', '地上總層數': 'total_floors',
+    '建坪': 'floor_area', '房間數': 'room_count', '總價格（萬元）': 'total_price',
+    '建坪單價(萬元/坪)': 'unit_price', '經度': 'longitude', '緯度': 'latitude',
+    '屋齡（年）': 'house_age', '出售日期': 'sold_time',
+    '仲介': 'agent_name', '買家': 'buyer_name',
+}
+
+BATCH_SIZE = 1000
+
+DATASET_COLUMN_MAPS = {
+    AGENT_DATASET: AGENT_COLUMN_MAP,
+    BUYER_DATASET: BUYER_COLUMN_MAP,
+    HOUSE_DATASET: HOUSE_COLUMN_MAP,
+}
+
+EXCEL_EXTENSIONS = {'.xlsx'}
+TABULAR_EXTENSIONS = {'.csv', '.parquet'}
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS | TABULAR_EXTENSIONS
+
+
+class ImportSourceError(Exception):
+    """無法辨識的檔案格式或資料集"""
+
+
+class ExcelSource:
+    """
+    以 openpyxl 的 read_only 模式逐列讀取 Excel，每個工作表是一個資料集
+    """
+    def __init__(self, file_obj):
+        self.workbook = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+
+    def has_dataset(self, dataset):
+        return dataset in self.workbook.sheetnames
+
+    def row_count(self, dataset):
+        """工作表的資料列數 (來自活頁簿記錄的範圍，不需要讀完整張表)，未知時回傳 None"""
+        max_row = self.workbook[dataset].max_row
+        return max_row - 1 if max_row else None
+
+    def batches(self, dataset, column_map, batch_size=BATCH_SIZE):
+        """
+        逐批產生 [(Excel 行號, {欄位: 值}), ...]
+        只保留 column_map 中的欄位；整列空白的資料列略過
+        """
+        rows = self.workbook[dataset].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        # 欄位位置 -> model 欄位名稱
+        columns = [
+            (position, column_map[str(name).strip()])
+            for position, name in enumerate(header)
+            if name is not None and str(name).strip() in column_map
+        ]
+
+        batch = []
+        for row_number, values in enumerate(rows, start=2):
+            if all(value is None or value == '' for value in values):
+                continue
+            record = {}
+            for position, field in columns:
+                value = values[position] if position < len(values) else None
+                record[field] = None if value == '' else value
+            batch.append((row_number, record))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        self.workbook.close()
+
+
+def detect_dataset(columns):
+    """
+    由欄位名稱判斷 CSV / Parquet 檔屬於哪一個資料集
+
+    房屋有「地址」，仲介有「隸屬公司」，兩者都沒有、但有「姓名」的是買家
+    """
+    columns = {str(name).strip() for name in columns}
+    if '地址' in columns:
+        return HOUSE_DATASET
+    if '隸屬公司' in columns:
+        return AGENT_DATASET
+    if '姓名' in columns:
+        return BUYER_DATASET
+    raise ImportSourceError('無法由欄位判斷資料類型，請確認檔案包含「姓名」或「地址」欄位。')
+
+
+def _rebatch(records, batch_size):
+    """把讀取器產生的資料 (每個 block 大小不一) 重新切成固定大小的批次"""
+    batch = []
+    for item in records:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class TabularSource:
+    """
+    CSV / Parquet 資料來源 (一個檔案 = 一個資料集)
+
+    以 pyarrow 的欄式 (columnar) 讀取器逐個 record batch 讀取，
+    只讀取 column_map 中用到的欄位，一百萬列的檔案也只需要幾秒；
+    沒有安裝 pyarrow 時，CSV 改用 pandas 分塊 (chunksize) 讀取。
+    """
+    def __init__(self, file_obj, extension, dataset=None):
+        self.file_obj = file_obj
+        self.extension = extension
+        # 檔案中的原始欄位名稱 (讀取器以原始名稱選取欄位)，比對 column_map 時去掉前後空白
+        self.raw_columns = self._read_columns()
+        self.columns = [name.strip() for name in self.raw_columns]
+        self.dataset = dataset or detect_dataset(self.columns)
+        if self.dataset not in DATASET_COLUMN_MAPS:
+            raise ImportSourceError(f'不支援的資料類型: {self.dataset}')
+
+    def _read_columns(self):
+        """只讀取標題列 (欄位名稱)"""
+        if self.extension == '.parquet':
+            if pa is None:
+                raise ImportSourceError('伺服器未安裝 pyarrow，無法讀取 Parquet 檔案。')
+            return pq.ParquetFile(self.file_obj).schema_arrow.names
+
+        text = io.TextIOWrapper(self.file_obj, encoding='utf-8-sig', newline='')
+        try:
+            header = next(csv.reader(text), [])
+        finally:
+            text.detach()
+            self.file_obj.seek(0)
+        return header
+
+    def has_dataset(self, dataset):
+        return dataset == self.dataset
+
+    def row_count(self, dataset):
+        """Parquet 的列數記錄在檔案的 metadata 中；CSV 要讀完才知道，回傳 None"""
+        if self.extension == '.parquet' and dataset == self.dataset:
+            return pq.ParquetFile(self.file_obj).metadata.num_rows
+        return None
+
+    def batches(self, dataset, column_map, batch_size=BATCH_SIZE):
+        """
+        逐批產生 [(行號, {欄位: 值}), ...]，格式與 ExcelSource.batches 相同
+        行號為檔案中的實際行號 (標題列為第 1 行，空白行也計入)，與用 Excel 開啟 CSV 時看到的行號相同
+        """
+        if dataset != self.dataset:
+            return
+        fields = {raw: column_map[name] for raw, name in zip(self.raw_columns, self.columns) if name in column_map}
+        names = list(fields)
+
+        line_numbers = self._csv_line_numbers() if self.extension == '.csv' else None
+        records = (
+            (row_number, {fields[name]: value for name, value in record.items()})
+            for row_number, record in zip(
+                line_numbers if line_numbers is not None else itertools.count(2), self._records(names)
+            )
+        )
+        non_blank = (
+            (row_number, record) for row_number, record in records
+            if any(value is not None for value in record.values())
+        )
+        yield from _rebatch(non_blank, batch_size)
+
+    def _csv_line_numbers(self):
+        """
+        CSV 每一筆資料的起始行號
+
+        pyarrow / pandas 讀取時會略過空白行，行號不能只用資料的順序推算。
+        檔案中沒有空白行時 (大多數情況) 回傳 None，直接依順序計算；
+        有空白行時以 csv 模組掃描一次，取得每一筆資料實際所在的行 (跨行的引號欄位也正確)
+        """
+        if not self._has_blank_lines():
+            return None
+
+        line_numbers = array('L')
+        text = io.TextIOWrapper(self.file_obj, encoding='utf-8-sig', newline='')
+        try:
+            reader = csv.reader(text)
+            next(reader, None)  # 標題列
+            previous = reader.line_num
+            for row in reader:
+                if row:
+                    line_numbers.append(previous + 1)
+                previous = reader.line_num
+        finally:
+            text.detach()
+            self.file_obj.seek(0)
+        return line_numbers
+
+    def _has_blank_lines(self, chunk_size=4 << 20):
+        """以位元組搜尋連續的換行 (不解析 CSV)，一百萬列的檔案也只需要幾毫秒"""
+        pattern = re.compile(rb'\n\r?\n')
+        tail = b''
+        try:
+            while True:
+                chunk = self.file_obj.read(chunk_size)
+                if not chunk:
+                    return False
+                # 保留上一塊的結尾，避免換行剛好被切在兩塊之間
+                if pattern.search(tail + chunk):
+                    return True
+                tail = chunk[-2:]
+        finally:
+            self.file_obj.seek(0)
+
+    def _records(self, names):
+        """依序產生 {檔案中的欄位名稱: 值} (空值為 None)"""
+        if self.extension == '.parquet':
+            parquet_file = pq.ParquetFile(self.file_obj)
+            for record_batch in parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=names):
+                yield from record_batch.to_pylist()
+            return
+
+        if pa is not None:
+            # 全部以字串讀入 (電話的開頭 0 不會被當成數字去掉)，數值由匯入函式轉換
+            reader = pa_csv.open_csv(
+                self.file_obj,
+                read_options=pa_csv.ReadOptions(block_size=4 << 20),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types={name: pa.string() for name in names},
+                    include_columns=names,
+                    strings_can_be_null=True,
+                ),
+            )
+            for record_batch in reader:
+                yield from record_batch.to_pylist()
+            return
+
+        for chunk in pd.read_csv(self.file_obj, usecols=names, dtype=str, encoding='utf-8-sig', chunksize=BATCH_SIZE):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            yield from chunk.to_dict('records')
+
+    def close(self):
+        pass
+
+
+def open_source(file_obj, filename, dataset=None):
+    """
+    依副檔名建立資料來源
+
+    Args:
+        file_obj: 已開啟的檔案 (binary 模式)
+        filename (str): 原始檔名，用來判斷格式
+        dataset (str): CSV / Parquet 所屬的資料集，None 表示由欄位判斷
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in EXCEL_EXTENSIONS:
+        return ExcelSource(file_obj)
+    if extension in TABULAR_EXTENSIONS:
+        return TabularSource(file_obj, extension, dataset=dataset)
+    raise ImportSourceError(f'不支援的檔案格式: {extension or filename}')
+
+
+def _import_people(batches, model, update_fields, checkpoint=None):
+    """仲介 / 買家 共用的匯入邏輯 (以姓名判斷新增或更新)"""
+    if checkpoint is not None:
+        batches = checkpoint.pending(batches)
+    for batch in batches:
+        with transaction.atomic():
+            to_create = []
+            to_update = []
+            batch_names = [row['name'] for _, row in batch if row.get('name')]
+            existing = {obj.name: obj for obj in model.objects.filter(name__in=batch_names)}
+
+            for _, row in batch:
+                name = row.get('name')
+                if not name: continue
+                clean_data = {k: (str(v).strip() if v is not None else None) for k, v in row.items()}
+                if name in existing:
+                    obj = existing[name]
+                    for key, value in clean_data.items():
+                        setattr(obj, key, value)
+                    to_update.append(obj)
+                else:
+                    to_create.append(model(**clean_data))
+
+            if to_create:
+                model.objects.bulk_create(to_create, ignore_conflicts=True)
+            if to_update:
+                model.objects.bulk_update(to_update, update_fields)
+            if checkpoint is not None:
+                checkpoint.commit()
+        # bulk_create / bulk_update 不會觸發 signal，回報筆數 (匯入任務中會合併成一則摘要)
+        record_bulk_change(model, 'create', len(to_create))
+        record_bulk_change(model, 'update', len(to_update))
+
+
+def import_agents(batches, checkpoint=None):
+    _import_people(batches, Agent, ['phone', 'email', 'company', 'branch', 'city', 'town'], checkpoint)
+
+
+def import_buyers(batches, checkpoint=None):
+    _import_people(batches, Buyer, ['phone', 'email'], checkpoint)
+
+
+ALL_HOUSE_FIELDS = [
+    'city', 'town', 'house_type', 'address',
+    'floor_number', 'land_area', 'total_floors',
+    'floor_area', 'room_count', 'total_price',
+    'unit_price', 'longitude', 'latitude',
+    'house_age', 'sold_time'
+]
+HOUSE_UPDATE_FIELDS = [
+    'city', 'town', 'house_type',
+    'floor_number', 'land_area', 'total_floors',
+    'floor_area', 'room_count', 'total_price',
+    'unit_price', 'longitude', 'latitude',
+    'house_age', 'sold_time', 'agent', 'buyers', 'updated_at'
+]
+HOUSE_UNIQUE_FIELDS = ['address']
+TEXT_FIELDS = ['city', 'town', 'house_type', 'address']
+DECIMAL_2DP_FIELDS = ['house_age', 'floor_area', 'land_area', 'unit_price']
+DECIMAL_12DP_FIELDS = ['longitude', 'latitude']
+INTEGER_FIELDS = ['floor_number', 'total_floors', 'room_count', 'total_price']
+
+# 錯誤報告最多列出的筆數，其餘只回報數量
+MAX_REPORTED_ERRORS = 200
+
+
+class ImportErrorReport:
+    """
+    收集整個匯入過程的錯誤 (第幾行、什麼錯)，最後一次回報，
+    使用者不必每修正一個錯誤就重新上傳一次
+    """
+    def __init__(self, limit=MAX_REPORTED_ERRORS):
+        self.limit = limit
+        self.errors = []
+        self.total = 0
+
+    def __bool__(self):
+        return self.total > 0
+
+    def extend(self, errors):
+        self.total += len(errors)
+        room = self.limit - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+    def raise_if_any(self):
+        """有錯誤時丟出 ValidationError (messages 為每一行的錯誤，依行號排序)"""
+        if not self:
+            return
+        messages = [message for _, message in sorted(self.errors, key=lambda error: error[0])]
+        if self.total > len(messages):
+            messages.append(f'另有 {self.total - len(messages)} 個錯誤未列出')
+        raise ValidationError(messages)
+
+
+class _NameCache:
+    """依每一批用到的姓名查詢 仲介 / 買家 並快取 (同名時取 id 最大者)"""
+    def __init__(self, model):
+        self.model = model
+        self.objects = {}
+        self.checked = set()
+
+    def load(self, names):
+        names = {name for name in names if name is not None} - self.checked
+        if names:
+            for obj in self.model.objects.filter(name__in=names).order_by('id'):
+                self.objects[obj.name] = obj
+            self.checked |= names
+        return self.objects
+
+
+def _to_python(series):
+    """轉成 Python 原生型別，空值為 None (資料庫驅動程式不接受 numpy 型別與 NaN)"""
+    series = series.astype(object)
+    return series.where(series.notna(), None)
+
+
+def validate_house_batch(batch, agents, buyers):
+    """
+    以欄為單位 (column-wise) 驗證並轉換一批房屋資料，取代逐格的 Decimal / int / split
+
+    Args:
+        batch: [(行號, {欄位: 值}), ...]
+        agents / buyers (_NameCache): 仲介 / 買家 姓名快取
+
+    Returns:
+        tuple: (通過驗證的 DataFrame (index 為行號，值為 Python 型別), [(行號, 錯誤訊息), ...])
+    """
+    columns = ALL_HOUSE_FIELDS + ['agent_name', 'buyer_name']
+    frame = pd.DataFrame.from_records([row for _, row in batch], columns=columns)
+    frame.index = [row_number for row_number, _ in batch]
+    errors = []
+
+    # 文字欄位
+    for field in TEXT_FIELDS:
+        column = frame[field]
+        frame[field] = column.where(column.isna(), column.astype(str))
+    missing_address = frame['address'].isna() | (frame['address'].str.strip() == '')
+    for row_number in frame.index[missing_address]:
+        errors.append((row_number, f'第 {row_number} 行: 地址為必填'))
+
+    # 數值欄位：無法轉換的值 (非空但轉換後為 NaN) 就是格式錯誤
+    numeric_fields = [(field, 2) for field in DECIMAL_2DP_FIELDS] + [(field, 12) for field in DECIMAL_12DP_FIELDS] + [(field, None) for field in INTEGER_FIELDS]
+    for field, decimals in numeric_fields:
+        raw = frame[field]
+        values = pd.to_numeric(raw, errors='coerce')
+        invalid = raw.notna() & values.isna()
+        for row_number, value in raw[invalid].items():
+            errors.append((row_number, f'第 {row_number} 行: 欄位 {field} 格式錯誤 ({value})'))
+        if decimals is None:
+            frame[field] = _to_python(np.trunc(values).astype('Int64'))
+        else:
+            frame[field] = _to_python(values.round(decimals))
+
+    # 出售日期
+    raw = frame['sold_time']
+    dates = pd.to_datetime(raw, errors='coerce', format='mixed')
+    invalid = raw.notna() & dates.isna()
+    for row_number, value in raw[invalid].items():
+        errors.append((row_number, f'第 {row_number} 行: 欄位 sold_time 格式錯誤 ({value})'))
+    frame['sold_time'] = _to_python(dates.dt.date)
+
+    # 仲介 / 買家 必須已存在
+    for field, cache, label in (('agent_name', agents, '仲介'), ('buyer_name', buyers, '買家')):
+        names = frame[field].where(frame[field].isna(), frame[field].astype(str))
+        frame[field] = _to_python(names)
+        known = cache.load(names.dropna().unique())
+        missing = ~names.isin(list(known))
+        for row_number, name in names[missing].items():
+            errors.append((row_number, f'第 {row_number} 行: 找不到{label} "{name}"'))
+
+    bad_rows = {row_number for row_number, _ in errors}
+    if bad_rows:
+        frame = frame[~frame.index.isin(bad_rows)]
+    return frame, errors
+
+
+def validated_house_frames(batches, report, cities):
+    """
+    驗證每一批，產生通過驗證的 DataFrame；
+    出現錯誤後不再產生資料 (不再寫入)，但仍繼續驗證剩下的資料，把所有錯誤一次收集完
+    """
+    agents = _NameCache(Agent)
+    buyers = _NameCache(Buyer)
+    for batch in batches:
+        frame, errors = validate_house_batch(batch, agents, buyers)
+        report.extend(errors)
+        cities.update(frame['city'].dropna().unique())
+        if not report:
+            yield frame
+
+
+def import_houses(batches, checkpoint=None):
+    """
+    驗證並匯入房屋 (單一 process)，回傳出現過的縣市 (讓呼叫端重建空間索引)
+
+    資料有錯誤時丟出 ValidationError，messages 包含所有錯誤的行號與原因；
+    傳入 checkpoint (BatchCheckpoint) 時略過已寫入的批次，每寫入一批就更新檢查點
+    """
+    cities = set()
+    report = ImportErrorReport()
+    if checkpoint is not None:
+        batches = checkpoint.pending(batches)
+    write_houses(validated_house_frames(batches, report, cities), checkpoint)
+    report.raise_if_any()
+    return cities
+
+
+def write_houses(frames, checkpoint=None):
+    """
+    寫入驗證過的房屋資料：PostgreSQL 使用 COPY 快速路徑 (copy_houses)，其他資料庫 (SQLite) 逐批 upsert，
+    兩者都是每一批一個交易
+    """
+    if connection.vendor == 'postgresql' and settings.HOUSE_IMPORT_USE_COPY:
+        copy_houses(frames, checkpoint)
+    else:
+        upsert_houses(frames, checkpoint)
+
+
+def upsert_houses(frames, checkpoint=None):
+    """
+    逐批寫入房屋 (以地址 upsert)
+
+    地址有唯一限制 (house_address_uniq)，每一批直接 bulk_create(update_conflicts=True)，
+    PostgreSQL / SQLite 都是一條 INSERT ... ON CONFLICT (address) DO UPDATE，
+    不需要先查詢既有的房屋，也不會產生 bulk_update 的大型 CASE WHEN。
+    出現錯誤之前的批次已寫入 (與原本逐批提交相同)
+    """
+    agents = _NameCache(Agent)
+    buyers = _NameCache(Buyer)
+
+    for frame in frames:
+        agent_objects = agents.load(frame['agent_name'].unique())
+        buyer_objects = buyers.load(frame['buyer_name'].unique())
+
+        # 同一批出現相同地址時以最後一列為準 (同一條 INSERT 不能更新同一列兩次)
+        houses = {}
+        for row in frame.to_dict('records'):
+            agent = agent_objects[row.pop('agent_name')]
+            buyer = buyer_objects[row.pop('buyer_name')]
+            houses[row['address']] = House(agent=agent, buyers=buyer, **row)
+
+        with transaction.atomic():
+            if houses:
+                House.objects.bulk_create(
+                    houses.values(),
+                    update_conflicts=True,
+                    unique_fields=HOUSE_UNIQUE_FIELDS,
+                    update_fields=HOUSE_UPDATE_FIELDS,
+                )
+            # 檢查點與這一批資料在同一個交易中提交
+            if checkpoint is not None:
+                checkpoint.commit()
+        record_bulk_change(House, 'upsert', len(houses))
+
+
+# ===== 分割 (partition)：讓多個 worker 平行寫入 =====
+PARTITION_COLUMNS = ALL_HOUSE_FIELDS + ['agent_name', 'buyer_name']
+
+
+def partition_house_frames(frames, partitions):
+    """
+    把驗證過的資料依地址雜湊分成 partitions 份，寫入本機暫存 CSV (邊讀邊寫，不佔記憶體)
+
+    同一個地址一定落在同一份，各份的地址互不重疊，平行 upsert 不會互相覆蓋；
+    份內保留原本的順序，重複地址仍以最後一列為準
+
+    Returns:
+        list: [(暫存檔路徑, 列數), ...]，呼叫端負責刪除
+    """
+    files = [
+        tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', suffix='.csv', delete=False)
+        for _ in range(partitions)
+    ]
+    counts = [0] * partitions
+    try:
+        for frame in frames:
+            keys = pd.util.hash_array(frame['address'].to_numpy(dtype=object)) % partitions
+            for key, part in frame.groupby(keys, sort=False):
+                part[PARTITION_COLUMNS].to_csv(
+                    files[key], header=counts[key] == 0, index=True, index_label='row_number'
+                )
+                counts[key] += len(part)
+    except BaseException:
+        for f in files:
+            f.close()
+            os.remove(f.name)
+        raise
+    for f in files:
+        f.close()
+    return [(f.name, count) for f, count in zip(files, counts)]
+
+
+def read_house_partition(file_obj, batch_size=BATCH_SIZE):
+    """讀回 partition_house_frames 寫出的檔案，逐批產生與驗證結果相同格式的 DataFrame"""
+    text_columns = TEXT_FIELDS + ['agent_name', 'buyer_name', 'sold_time']
+    chunks = pd.read_csv(
+        file_obj, index_col='row_number', dtype={column: str for column in text_columns},
+        keep_default_na=False, na_values=[''], encoding='utf-8', chunksize=batch_size,
+    )
+    for chunk in chunks:
+        for column in PARTITION_COLUMNS:
+            values = chunk[column].astype('Int64') if column in INTEGER_FIELDS else chunk[column]
+            chunk[column] = _to_python(values)
+        yield chunk
+
+
+# ===== PostgreSQL COPY 快速路徑 =====
+HOUSE_STAGING_TABLE = 'house_import_staging'
+
+
+class _CopyStream(io.TextIOBase):
+    """把逐列產生的 CSV 文字包成 file-like 物件，讓 copy_expert 邊讀邊送，不必先組成整個檔案"""
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+def _staging_rows(frames):
+    """
+    把驗證過的每一批轉成 COPY 的 CSV 文字 (一批一段)
+    仲介 / 買家只寫入姓名，外鍵在合併時以 SQL 對應
+    """
+    for frame in frames:
+        # 空值寫成未加引號的空欄位，COPY (FORMAT csv) 會當成 NULL
+        buffer = io.StringIO()
+        frame[PARTITION_COLUMNS].to_csv(buffer, header=False, index=True, date_format='%Y-%m-%d')
+        yield buffer.getvalue()
+
+
+def copy_houses(frames, checkpoint=None):
+    """
+    PostgreSQL 專用：每一批以 COPY FROM STDIN 寫入暫存表，
+    再用一條 INSERT ... SELECT ... ON CONFLICT (address) DO UPDATE 合併進 house_house，
+    仲介 / 買家的外鍵在同一條 SQL 中以姓名對應 (同名時取 id 最大者)
+
+    每一批在自己的交易中合併並更新檢查點 (與 upsert_houses 相同)，
+    worker 重啟後可從最後提交的批次繼續；出現錯誤之前的批次已寫入
+    """
+    field_types = ', '.join(
+        f'{field} {House._meta.get_field(field).db_type(connection)}' for field in ALL_HOUSE_FIELDS
+    )
+    staging_columns = ', '.join(['row_number'] + PARTITION_COLUMNS)
+    agent_column = House._meta.get_field('agent').column
+    buyer_column = House._meta.get_field('buyers').column
+    insert_columns = ', '.join(ALL_HOUSE_FIELDS + [agent_column, buyer_column, 'created_at', 'updated_at'])
+    select_columns = ', '.join([f's.{field}' for field in ALL_HOUSE_FIELDS] + ['a.id', 'b.id', 'now()', 'now()'])
+    update_columns = ', '.join(
+        f'{column} = EXCLUDED.{column}'
+        for column in [field for field in ALL_HOUSE_FIELDS if field != 'address'] + [agent_column, buyer_column, 'updated_at']
+    )
+    house_table = House._meta.db_table
+    agent_table = Agent._meta.db_table
+    buyer_table = Buyer._meta.db_table
+
+    for frame in frames:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {HOUSE_STAGING_TABLE} '
+                f'(row_number integer, {field_types}, agent_name text, buyer_name text) ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY {HOUSE_STAGING_TABLE} ({staging_columns}) FROM STDIN WITH (FORMAT csv)',
+                _CopyStream(_staging_rows([frame])),
+            )
+            # 同一個地址出現多次時以最後一列為準 (同一條 INSERT 不能更新同一列兩次)
+            cursor.execute(
+                f'INSERT INTO {house_table} ({insert_columns}) '
+                f'SELECT DISTINCT ON (s.address) {select_columns} '
+                f'FROM {HOUSE_STAGING_TABLE} s '
+                f'JOIN (SELECT DISTINCT ON (name) name, id FROM {agent_table} ORDER BY name, id DESC) a ON a.name = s.agent_name '
+                f'JOIN (SELECT DISTINCT ON (name) name, id FROM {buyer_table} ORDER BY name, id DESC) b ON b.name = s.buyer_name '
+                f'ORDER BY s.address, s.row_number DESC '
+                f'ON CONFLICT (address) DO UPDATE SET {update_columns}'
+            )
+            merged = cursor.rowcount
+            # 外層若還有交易，ON COMMIT DROP 要等到外層提交才生效，這裡直接刪除
+            cursor.execute(f'DROP TABLE {HOUSE_STAGING_TABLE}')
+            # 檢查點與這一批資料在同一個交易中提交
+            if checkpoint is not None:
+                checkpoint.commit()
+        record_bulk_change(House, 'upsert', max(merged, 0))
@@ -0,0 +1,86 @@
+"""
+合併地址重複的房屋資料 (加上 house_address_uniq 唯一限制之前執行)
+
+每個重複的地址保留「資料最完整」的一筆 (有值的欄位最多，同分時取 id 最大者)，其餘刪除。
+請先以 --dry-run 確認要刪除的資料，並以 --backup 把刪除的資料另存成 fixture (可用 loaddata 還原)。
+
+使用方式:
+    python manage.py dedupe_house_addresses --dry-run
+    python manage.py dedupe_house_addresses --backup house_duplicates.json
+"""
+from django.core import serializers
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from apps.house.models import House
+from apps.house.signals import coalesce_signals
+
+# 計算完整度時不列入的欄位 (一定有值)
+IGNORED_FIELDS = {'id', 'address', 'created_at', 'updated_at'}
+
+
+def completeness(house):
+    """有值的欄位數"""
+    return sum(
+        getattr(house, field.attname) not in (None, '')
+        for field in house._meta.concrete_fields
+        if field.name not in IGNORED_FIELDS
+    )
+
+
+def choose_keeper(houses):
+    """同一個地址的多筆資料中，保留資料最完整的一筆 (同分時取 id 最大者)"""
+    return max(houses, key=lambda house: (completeness(house), house.pk))
+
+
+def duplicate_addresses():
+    return list(
+        House.objects.values('address')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('address', flat=True)
+    )
+
+
+class Command(BaseCommand):
+    help = '合併地址重複的房屋資料，每個地址保留資料最完整的一筆'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只列出要保留 / 刪除的資料，不實際刪除')
+        parser.add_argument('--backup', help='把要刪除的資料另存成 JSON fixture (可用 loaddata 還原)')
+
+    def handle(self, *args, **options):
+        addresses = duplicate_addresses()
+        if not addresses:
+            self.stdout.write(self.style.SUCCESS('沒有地址重複的房屋資料'))
+            return
+
+        to_delete = []
+        for address in addresses:
+            houses = list(House.objects.filter(address=address))
+            keeper = choose_keeper(houses)
+            removed = [house for house in houses if house.pk != keeper.pk]
+            to_delete.extend(removed)
+            self.stdout.write(
+                f'{address}: 保留 #{keeper.pk}，刪除 {", ".join(f"#{house.pk}" for house in removed)}'
+            )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'[dry-run] {len(addresses)} 個地址重複，共 {len(to_delete)} 筆將被刪除 (未實際刪除)'
+            ))
+            return
+
+        if options['backup']:
+            with open(options['backup'], 'w', encoding='utf-8') as f:
+                serializers.serialize('json', to_delete, stream=f, ensure_ascii=False)
+            self.stdout.write(f'已備份要刪除的資料至 {options["backup"]}')
+
+        # 列表頁只收到一則摘要通知
+        with transaction.atomic(), coalesce_signals():
+            House.objects.filter(pk__in=[house.pk for house in to_delete]).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已合併 {len(addresses)} 個重複地址，刪除 {len(to_delete)} 筆'
+        ))
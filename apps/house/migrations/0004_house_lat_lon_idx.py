@@ -0,0 +1,17 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('house', '0003_alter_house_options_alter_house_agent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='house',
+            index=models.Index(fields=['latitude', 'longitude'], name='house_lat_lon_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.9 on 2026-10-17 11:57
+
+from django.db import migrations, models
+from django.db.models import Count
+
+# 錯誤訊息最多列出幾個重複的地址
+MAX_LISTED_ADDRESSES = 20
+
+
+def check_duplicate_addresses(apps, schema_editor):
+    """
+    加上唯一限制前確認沒有重複的地址
+
+    不在 migration 中自動刪除資料：有重複時直接失敗並列出地址，
+    請先執行 python manage.py dedupe_house_addresses --dry-run 確認後再合併
+    """
+    House = apps.get_model('house', 'House')
+    duplicates = list(
+        House.objects.values('address')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by('address')
+        .values_list('address', 'total')
+    )
+    if not duplicates:
+        return
+
+    listed = '\n'.join(f'  {address} ({total} 筆)' for address, total in duplicates[:MAX_LISTED_ADDRESSES])
+    if len(duplicates) > MAX_LISTED_ADDRESSES:
+        listed += f'\n  …另有 {len(duplicates) - MAX_LISTED_ADDRESSES} 個地址'
+    raise RuntimeError(
+        f'有 {len(duplicates)} 個地址重複，無法加上 house_address_uniq 唯一限制：\n{listed}\n'
+        '請先執行 python manage.py dedupe_house_addresses --dry-run 確認，'
+        '再執行 python manage.py dedupe_house_addresses --backup <檔案> 合併後重新 migrate。'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('house', '0004_house_lat_lon_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_addresses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='house',
+            constraint=models.UniqueConstraint(fields=('address',), name='house_address_uniq', violation_error_message='此地址的房屋資料已存在。'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.9 on 2026-10-17 12:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('house', '0005_house_address_uniq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='檔案 SHA-256')),
+                ('filename', models.CharField(blank=True, max_length=255, verbose_name='檔名')),
+                ('dataset', models.CharField(blank=True, max_length=20, verbose_name='資料集')),
+                ('status', models.CharField(choices=[('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗')], default='running', max_length=20, verbose_name='狀態')),
+                ('task_id', models.CharField(blank=True, max_length=255, verbose_name='Celery 任務 ID')),
+                ('error', models.TextField(blank=True, verbose_name='錯誤訊息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='建立時間')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='import_jobs', to=settings.AUTH_USER_MODEL, verbose_name='上傳者')),
+            ],
+            options={
+                'verbose_name': '資料匯入工作',
+                'verbose_name_plural': '資料匯入工作',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=50, verbose_name='資料集')),
+                ('batches_done', models.PositiveIntegerField(default=0, verbose_name='已完成批次')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新時間')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='house.importjob', verbose_name='匯入工作')),
+            ],
+            options={
+                'verbose_name': '匯入檢查點',
+                'verbose_name_plural': '匯入檢查點',
+                'constraints': [models.UniqueConstraint(fields=('job', 'key'), name='import_checkpoint_job_key_uniq')],
+            },
+        ),
+    ]
@@ -2,5 +2,6 @@ from .house import House
 # from .house_detail import HouseDetail  # 已整合到 House
 from .agent import Agent
 from .buyer import Buyer
+from .import_job import ImportJob, ImportCheckpoint
 
-__all__ = ['House', 'Agent', 'Buyer']
+__all__ = ['House', 'Agent', 'Buyer', 'ImportJob', 'ImportCheckpoint']
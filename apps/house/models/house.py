@@ -122,6 +122,17 @@ class House(models.Model):
         verbose_name = '房屋資訊'
         verbose_name_plural = '房屋資訊'
         ordering = ['-created_at', '-id']
+        indexes = [
+            # 周邊實價搜尋以經緯度範圍 (bounding box) 預先篩選
+            models.Index(fields=['latitude', 'longitude'], name='house_lat_lon_idx'),
+        ]
+        constraints = [
+            # 地址是房屋的自然鍵，匯入時以地址做 upsert (ON CONFLICT DO UPDATE)
+            models.UniqueConstraint(
+                fields=['address'], name='house_address_uniq',
+                violation_error_message='此地址的房屋資料已存在。',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.address} - {self.house_type}"
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import models, transaction
+
+
+class ImportJob(models.Model):
+    """
+    資料匯入工作 (可續傳)
+
+    以暫存檔的 SHA-256 識別同一份檔案：任務重試、worker 重啟後重新投遞，
+    或使用者重新上傳同一份檔案時，沿用尚未完成的工作，已寫入的批次直接略過。
+    """
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, '執行中'),
+        (STATUS_SUCCEEDED, '已完成'),
+        (STATUS_FAILED, '失敗'),
+    ]
+
+    sha256 = models.CharField(max_length=64, db_index=True, verbose_name='檔案 SHA-256')
+    filename = models.CharField(max_length=255, blank=True, verbose_name='檔名')
+    dataset = models.CharField(max_length=20, blank=True, verbose_name='資料集')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='import_jobs',
+        verbose_name='上傳者'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING, verbose_name='狀態')
+    task_id = models.CharField(max_length=255, blank=True, verbose_name='Celery 任務 ID')
+    error = models.TextField(blank=True, verbose_name='錯誤訊息')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='建立時間')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+
+    class Meta:
+        verbose_name = '資料匯入工作'
+        verbose_name_plural = '資料匯入工作'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename or self.sha256[:12]} ({self.get_status_display()})"
+
+    @classmethod
+    def resume_or_create(cls, upload, user_id=None, dataset=None, task_id=''):
+        """取得同一份檔案尚未完成的工作 (續傳)，沒有則建立新的"""
+        with transaction.atomic():
+            job = (
+                cls.objects.select_for_update()
+                .filter(sha256=upload['sha256'], dataset=dataset or '')
+                .exclude(status=cls.STATUS_SUCCEEDED)
+                .order_by('-created_at')
+                .first()
+            )
+            if job is None:
+                return cls.objects.create(
+                    sha256=upload['sha256'], filename=upload.get('filename', ''),
+                    dataset=dataset or '', user_id=user_id, task_id=task_id or '',
+                )
+            job.status = cls.STATUS_RUNNING
+            job.task_id = task_id or job.task_id
+            job.error = ''
+            job.save(update_fields=['status', 'task_id', 'error', 'updated_at'])
+            return job
+
+    def mark(self, status, error=''):
+        self.status = status
+        self.error = error
+        self.save(update_fields=['status', 'error', 'updated_at'])
+
+    def checkpoint(self, key):
+        """取得某個資料集 (或房屋分割) 的批次檢查點"""
+        return BatchCheckpoint(self, key)
+
+
+class ImportCheckpoint(models.Model):
+    """
+    匯入工作中，某個資料集已寫入的批次數
+
+    每個資料集 (仲介 / 買家 / 房屋，或房屋的某一份分割) 一列，
+    與該批資料在同一個交易中更新，不會出現「資料已寫入但檢查點沒更新」的情況
+    """
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='checkpoints', verbose_name='匯入工作')
+    key = models.CharField(max_length=50, verbose_name='資料集')
+    batches_done = models.PositiveIntegerField(default=0, verbose_name='已完成批次')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新時間')
+
+    class Meta:
+        verbose_name = '匯入檢查點'
+        verbose_name_plural = '匯入檢查點'
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'key'], name='import_checkpoint_job_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.batches_done}"
+
+
+class BatchCheckpoint:
+    """
+    批次檢查點
+
+    pending() 包裝批次產生器，略過已完成的批次 (仍需讀過，但不驗證也不寫入)；
+    寫入程式在每一批的交易內呼叫 commit()，記錄目前讀到的位置
+    """
+    def __init__(self, job, key):
+        self.job = job
+        self.key = key
+        self.done = (
+            ImportCheckpoint.objects.filter(job=job, key=key)
+            .values_list('batches_done', flat=True).first() or 0
+        )
+        self.position = 0
+        self.skipped = 0
+
+    def pending(self, batches):
+        for batch in batches:
+            self.position += 1
+            if self.position <= self.done:
+                self.skipped += 1
+                continue
+            yield batch
+
+    def commit(self):
+        """在寫入該批資料的交易中呼叫"""
+        if self.position <= self.done:
+            return
+        self.done = self.position
+        ImportCheckpoint.objects.update_or_create(
+            job=self.job, key=self.key, defaults={'batches_done': self.done}
+        )
@@ -0,0 +1,112 @@
+# apps/house/notifications.py
+"""
+列表頁 WebSocket 通知的背景派送
+
+signal 在交易提交後只把通知放進 process 內的佇列就返回，存檔的請求不必等待 channel layer (Redis) 來回；
+背景執行緒一次取出一批 (最多 SIGNAL_NOTIFY_BATCH_SIZE 則)，在同一個 event loop 中依序送出，
+Redis 連線也能沿用，不必每則通知都重新建立。
+需要查詢資料庫的部分 (渲染列表的單列) 也在背景執行緒中進行，每批結束後關閉這個執行緒的資料庫連線。
+"""
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+
+from celery.signals import worker_process_shutdown
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """
+    process 內的通知佇列 + 背景執行緒
+
+    執行緒在第一次 enqueue 時才啟動；fork 出來的子 process (gunicorn / Celery prefork)
+    沒有父 process 的執行緒，會在子 process 中重新建立佇列與執行緒
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.thread = None
+
+    def _running(self):
+        return self.pid == os.getpid() and self.thread is not None and self.thread.is_alive()
+
+    def _ensure_thread(self):
+        if self._running():
+            return
+        with self.lock:
+            if self._running():
+                return
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='signal-notifications', daemon=True)
+            self.thread.start()
+
+    def enqueue(self, group_name, event, delta=None):
+        """
+        放進佇列後立即返回
+        delta (可呼叫物件) 在背景執行緒中呼叫，回傳的欄位會附加到事件上
+        """
+        self._ensure_thread()
+        self.queue.put((group_name, event, delta))
+
+    def flush(self):
+        """等待佇列中的通知全部送出 (測試、process 結束前)"""
+        if self._running():
+            self.queue.join()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < settings.SIGNAL_NOTIFY_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                events = [(group_name, self._prepare(event, delta)) for group_name, event, delta in batch]
+                loop.run_until_complete(self._send(events))
+            finally:
+                if any(delta is not None for _, _, delta in batch):
+                    connections.close_all()
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _prepare(self, event, delta):
+        if delta is None:
+            return event
+        try:
+            return {**event, **delta()}
+        except Exception as e:
+            logger.warning('無法產生通知內容 (%s): %s', event.get('type'), e)
+            return event
+
+    async def _send(self, batch):
+        channel_layer = get_channel_layer()
+        for group_name, event in batch:
+            try:
+                await channel_layer.group_send(group_name, event)
+                logger.debug('WebSocket 通知已發送 -> Group: %s, Action: %s', group_name, event.get('action'))
+            except Exception as e:
+                logger.warning('WebSocket 通知發送失敗 (%s): %s', group_name, e)
+
+
+dispatcher = NotificationDispatcher()
+
+# process 正常結束前把還沒送出的通知送完
+atexit.register(dispatcher.flush)
+
+
+@worker_process_shutdown.connect
+def flush_on_worker_shutdown(**kwargs):
+    """Celery prefork 的子 process 以 os._exit 結束，不會執行 atexit，在這裡送完佇列中的通知"""
+    dispatcher.flush()
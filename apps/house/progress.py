@@ -0,0 +1,112 @@
+# apps/house/progress.py
+"""
+匯入進度回報
+
+每處理完一批就呼叫 advance()，但實際送出的頻率有上限 (IMPORT_PROGRESS_INTERVAL 秒一次)，
+20 萬列的檔案也只會送出少量訊息，不會灌爆 Redis。進度同時送到三個地方：
+    1. WebSocket (NotificationConsumer.task_message，status='progress')
+    2. Celery task meta (update_state，TaskStatusView 輪詢時可以讀到)
+    3. 任務事件 (task_events，SSE 串流)
+"""
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from apps.core.task_events import publish_task_event
+
+
+class ImportProgress:
+    """
+    節流 (throttle) 的匯入進度
+
+    Args:
+        task: 目前執行的 Celery 任務 (bind=True 的 self)
+        user_id (int): 上傳者，進度推播到 user_<id> 群組
+        label (str): 訊息前綴，例如分割任務的「第 2 / 4 份」
+    """
+    def __init__(self, task, user_id, label=''):
+        self.task = task
+        self.user_id = user_id
+        self.label = label
+        self.interval = settings.IMPORT_PROGRESS_INTERVAL
+        self.sheet = None
+        self.total = None
+        self.processed = 0
+        self.started_at = None
+        self.last_sent = 0.0
+
+    def start(self, sheet, total=None):
+        """開始處理一個資料集 (工作表)，total 未知時為 None (不計算 ETA)"""
+        self.sheet = sheet
+        self.total = total
+        self.processed = 0
+        self.started_at = time.monotonic()
+        self.emit()
+
+    def advance(self, rows):
+        self.processed += rows
+        if time.monotonic() - self.last_sent >= self.interval:
+            self.emit()
+
+    def track(self, sheet, batches, total=None):
+        """包裝批次產生器：每產生一批就累計進度，整個資料集結束時一定送出最後一次"""
+        self.start(sheet, total)
+        for batch in batches:
+            yield batch
+            self.advance(len(batch))
+        self.emit()
+
+    def snapshot(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        rows_per_second = self.processed / elapsed
+        eta_seconds = None
+        if self.total and rows_per_second > 0:
+            eta_seconds = round(max(self.total - self.processed, 0) / rows_per_second, 1)
+        return {
+            'sheet': self.sheet,
+            'processed': self.processed,
+            'total': self.total,
+            'rows_per_second': round(rows_per_second, 1),
+            'eta_seconds': eta_seconds,
+        }
+
+    def message(self, progress):
+        text = f"{self.label}正在處理「{progress['sheet']}」：已完成 {progress['processed']:,}"
+        if progress['total']:
+            text += f" / {progress['total']:,} 列"
+        else:
+            text += ' 列'
+        if progress['eta_seconds'] is not None and progress['processed']:
+            text += f"，預計還需 {int(progress['eta_seconds'])} 秒"
+        return text
+
+    def emit(self):
+        self.last_sent = time.monotonic()
+        progress = self.snapshot()
+        message = self.message(progress)
+        task_id = self.task.request.id
+
+        # eager 模式 (測試) 沒有 result backend 可以寫入
+        if task_id and not self.task.request.is_eager:
+            try:
+                self.task.update_state(state='PROGRESS', meta={**progress, 'message': message})
+            except Exception as e:
+                print(f"⚠️ 無法更新任務進度: {e}")
+        publish_task_event(task_id, 'PROGRESS', progress=progress, message=message)
+
+        try:
+            async_to_sync(get_channel_layer().group_send)(
+                f"user_{self.user_id}",
+                {
+                    'type': 'task_message',
+                    'status': 'progress',
+                    'kind': 'import',
+                    'task_id': task_id,
+                    'message': message,
+                    'progress': progress,
+                }
+            )
+        except Exception as e:
+            print(f"⚠️ 無法推播匯入進度: {e}")
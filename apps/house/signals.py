@@ -5,13 +5,27 @@ Django Signal 處理 - 房屋資料變更時的自動處理
 1. 程式碼解耦：View 只管核心邏輯，通知由 Signal 處理
 2. 不會遺漏：任何地方修改 House 都會觸發
 3. 集中管理：所有「資料變更後要做的事」都在這裡
+
+大量操作 (後台批次刪除、資料匯入) 請包在 coalesce_signals() 中：
+區塊內每一筆的通知都先累計，離開區塊時每種資料只送出一次摘要 (「N 筆房屋新增 / 更新 / 刪除」)，
+快取也只清除一次，不會每一筆都來回 Redis 一次。
+
+所有副作用 (清除快取、WebSocket 通知) 都等交易提交後 (transaction.on_commit) 才執行，
+交易回復時什麼都不做；WebSocket 通知再交給背景執行緒批次送出 (見 notifications.py)。
 """
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.cache import cache
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.template.loader import render_to_string
 
+from apps.core.spatial import invalidate_city
+from .notifications import dispatcher
 from .models.house import House
 from .models.agent import Agent
 from .models.buyer import Buyer
@@ -78,57 +92,208 @@ from .models.buyer import Buyer
 #     notify_house_update('delete', f'房屋已下架：{instance.address}')
 
 # 【重構】通用通知函式
-def notify_update(group_name, event_type, action, message):
+def notify_update(group_name, event_type, action, message, delta=None, **extra):
     """
     通用 WebSocket 通知發送器
+
+    交易提交後才放進背景佇列，不會通知到被回復的異動，呼叫端也不必等待 channel layer；
+    delta (可呼叫物件) 由背景執行緒在送出前呼叫，回傳要附加到事件上的欄位 (例如渲染好的列)
     """
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        group_name,
-        {
-            'type': event_type,  # Consumer 中對應的方法名
-            'action': action,
-            'message': message,
-        }
-    )
-    print(f"[Signal] WebSocket 通知已發送 -> Group: {group_name}, Action: {action}")
+    event = {
+        'type': event_type,  # Consumer 中對應的方法名
+        'action': action,
+        'message': message,
+        **extra,
+    }
+    transaction.on_commit(lambda: dispatcher.enqueue(group_name, event, delta))
+
+
+def invalidate_house_caches(cities):
+    """
+    交易提交後清除房屋列表快取，並讓這些縣市的空間索引重建
+    (在提交的同一個請求內同步執行，下一個請求一定讀得到新資料)
+    """
+    cities = {city for city in cities if city}
+
+    def invalidate():
+        cache.delete('api_house_list')
+        for city in cities:
+            invalidate_city(city)
+
+    transaction.on_commit(invalidate)
+
+# 列表頁的單列範本：通知附上異動資料的 id 與渲染好的列，前端直接替換該列，不必重新載入整頁
+ROW_TEMPLATES = {
+    House: ('house/_house_table_row.html', 'house'),
+    Agent: ('house/_agent_table_row.html', 'agent'),
+    Buyer: ('house/_buyer_table_row.html', 'buyer'),
+}
+
+
+def row_delta(model, pk):
+    """
+    單筆異動的 delta：列表頁的單列 HTML
+
+    交易提交後由背景執行緒依 pk 重新讀取並渲染，不佔用存檔的請求，也不會渲染被回復的異動；
+    同一份 HTML 廣播給所有連線 (只有 staff 能連線)，不含 CSRF token (刪除時 sendRequest 會帶入頁面上的 token)，
+    列號由前端依頁碼重新編排。資料已被刪除時不附 HTML，前端改為提示重新整理
+    """
+    template_name, context_name = ROW_TEMPLATES[model]
+    queryset = model.objects.filter(pk=pk)
+    if model is House:
+        queryset = queryset.select_related('agent')
+    instance = queryset.first()
+    if instance is None:
+        return {}
+    return {'html': render_to_string(template_name, {context_name: instance})}
+
+
+# ================= 大量操作：合併通知 =================
+
+# 每種資料的通知群組、Consumer 方法名稱與顯示名稱
+NOTIFY_TARGETS = {
+    House: ('house_updates', 'house_update', '房屋'),
+    Agent: ('agent_updates', 'agent_update', '仲介'),
+    Buyer: ('buyer_updates', 'buyer_update', '買家'),
+}
+ACTION_LABELS = {'create': '新增', 'update': '更新', 'delete': '刪除', 'upsert': '匯入'}
+
+_local = threading.local()
+
+
+class SignalSummary:
+    """累計區塊內的資料變更 (每種資料、每種動作的筆數，以及受影響的縣市)"""
+    def __init__(self):
+        self.counts = Counter()
+        self.cities = set()
+
+    def record(self, model, action, count=1, cities=()):
+        if count:
+            self.counts[(model, action)] += count
+        self.cities.update(city for city in cities if city)
+
+    def flush(self):
+        """每種資料送出一則摘要通知；房屋有變更時清除一次列表快取，並重建受影響縣市的空間索引"""
+        if any(model is House for model, _ in self.counts):
+            invalidate_house_caches(self.cities)
+
+        for model, (group_name, event_type, label) in NOTIFY_TARGETS.items():
+            counts = {action: count for (changed, action), count in self.counts.items() if changed is model}
+            if not counts:
+                continue
+            parts = [f'{ACTION_LABELS.get(action, action)} {count} 筆' for action, count in counts.items()]
+            notify_update(group_name, event_type, 'bulk', f"{label}資料批次異動：{'、'.join(parts)}", counts=counts)
+
+
+def _active_summary():
+    return getattr(_local, 'summary', None)
+
+
+@contextmanager
+def coalesce_signals():
+    """
+    抑制區塊內每一筆資料的 signal 通知，離開區塊時送出一次摘要
+    可以當作 context manager (with coalesce_signals(): ...) 或 decorator (@coalesce_signals()) 使用；
+    巢狀使用時由最外層送出
+    """
+    if _active_summary() is not None:
+        yield _active_summary()
+        return
+
+    summary = _local.summary = SignalSummary()
+    try:
+        yield summary
+    finally:
+        _local.summary = None
+        summary.flush()
+
+
+def record_bulk_change(model, action, count, cities=()):
+    """
+    bulk_create / bulk_update / COPY 等不會觸發 signal 的大量寫入，由呼叫端回報異動筆數
+    在 coalesce_signals() 區塊內會併入摘要，區塊外則立即送出一則摘要
+    """
+    if not count:
+        return
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(model, action, count, cities)
+        return
+    summary = SignalSummary()
+    summary.record(model, action, count, cities)
+    summary.flush()
+
 
 # ================= House Signals =================
 
 @receiver(post_save, sender=House)
 def on_house_saved(sender, instance, created, **kwargs):
-    cache.delete('api_house_list')
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(House, 'create' if created else 'update', cities=[instance.city])
+        return
+    # 列表快取與該縣市的周邊實價空間索引需要重建
+    invalidate_house_caches([instance.city])
     msg = f'新屋上架：{instance.address}' if created else f'房屋已更新：{instance.address}'
     # 發送到 'house_updates' 群組，觸發 consumer 的 'house_update' 方法
-    notify_update('house_updates', 'house_update', 'create' if created else 'update', msg)
+    notify_update(
+        'house_updates', 'house_update', 'create' if created else 'update', msg,
+        id=instance.pk, delta=partial(row_delta, sender, instance.pk),
+    )
 
 @receiver(post_delete, sender=House)
 def on_house_deleted(sender, instance, **kwargs):
-    cache.delete('api_house_list')
-    notify_update('house_updates', 'house_update', 'delete', f'房屋已下架：{instance.address}')
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(House, 'delete', cities=[instance.city])
+        return
+    invalidate_house_caches([instance.city])
+    notify_update('house_updates', 'house_update', 'delete', f'房屋已下架：{instance.address}', id=instance.pk)
 
 
 # ================= Agent Signals (新增) =================
 
 @receiver(post_save, sender=Agent)
 def on_agent_saved(sender, instance, created, **kwargs):
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(Agent, 'create' if created else 'update')
+        return
     msg = f'新仲介加入：{instance.name}' if created else f'仲介資料更新：{instance.name}'
     # 發送到 'agent_updates' 群組
-    notify_update('agent_updates', 'agent_update', 'create' if created else 'update', msg)
+    notify_update(
+        'agent_updates', 'agent_update', 'create' if created else 'update', msg,
+        id=instance.pk, delta=partial(row_delta, sender, instance.pk),
+    )
 
 @receiver(post_delete, sender=Agent)
 def on_agent_deleted(sender, instance, **kwargs):
-    notify_update('agent_updates', 'agent_update', 'delete', f'仲介已移除：{instance.name}')
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(Agent, 'delete')
+        return
+    notify_update('agent_updates', 'agent_update', 'delete', f'仲介已移除：{instance.name}', id=instance.pk)
 
 
 # ================= Buyer Signals (新增) =================
 
 @receiver(post_save, sender=Buyer)
 def on_buyer_saved(sender, instance, created, **kwargs):
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(Buyer, 'create' if created else 'update')
+        return
     msg = f'新買家加入：{instance.name}' if created else f'買家資料更新：{instance.name}'
     # 發送到 'buyer_updates' 群組
-    notify_update('buyer_updates', 'buyer_update', 'create' if created else 'update', msg)
+    notify_update(
+        'buyer_updates', 'buyer_update', 'create' if created else 'update', msg,
+        id=instance.pk, delta=partial(row_delta, sender, instance.pk),
+    )
 
 @receiver(post_delete, sender=Buyer)
 def on_buyer_deleted(sender, instance, **kwargs):
-    notify_update('buyer_updates', 'buyer_update', 'delete', f'買家已移除：{instance.name}')
\ No newline at end of file
+    summary = _active_summary()
+    if summary is not None:
+        summary.record(Buyer, 'delete')
+        return
+    notify_update('buyer_updates', 'buyer_update', 'delete', f'買家已移除：{instance.name}', id=instance.pk)
\ No newline at end of file
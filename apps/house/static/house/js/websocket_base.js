@@ -14,8 +14,12 @@ function markAsMyUpdate() {
  * @param {string} endpointPath - WebSocket 的路徑
  * @param {string} targetType - 要監聽的事件類型
  * @param {string} labelName - 顯示在通知上的名稱
+ * @param {Object} [tableConfig] - 【新增】收到單筆異動時直接替換表格中的列
+ * @param {string} tableConfig.tableBodyId - 表格 tbody 的 ID
+ * @param {string} tableConfig.rowIdPrefix - 每一列 ID 的前綴 (例如 'house-row-')
+ * @param {number} [tableConfig.pageSize=10] - 每頁筆數 (與後端 Paginator 相同)
  */
-function setupWebSocket(endpointPath, targetType, labelName) {
+function setupWebSocket(endpointPath, targetType, labelName, tableConfig) {
     
     if (!document.getElementById('ws-toast-container')) {
         const container = document.createElement('div');
@@ -37,6 +41,9 @@ function setupWebSocket(endpointPath, targetType, labelName) {
         const data = JSON.parse(e.data);
         
         if (data.type === targetType) {
+            // 【新增】單筆異動直接替換這一頁的表格，不必重新載入整頁
+            const patched = patchTable(data);
+
             // 【關鍵修改】檢查是否為「我自己」觸發的更新
             if (shouldIgnoreUpdate()) {
                 console.log(`[WebSocket] 偵測到這是本機觸發的更新，已忽略通知。`);
@@ -44,7 +51,8 @@ function setupWebSocket(endpointPath, targetType, labelName) {
             }
 
             console.log(`[WebSocket] 收到更新:`, data.message);
-            showToast(data.message);
+            // 已替換的話只顯示通知；批次異動或不在這一頁的資料，維持原本的「點擊更新」
+            showToast(data.message, !patched);
         }
     };
 
@@ -67,8 +75,58 @@ function setupWebSocket(endpointPath, targetType, labelName) {
         return false;
     }
 
+    // --- 內部小工具：目前是否為沒有篩選條件的第一頁 (新增的資料會排在最前面) ---
+    function isFirstUnfilteredPage() {
+        const params = new URLSearchParams(window.location.search);
+        const onlyPage = [...params.keys()].every(key => key === 'page');
+        return onlyPage && (params.get('page') || '1') === '1';
+    }
+
+    // --- 內部小工具：依目前頁碼重新編排列號 ---
+    function renumberRows(tbody, pageSize) {
+        const page = parseInt(new URLSearchParams(window.location.search).get('page') || '1', 10) || 1;
+        const start = (page - 1) * pageSize + 1;
+        tbody.querySelectorAll('.row-index').forEach((cell, index) => {
+            cell.textContent = start + index;
+        });
+    }
+
+    // --- 【新增】內部小工具：依 delta 替換表格中的列，回傳是否已處理 ---
+    function patchTable(data) {
+        if (!tableConfig || data.id === null || data.id === undefined) {
+            return false;  // 批次異動 (action: 'bulk') 沒有單筆資料
+        }
+        const tbody = document.getElementById(tableConfig.tableBodyId);
+        if (!tbody) {
+            return false;
+        }
+        const pageSize = tableConfig.pageSize || 10;
+        const row = document.getElementById(`${tableConfig.rowIdPrefix}${data.id}`);
+
+        if (data.action === 'delete') {
+            if (!row) {
+                return false;
+            }
+            row.remove();
+        } else if (row && data.html) {
+            row.outerHTML = data.html;
+        } else if (data.action === 'create' && data.html && isFirstUnfilteredPage()) {
+            tbody.insertAdjacentHTML('afterbegin', data.html);
+            // 超過一頁的筆數時，最後一列移到下一頁
+            const rows = tbody.querySelectorAll(`tr[id^="${tableConfig.rowIdPrefix}"]`);
+            if (rows.length > pageSize) {
+                rows[rows.length - 1].remove();
+            }
+        } else {
+            return false;
+        }
+
+        renumberRows(tbody, pageSize);
+        return true;
+    }
+
     // --- 內部小工具：顯示 Toast 通知 ---
-    function showToast(message) {
+    function showToast(message, needsReload = true) {
         const container = document.getElementById('ws-toast-container');
         
         const toast = document.createElement('div');
@@ -78,9 +136,10 @@ function setupWebSocket(endpointPath, targetType, labelName) {
                 <span style="font-weight:bold;">【${labelName}系統通知】</span><br/>
                 ${message}
             </div>
+            ${needsReload ? `
             <button class="ws-toast-btn" onclick="window.location.reload()">
                 點擊更新
-            </button>
+            </button>` : ''}
         `;
 
         container.appendChild(toast);
@@ -100,6 +159,10 @@ function setupWebSocket(endpointPath, targetType, labelName) {
                     if (container.contains(toast)) {
                         container.removeChild(toast);
                     }
+                    // 表格已直接替換，不需要刷新
+                    if (!needsReload) {
+                        return;
+                    }
                     // 【新增】如果使用者沒點，時間到自動刷新
                     console.log('[WebSocket] 通知逾時，自動刷新頁面');
                     window.location.reload();
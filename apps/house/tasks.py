@@ -1,248 +1,252 @@
 # apps/house/tasks.py
-import os, base64, io
-import pandas as pd
-from decimal import Decimal
-from celery import shared_task
-from django.db import transaction
+import os
+
+from celery import chord, shared_task
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.files import File
 from channels.layers import get_channel_layer # 新增
 from asgiref.sync import async_to_sync # 新增
-from .models import House, Agent, Buyer
+from apps.core.spatial import invalidate_city
+from apps.core.task_events import publish_task_event
+from apps.core.uploads import StagedUploadError, discard_staged, open_staged, stage_upload
 from django.contrib.auth import get_user_model
+from .models import ImportJob
+from .signals import coalesce_signals
+from .progress import ImportProgress
+from .importers import (
+    AGENT_COLUMN_MAP, AGENT_DATASET, BUYER_COLUMN_MAP, BUYER_DATASET, HOUSE_COLUMN_MAP, HOUSE_DATASET,
+    ExcelSource, ImportErrorReport, ImportSourceError, import_agents, import_buyers, import_houses, open_source,
+    partition_house_frames, read_house_partition, validated_house_frames, write_houses,
+)
 
 User = get_user_model()
 
-@shared_task
-def import_excel_task(file_content_b64, user_id, filename='uploaded_file.xlsx'):
+# 匯入失敗時，通知訊息最多列出幾筆錯誤
+NOTIFY_ERROR_LINES = 5
+
+
+def send_notification(user_id, status, message):
+    """輔助函式：發送 WebSocket 訊息給上傳者"""
+    async_to_sync(get_channel_layer().group_send)(
+        f"user_{user_id}",
+        {
+            'type': 'task_message',
+            'status': status,
+            'message': message
+        }
+    )
+
+
+def _finish_import(upload, user_id, cities, job_id=None):
+    """匯入完成：重建空間索引、刪除暫存檔、標記工作完成、通知上傳者"""
+    # bulk_create / COPY 不會觸發 signal，手動讓這些縣市的空間索引重建
+    for city in cities:
+        invalidate_city(city)
+
+    # 匯入完成，暫存檔已用不到 (失敗時保留，由定時任務清除)
+    discard_staged(upload)
+    ImportJob.objects.filter(pk=job_id).update(status=ImportJob.STATUS_SUCCEEDED, error='')
+
+    # [修改] 成功時發送通知
+    send_notification(user_id, 'success', '資料匯入成功！您可以前往列表查看。')
+
+    return {'status': 'success', 'message': '資料匯入成功！'}
+
+
+def _stage_house_partitions(frames):
     """
-    背景執行 Excel 匯入任務 (Base64 版本)
+    把驗證過的房屋資料依地址分成 HOUSE_IMPORT_PARTITIONS 份，放進暫存區，回傳各份的 handle
+    (空的分割不建立任務)
     """
-    channel_layer = get_channel_layer()
-    group_name = f"user_{user_id}"
-
-    def send_notification(status, message):
-        """輔助函式：發送 WebSocket 訊息"""
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                'type': 'task_message',
-                'status': status,
-                'message': message
-            }
-        )
+    handles = []
+    files = partition_house_frames(frames, settings.HOUSE_IMPORT_PARTITIONS)
+    try:
+        for index, (path, count) in enumerate(files):
+            if count:
+                with open(path, 'rb') as f:
+                    handle = stage_upload(File(f, name=f'house-partition-{index}.csv'))
+                handles.append({**handle, 'rows': count})
+    finally:
+        for path, _ in files:
+            os.remove(path)
+    return handles
+
+
+def _fail_job(job, error):
+    if job is not None:
+        job.mark(ImportJob.STATUS_FAILED, error)
+
+
+# acks_late + reject_on_worker_lost：worker 在執行途中被回收或當機時，任務會重新投遞，
+# 重新執行時依 ImportJob 的檢查點略過已寫入的批次
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+@coalesce_signals()
+def import_excel_task(self, upload, user_id, dataset=None):
+    """
+    背景執行資料匯入任務 (Excel / CSV / Parquet)
+
+    仲介 / 買家直接在這個任務匯入 (房屋會參照它們)；房屋資料量大，驗證完成後依地址分割，
+    以 chord 分給多個 worker 平行寫入，全部完成後由 finish_import_task 通知上傳者。
+    HOUSE_IMPORT_PARTITIONS 為 1 時在這個任務內直接寫入。
+    處理過程中定期回報進度 (見 apps/house/progress.py)。
+
+    以檔案的 SHA-256 記錄匯入工作 (ImportJob)，每寫入一批就更新檢查點；
+    任務重試、重新投遞或重新上傳同一份檔案時，從上次中斷的批次繼續。
+    列表頁的即時通知合併成一則摘要 (coalesce_signals)，不會每一筆都推播一次。
 
+    Args:
+        upload (dict): 暫存檔的 handle (見 apps/core/uploads.py)，檔案本身不經過 broker
+        user_id (int): 上傳者，完成時推播通知
+        dataset (str): CSV / Parquet 所屬的資料集 (仲介 / 買家 / 房屋)，None 表示由欄位判斷
+    """
+    progress = ImportProgress(self, user_id)
+    job = None
     try:
-        # === 修改重點開始：記憶體內讀取檔案 ===
-        try:
-            # 2. 解碼 Base64 字串回二進位數據
-            file_content = base64.b64decode(file_content_b64)
-            
-            # 3. 使用 BytesIO 轉成類檔案物件 (File-like object)
-            # 這樣 pandas 就可以直接讀它，不需要實際存在硬碟上
-            excel_file = io.BytesIO(file_content)
-            
-            # 4. pandas 讀取 (注意這裡傳的是 excel_file 物件，不是路徑)
-            xls = pd.read_excel(excel_file, sheet_name=None)
-            
-        except Exception as e:
-            return {'status': 'error', 'error': f'無法讀取 Excel 檔案: {str(e)}'}
-        # === 修改重點結束 ===
-
-        # 5. 檢查工作表 (邏輯保持不變)
-        required_sheets = ['仲介', '買家', '房屋']
-        for sheet_name in required_sheets:
-            if sheet_name not in xls:
-                return {'status': 'error', 'error': f'缺少 "{sheet_name}" 工作表。'}
-
-        # 定義欄位對照 (與原本 View 相同)
-        AGENT_COLUMN_MAP = {
-            '姓名': 'name', '聯絡電話': 'phone', '電子郵件': 'email',
-            '隸屬公司': 'company', '分行名稱': 'branch', '分行縣市': 'city', '分行行政區': 'town',
-        }
-        BUYER_COLUMN_MAP = {
-            '姓名': 'name', '聯絡電話': 'phone', '電子郵件': 'email',
-        }
-        HOUSE_COLUMN_MAP = {
-            '縣市': 'city', '行政區': 'town', '房屋類型': 'house_type', '地址': 'address',
-            '所在層數': 'floor_number', '地坪': 'land_area', '地上總層數': 'total_floors',
-            '建坪': 'floor_area', '房間數': 'room_count', '總價格（萬元）': 'total_price',
-            '建坪單價(萬元/坪)': 'unit_price', '經度': 'longitude', '緯度': 'latitude',
-            '屋齡（年）': 'house_age', '出售日期': 'sold_time',
-            '仲介': 'agent_name', '買家': 'buyer_name',
+        # === 從暫存區讀取檔案 (核對上傳時的 SHA-256) ===
+        with open_staged(upload) as excel_file:
+            try:
+                # Excel 以 read_only 模式逐列讀取；CSV / Parquet 以 pyarrow 欄式讀取，
+                # 都不會把整個檔案載入成 DataFrame
+                source = open_source(excel_file, upload.get('filename'), dataset=dataset)
+            except ImportSourceError as e:
+                send_notification(user_id, 'error', f'匯入失敗：{e}')
+                return {'status': 'error', 'error': str(e)}
+            except Exception as e:
+                return {'status': 'error', 'error': f'無法讀取檔案: {str(e)}'}
+
+            try:
+                # 5. 檢查工作表 (Excel 必須同時包含三個工作表；CSV / Parquet 只包含一個資料集)
+                # 在建立匯入工作之前檢查，格式不對的檔案不會留下執行中的工作
+                if isinstance(source, ExcelSource):
+                    required_sheets = [AGENT_DATASET, BUYER_DATASET, HOUSE_DATASET]
+                    for sheet_name in required_sheets:
+                        if not source.has_dataset(sheet_name):
+                            error = f'缺少 "{sheet_name}" 工作表。'
+                            send_notification(user_id, 'error', f'匯入失敗：{error}')
+                            return {'status': 'error', 'error': error}
+
+                job = ImportJob.resume_or_create(upload, user_id=user_id, dataset=dataset, task_id=self.request.id)
+                if job.checkpoints.exists():
+                    print(f"♻️ 續傳匯入工作 #{job.pk} ({job.filename})，略過已寫入的批次")
+
+                # ===== 執行匯入邏輯 (每 BATCH_SIZE 列一批，邊讀邊寫入) =====
+                # 順序固定為 仲介 -> 買家 -> 房屋，房屋才找得到對應的仲介 / 買家
+                cities = set()
+                partitions = []
+                # (A) 處理仲介
+                if source.has_dataset(AGENT_DATASET):
+                    import_agents(progress.track(
+                        AGENT_DATASET, source.batches(AGENT_DATASET, AGENT_COLUMN_MAP), source.row_count(AGENT_DATASET)
+                    ), job.checkpoint(AGENT_DATASET))
+
+                # (B) 處理買家
+                if source.has_dataset(BUYER_DATASET):
+                    import_buyers(progress.track(
+                        BUYER_DATASET, source.batches(BUYER_DATASET, BUYER_COLUMN_MAP), source.row_count(BUYER_DATASET)
+                    ), job.checkpoint(BUYER_DATASET))
+
+                # (C) 處理房屋
+                if source.has_dataset(HOUSE_DATASET):
+                    house_batches = progress.track(
+                        HOUSE_DATASET, source.batches(HOUSE_DATASET, HOUSE_COLUMN_MAP), source.row_count(HOUSE_DATASET)
+                    )
+                    if settings.HOUSE_IMPORT_PARTITIONS <= 1:
+                        cities = import_houses(house_batches, job.checkpoint(HOUSE_DATASET))
+                    else:
+                        # 先驗證完整份資料，有任何錯誤就不寫入房屋
+                        report = ImportErrorReport()
+                        partitions = _stage_house_partitions(
+                            validated_house_frames(house_batches, report, cities)
+                        )
+                        if report:
+                            for partition in partitions:
+                                discard_staged(partition)
+                            report.raise_if_any()
+            finally:
+                source.close()
+
+        if not partitions:
+            return _finish_import(upload, user_id, cities, job.pk)
+
+        # (D) 分給多個 worker 平行寫入，全部完成後再通知
+        # 地址的分割方式固定，同一份檔案重新執行時每一份的內容相同，檢查點可以沿用
+        # callback 以這個任務的 ID 發布最終狀態，SSE 串流才會在房屋全部寫入後結束
+        callback = finish_import_task.s(upload, user_id, sorted(cities), job.pk, self.request.id).on_error(
+            import_failed_task.s(user_id, job.pk, self.request.id)
+        )
+        header = [
+            import_house_partition_task.s(
+                partition, user_id, f'第 {index} / {len(partitions)} 份：',
+                job_id=job.pk, checkpoint_key=f'{HOUSE_DATASET}#{index}/{len(partitions)}',
+            )
+            for index, partition in enumerate(partitions, start=1)
+        ]
+        callback_result = chord(header)(callback)
+        # TaskStatusView 依 callback_id 追蹤平行寫入是否完成
+        return {
+            'status': 'started',
+            'message': f'資料驗證完成，分成 {len(partitions)} 份平行寫入中...',
+            'callback_id': callback_result.id,
         }
 
-        BATCH_SIZE = 1000
-
-        # ===== 執行匯入邏輯 (與原本 View 邏輯一致，僅移除 request 相關) =====
-        
-        # (A) 處理仲介
-        sheet_name = '仲介'
-        if sheet_name in xls:
-            df_agent = xls[sheet_name].rename(columns=AGENT_COLUMN_MAP)
-            df_agent = df_agent.where(pd.notnull(df_agent), None)
-            agent_records = df_agent.to_dict('records')
-            
-            for i in range(0, len(agent_records), BATCH_SIZE):
-                batch_data = agent_records[i:i+BATCH_SIZE]
-                with transaction.atomic():
-                    agents_to_create = []
-                    agents_to_update = []
-                    batch_names = [d['name'] for d in batch_data if d.get('name')]
-                    existing_agents = {a.name: a for a in Agent.objects.filter(name__in=batch_names)}
-                    
-                    for row in batch_data:
-                        name = row.get('name')
-                        if not name: continue
-                        clean_data = {k: (str(v).strip() if v is not None else None) for k, v in row.items()}
-                        if name in existing_agents:
-                            agent = existing_agents[name]
-                            for key, value in clean_data.items():
-                                setattr(agent, key, value)
-                            agents_to_update.append(agent)
-                        else:
-                            agents_to_create.append(Agent(**clean_data))
-                    
-                    if agents_to_create:
-                        Agent.objects.bulk_create(agents_to_create, ignore_conflicts=True)
-                    if agents_to_update:
-                        Agent.objects.bulk_update(agents_to_update, ['phone', 'email', 'company', 'branch', 'city', 'town'])
-
-        # (B) 處理買家
-        sheet_name = '買家'
-        if sheet_name in xls:
-            df_buyer = xls[sheet_name].rename(columns=BUYER_COLUMN_MAP)
-            df_buyer = df_buyer.where(pd.notnull(df_buyer), None)
-            buyer_records = df_buyer.to_dict('records')
-            
-            for i in range(0, len(buyer_records), BATCH_SIZE):
-                batch_data = buyer_records[i:i+BATCH_SIZE]
-                with transaction.atomic():
-                    buyers_to_create = []
-                    buyers_to_update = []
-                    batch_names = [d['name'] for d in batch_data if d.get('name')]
-                    existing_buyers = {b.name: b for b in Buyer.objects.filter(name__in=batch_names)}
-                    
-                    for row in batch_data:
-                        name = row.get('name')
-                        if not name: continue
-                        clean_data = {k: (str(v).strip() if v is not None else None) for k, v in row.items()}
-                        if name in existing_buyers:
-                            buyer = existing_buyers[name]
-                            for key, value in clean_data.items():
-                                setattr(buyer, key, value)
-                            buyers_to_update.append(buyer)
-                        else:
-                            buyers_to_create.append(Buyer(**clean_data))
-                    
-                    if buyers_to_create:
-                        Buyer.objects.bulk_create(buyers_to_create, ignore_conflicts=True)
-                    if buyers_to_update:
-                        Buyer.objects.bulk_update(buyers_to_update, ['phone', 'email'])
-
-        # (C) 處理房屋
-        sheet_name = '房屋'
-        if sheet_name in xls:
-            df_house = xls[sheet_name].rename(columns=HOUSE_COLUMN_MAP)
-            df_house = df_house.where(pd.notnull(df_house), None)
-            
-            all_agent_names = df_house['agent_name'].dropna().unique().tolist()
-            all_buyer_names = df_house['buyer_name'].dropna().unique().tolist()
-            agents_dict = {a.name: a for a in Agent.objects.filter(name__in=all_agent_names)}
-            buyers_dict = {b.name: b for b in Buyer.objects.filter(name__in=all_buyer_names)}
-
-            house_records = df_house.to_dict('records')
-            DECIMAL_2DP_FIELDS = {'house_age', 'floor_area', 'land_area', 'unit_price'}
-            DECIMAL_12DP_FIELDS = {'longitude', 'latitude'}
-            INTEGER_FIELDS = {'floor_number', 'total_floors', 'room_count', 'total_price'}
-            
-            for i in range(0, len(house_records), BATCH_SIZE):
-                batch_data = house_records[i:i+BATCH_SIZE]
-                with transaction.atomic():
-                    houses_to_create = []
-                    houses_to_update = []
-                    batch_addresses = [d['address'] for d in batch_data if d.get('address')]
-                    existing_houses = {h.address: h for h in House.objects.filter(address__in=batch_addresses)}
-                    
-                    for idx, row in enumerate(batch_data):
-                        excel_row_num = i + idx + 2 
-                        
-                        agent_name = row.get('agent_name')
-                        buyer_name = row.get('buyer_name')
-                        if not agent_name or agent_name not in agents_dict:
-                            raise ValidationError(f'第 {excel_row_num} 行: 找不到仲介 "{agent_name}"')
-                        if not buyer_name or buyer_name not in buyers_dict:
-                            raise ValidationError(f'第 {excel_row_num} 行: 找不到買家 "{buyer_name}"')
-                        
-                        house_params = {}
-                        if not row.get('address'):
-                             raise ValidationError(f'第 {excel_row_num} 行: 地址為必填')
-
-                        ALL_HOUSE_FIELDS = [
-                            'city', 'town', 'house_type', 'address', 
-                            'floor_number', 'land_area', 'total_floors', 
-                            'floor_area', 'room_count', 'total_price', 
-                            'unit_price', 'longitude', 'latitude', 
-                            'house_age', 'sold_time'
-                        ]
-
-                        for field in ALL_HOUSE_FIELDS:
-                            value = row.get(field)
-                            if value is None:
-                                house_params[field] = None
-                                continue
-                            try:
-                                if field == 'sold_time':
-                                    house_params[field] = str(value).split(' ')[0]
-                                elif field in DECIMAL_2DP_FIELDS:
-                                    house_params[field] = Decimal(str(value)).quantize(Decimal('0.01'))
-                                elif field in DECIMAL_12DP_FIELDS:
-                                    house_params[field] = Decimal(str(value)).quantize(Decimal('0.000000000001'))
-                                elif field in INTEGER_FIELDS:
-                                    house_params[field] = int(float(value))
-                                else:
-                                    house_params[field] = str(value)
-                            except Exception as e:
-                                raise ValidationError(f'第 {excel_row_num} 行: 欄位 {field} 格式錯誤 ({value})')
-
-                        house_params['agent'] = agents_dict[agent_name]
-                        house_params['buyers'] = buyers_dict[buyer_name]
-                        
-                        address = house_params['address']
-                        if address in existing_houses:
-                            house = existing_houses[address]
-                            for key, val in house_params.items():
-                                setattr(house, key, val)
-                            houses_to_update.append(house)
-                        else:
-                            houses_to_create.append(House(**house_params))
-                    
-                    UPDATE_FIELDS = [
-                        'city', 'town', 'house_type', 
-                        'floor_number', 'land_area', 'total_floors', 
-                        'floor_area', 'room_count', 'total_price', 
-                        'unit_price', 'longitude', 'latitude', 
-                        'house_age', 'sold_time', 'agent', 'buyers'
-                    ]
-                    if houses_to_update:
-                        House.objects.bulk_update(houses_to_update, UPDATE_FIELDS)
-                    if houses_to_create:
-                        House.objects.bulk_create(houses_to_create)
-
-        # [修改] 成功時發送通知
-        send_notification('success', 'Excel 資料匯入成功！您可以前往列表查看。')
-
-        return {'status': 'success', 'message': 'Excel 資料匯入成功！'}
+    except StagedUploadError as e:
+        _fail_job(job, str(e))
+        send_notification(user_id, 'error', str(e))
+        return {'status': 'error', 'error': str(e)}
 
     except ValidationError as e:
-        # [修改] 失敗時發送通知
-        send_notification('error', f'匯入失敗：{e.message}')
-        return {'status': 'error', 'error': e.message}
-    
+        # [修改] 一次回報所有錯誤：通知只列前幾筆，完整清單放在任務結果的 errors
+        errors = e.messages
+        summary = '；'.join(errors[:NOTIFY_ERROR_LINES])
+        if len(errors) > NOTIFY_ERROR_LINES:
+            summary += f'…等共 {len(errors)} 個錯誤'
+        _fail_job(job, '\n'.join(errors))
+        send_notification(user_id, 'error', f'匯入失敗：{summary}')
+        return {'status': 'error', 'error': summary, 'errors': errors}
+
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         error_msg = f'系統發生預期外的錯誤: {str(e)}'
+        _fail_job(job, error_msg)
         # [修改] 失敗時發送通知
-        send_notification('error', error_msg)
+        send_notification(user_id, 'error', error_msg)
         return {'status': 'error', 'error': error_msg}
-    
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+@coalesce_signals()
+def import_house_partition_task(self, partition, user_id=None, label='', job_id=None, checkpoint_key=None):
+    """寫入一份房屋分割 (各份地址互不重疊，可以平行執行)，重新投遞時從檢查點繼續"""
+    progress = ImportProgress(self, user_id, label=label)
+    checkpoint = None
+    if job_id is not None:
+        checkpoint = ImportJob.objects.get(pk=job_id).checkpoint(checkpoint_key)
+    with open_staged(partition) as f:
+        frames = progress.track(HOUSE_DATASET, read_house_partition(f), partition.get('rows'))
+        if checkpoint is not None:
+            frames = checkpoint.pending(frames)
+        write_houses(frames, checkpoint=checkpoint)
+    discard_staged(partition)
+    return partition['name']
+
+
+@shared_task
+def finish_import_task(results, upload, user_id, cities, job_id=None, import_task_id=None):
+    """chord callback：所有分割都寫入後執行，並發布匯入任務 (import_task_id) 的最終狀態"""
+    result = _finish_import(upload, user_id, cities, job_id)
+    publish_task_event(import_task_id, 'SUCCESS', result=result)
+    return result
+
+
+@shared_task
+def import_failed_task(request, exc, traceback, user_id, job_id=None, import_task_id=None):
+    """
+    chord 中任一分割失敗時通知上傳者
+    已寫入的批次不會回復，重新上傳同一份檔案時會從檢查點繼續
+    """
+    print(f"❌ 房屋分割匯入失敗 ({request.id}): {exc}")
+    ImportJob.objects.filter(pk=job_id).update(status=ImportJob.STATUS_FAILED, error=str(exc))
+    send_notification(user_id, 'error', f'匯入失敗：{exc}')
+    publish_task_event(import_task_id, 'FAILURE', error=str(exc))
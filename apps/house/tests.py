@@ -1,3 +1,631 @@
-from django.test import TestCase
+import asyncio
+import csv
+import importlib
+import io
+import json
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+import pandas as pd
+from asgiref.sync import async_to_sync
+from celery.signals import worker_process_shutdown
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import importers
+from .consumers import BuyerListConsumer
+from .importers import (
+    AGENT_COLUMN_MAP, AGENT_DATASET, BUYER_COLUMN_MAP, BUYER_DATASET, HOUSE_COLUMN_MAP, HOUSE_DATASET,
+    ALL_HOUSE_FIELDS, ImportErrorReport, ImportSourceError, _CopyStream, _staging_rows, validated_house_frames,
+    import_houses, open_source,
+)
+from .management.commands.dedupe_house_addresses import choose_keeper
+from .models import Agent, Buyer, House, ImportJob
+from .notifications import dispatcher
+from .progress import ImportProgress
+from .signals import coalesce_signals, record_bulk_change
+from .tasks import import_excel_task
+from apps.core import task_events
+from apps.core.uploads import stage_upload
+from config.celery import app as celery_app, publish_task_finished
+
+
+class ImportSourceTests(SimpleTestCase):
+    """Excel / CSV / Parquet 來源產生的批次格式要一致"""
+
+    def _rows(self, source, dataset, column_map, batch_size=2):
+        batches = list(source.batches(dataset, column_map, batch_size=batch_size))
+        return batches, [row for batch in batches for row in batch]
+
+    def test_excel_source_streams_batches_and_skips_blank_rows(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = BUYER_DATASET
+        sheet.append(['姓名', '聯絡電話', '電子郵件', '備註'])
+        sheet.append(['王小明', '0912345678', 'a@example.com', 'x'])
+        sheet.append([None, None, None, None])
+        sheet.append(['李小華', '', None, None])
+        sheet.append(['陳大文', '0922', None, None])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        source = open_source(buffer, 'data.xlsx')
+        self.assertTrue(source.has_dataset(BUYER_DATASET))
+        self.assertFalse(source.has_dataset(HOUSE_DATASET))
+
+        batches, rows = self._rows(source, BUYER_DATASET, BUYER_COLUMN_MAP)
+        source.close()
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual([number for number, _ in rows], [2, 4, 5])
+        self.assertEqual(rows[1][1], {'name': '李小華', 'phone': None, 'email': None})
+
+    def test_csv_source_detects_dataset_and_keeps_text_columns(self):
+        content = '﻿姓名,聯絡電話,電子郵件,隸屬公司,分行名稱,分行縣市,分行行政區\n王小明,0912345678,,信義,大安店,台北市,大安區\n,,,,,,\n'
+        source = open_source(io.BytesIO(content.encode('utf-8')), 'agents.csv')
+
+        self.assertTrue(source.has_dataset(AGENT_DATASET))
+        self.assertFalse(source.has_dataset(BUYER_DATASET))
+        _, rows = self._rows(source, AGENT_DATASET, AGENT_COLUMN_MAP)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][0], 2)
+        self.assertEqual(rows[0][1]['phone'], '0912345678')
+        self.assertIsNone(rows[0][1]['email'])
+
+    def test_csv_row_numbers_count_blank_lines_and_headers_are_stripped(self):
+        content = (
+            '姓名 , 聯絡電話 ,電子郵件\r\n'
+            '王小明,0912,\r\n'
+            '\r\n'
+            '\r\n'
+            '李小華,"0922\r\n分機 5",b@example.com\r\n'
+            ',,\r\n'
+            '陳大文,0933,\r\n'
+        )
+        expected = [
+            (2, {'name': '王小明', 'phone': '0912', 'email': None}),
+            (5, {'name': '李小華', 'phone': '0922\r\n分機 5', 'email': 'b@example.com'}),
+            (8, {'name': '陳大文', 'phone': '0933', 'email': None}),
+        ]
+        # pyarrow 與 pandas (未安裝 pyarrow) 兩種讀取方式的結果相同
+        for arrow in (importers.pa, None):
+            with self.subTest(pyarrow=arrow is not None), mock.patch.object(importers, 'pa', arrow):
+                source = open_source(io.BytesIO(content.encode('utf-8')), 'buyers.csv')
+                self.assertTrue(source.has_dataset(BUYER_DATASET))
+                _, rows = self._rows(source, BUYER_DATASET, BUYER_COLUMN_MAP)
+                self.assertEqual(rows, expected)
+
+    def test_parquet_source_reads_only_mapped_columns(self):
+        frame = pd.DataFrame({
+            '地址': ['台北市大安區和平東路1號', '台北市大安區和平東路2號', '台北市大安區和平東路3號'],
+            '總價格（萬元）': [1200, 1500, None],
+            '仲介': ['王小明', '王小明', '王小明'],
+            '其他': [1, 2, 3],
+        })
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False)
+        buffer.seek(0)
+
+        source = open_source(buffer, 'houses.parquet')
+        self.assertTrue(source.has_dataset(HOUSE_DATASET))
+        batches, rows = self._rows(source, HOUSE_DATASET, HOUSE_COLUMN_MAP)
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(set(rows[0][1]), {'address', 'total_price', 'agent_name'})
+        self.assertIsNone(rows[2][1]['total_price'])
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ImportSourceError):
+            open_source(io.BytesIO(b'x'), 'data.txt')
+        with self.assertRaises(ImportSourceError):
+            open_source(io.BytesIO('欄位A\n1\n'.encode('utf-8')), 'data.csv')
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class HouseUpsertTests(TestCase):
+    """房屋以地址 upsert：重複匯入只更新，不會新增重複的資料"""
+
+    def setUp(self):
+        Agent.objects.create(name='王小明', city='台北市', town='大安區')
+        Buyer.objects.create(name='李小華')
+
+    def _row(self, address, total_price):
+        return {
+            'city': '台北市', 'town': '大安區', 'house_type': '公寓', 'address': address,
+            'total_price': total_price, 'floor_area': 30.256, 'sold_time': '2024-01-02 00:00:00',
+            'agent_name': '王小明', 'buyer_name': '李小華',
+        }
+
+    def test_reimport_updates_existing_rows(self):
+        cities = import_houses([[(2, self._row('和平東路1號', 1000)), (3, self._row('和平東路2號', 1200))]])
+        self.assertEqual(cities, {'台北市'})
+        first = House.objects.get(address='和平東路1號')
+
+        # 同一批出現重複地址時以最後一列為準
+        import_houses([[(2, self._row('和平東路1號', 1100)), (3, self._row('和平東路1號', 1500))]])
+
+        self.assertEqual(House.objects.count(), 2)
+        house = House.objects.get(address='和平東路1號')
+        self.assertEqual(house.id, first.id)
+        self.assertEqual(house.total_price, 1500)
+        self.assertEqual(str(house.floor_area), '30.26')
+        self.assertEqual(house.created_at, first.created_at)
+        self.assertEqual(house.agent.name, '王小明')
+
+    def test_all_errors_are_reported_at_once(self):
+        bad_price = dict(self._row('和平東路3號', 'abc'), sold_time='not a date')
+        missing_agent = dict(self._row('和平東路4號', 1000), agent_name='陳大文')
+        batches = [
+            [(2, self._row('和平東路1號', 1000)), (3, bad_price)],
+            [(4, missing_agent), (5, dict(self._row(None, 1000)))],
+        ]
+
+        with self.assertRaises(ValidationError) as caught:
+            import_houses(batches)
+
+        self.assertEqual(caught.exception.messages, [
+            '第 3 行: 欄位 total_price 格式錯誤 (abc)',
+            '第 3 行: 欄位 sold_time 格式錯誤 (not a date)',
+            '第 4 行: 找不到仲介 "陳大文"',
+            '第 5 行: 地址為必填',
+        ])
+        # 第一個錯誤所在的批次與之後的批次都不寫入
+        self.assertFalse(House.objects.exists())
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class CopyStreamTests(TestCase):
+    """PostgreSQL COPY 的資料串流 (這裡不需要 PostgreSQL，只檢查送出的 CSV)"""
+
+    def test_staging_rows_stream_as_csv(self):
+        Agent.objects.create(name='王小明', city='台北市', town='大安區')
+        Buyer.objects.create(name='李小華')
+        rows = [
+            (2, {'address': '和平東路1號, 3樓', 'city': '台北市', 'floor_area': 30.256, 'total_price': 1200,
+                 'sold_time': '2024-01-02 00:00:00', 'agent_name': '王小明', 'buyer_name': '李小華'}),
+            (3, {'address': '和平東路2號', 'city': None, 'total_price': '1500.7', 'agent_name': '王小明', 'buyer_name': '李小華'}),
+        ]
+        cities = set()
+        report = ImportErrorReport()
+        stream = _CopyStream(_staging_rows(validated_house_frames([rows[:1], rows[1:]], report, cities)))
+
+        # copy_expert 以固定大小讀取
+        chunks = iter(lambda: stream.read(7), '')
+        records = list(csv.reader(io.StringIO(''.join(chunks))))
+
+        self.assertFalse(report)
+        self.assertEqual(cities, {'台北市'})
+        self.assertEqual(len(records), 2)
+        first = dict(zip(['row_number'] + ALL_HOUSE_FIELDS + ['agent_name', 'buyer_name'], records[0]))
+        self.assertEqual(first['row_number'], '2')
+        self.assertEqual(first['address'], '和平東路1號, 3樓')
+        self.assertEqual(first['floor_area'], '30.26')
+        self.assertEqual(first['total_price'], '1200')
+        self.assertEqual(first['sold_time'], '2024-01-02')
+        self.assertEqual(first['land_area'], '')  # 空字串在 COPY (FORMAT csv) 中是 NULL
+        second = dict(zip(['row_number'] + ALL_HOUSE_FIELDS + ['agent_name', 'buyer_name'], records[1]))
+        self.assertEqual(second['total_price'], '1500')
+        self.assertEqual(second['city'], '')
+
+
+class FakeEventRedis:
+    """任務事件用的 Redis (只實作 publish_task_event / task_finished 用到的指令)"""
+    def __init__(self):
+        self.store = {}
+        self.published = []
+
+    def pipeline(self):
+        return self
+
+    def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def publish(self, channel, payload):
+        self.published.append((channel, json.loads(payload)))
+
+    def execute(self):
+        pass
+
+    def events(self, task_id):
+        return [event for channel, event in self.published if channel == task_events.channel_name(task_id)]
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    HOUSE_IMPORT_PARTITIONS=3,
+)
+class PartitionedImportTests(TestCase):
+    """房屋驗證後依地址分割，由 chord 平行寫入 (這裡以 eager 模式執行)"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+        eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        self.addCleanup(setattr, celery_app.conf, 'task_always_eager', eager)
+
+        Agent.objects.create(name='王小明', city='台北市', town='大安區')
+        Buyer.objects.create(name='李小華')
+        self.user = get_user_model().objects.create_user(username='staff', password='x')
+
+    def _run(self, lines):
+        content = '地址,縣市,房屋類型,總價格（萬元）,建坪,出售日期,仲介,買家\n' + ''.join(lines)
+        upload = stage_upload(SimpleUploadedFile('房屋.csv', content.encode('utf-8')))
+        return import_excel_task.apply(args=[upload, self.user.id]).result
+
+    def test_partitions_are_written_in_parallel_tasks(self):
+        lines = [f'和平東路{i}號,台北市,公寓,{1000 + i},30.5,2024-01-02,王小明,李小華\n' for i in range(50)]
+        lines.append('和平東路0號,台北市,公寓,999,,,王小明,李小華\n')  # 重複地址以最後一列為準
+
+        result = self._run(lines)
+
+        self.assertEqual(result['status'], 'started')
+        self.assertEqual(House.objects.count(), 50)
+        house = House.objects.get(address='和平東路0號')
+        self.assertEqual(house.total_price, 999)
+        self.assertIsNone(house.floor_area)
+        self.assertEqual(str(House.objects.get(address='和平東路7號').sold_time), '2024-01-02')
+
+    def test_validation_errors_write_nothing(self):
+        result = self._run([
+            '和平東路1號,台北市,公寓,1000,30.5,2024-01-02,王小明,李小華\n',
+            '和平東路2號,台北市,公寓,abc,30.5,2024-01-02,陳大文,李小華\n',
+        ])
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(result['errors'], [
+            '第 3 行: 欄位 total_price 格式錯誤 (abc)',
+            '第 3 行: 找不到仲介 "陳大文"',
+        ])
+        self.assertFalse(House.objects.exists())
+
+    def test_task_events_end_after_partitions_are_written(self):
+        """SSE 的最終狀態由 chord callback 以匯入任務的 ID 發布，不會在房屋寫入前就結束"""
+        client = FakeEventRedis()
+        with mock.patch.object(task_events, '_get_client', return_value=client):
+            upload = stage_upload(SimpleUploadedFile('房屋.csv', (
+                '地址,縣市,房屋類型,總價格（萬元）,建坪,出售日期,仲介,買家\n'
+                '和平東路1號,台北市,公寓,1000,30.5,2024-01-02,王小明,李小華\n'
+            ).encode('utf-8')))
+            import_excel_task.apply(args=[upload, self.user.id], task_id='import-1')
+
+        events = client.events('import-1')
+        self.assertEqual(events[-1]['state'], 'SUCCESS')
+        self.assertEqual(events[-1]['result']['status'], 'success')
+        self.assertEqual([e['state'] for e in events].count('SUCCESS'), 1)
+        # 匯入任務的 postrun 在 callback 之後才執行 (eager 模式)，不會把最終狀態蓋回 PROGRESS
+        self.assertEqual(json.loads(client.get(task_events.last_event_key('import-1')))['state'], 'SUCCESS')
+
+    def test_started_import_publishes_progress_with_callback_id(self):
+        client = FakeEventRedis()
+        with mock.patch.object(task_events, '_get_client', return_value=client):
+            publish_task_finished(task_id='import-2', state='SUCCESS', retval={
+                'status': 'started', 'message': '平行寫入中...', 'callback_id': 'cb-1',
+            })
+
+        event, = client.events('import-2')
+        self.assertEqual((event['state'], event['callback_id']), ('PROGRESS', 'cb-1'))
+        self.assertNotIn(event['state'], task_events.FINAL_STATES)
+
+    def test_missing_sheet_is_reported_without_job(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.title = AGENT_DATASET
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        upload = stage_upload(SimpleUploadedFile('資料.xlsx', buffer.getvalue()))
+
+        with mock.patch('apps.house.tasks.send_notification') as notify:
+            result = import_excel_task.apply(args=[upload, self.user.id]).result
+
+        self.assertEqual(result, {'status': 'error', 'error': f'缺少 "{BUYER_DATASET}" 工作表。'})
+        notify.assert_called_once_with(self.user.id, 'error', f'匯入失敗：缺少 "{BUYER_DATASET}" 工作表。')
+        self.assertFalse(ImportJob.objects.exists())
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    IMPORT_PROGRESS_INTERVAL=60,
+)
+class ImportProgressTests(SimpleTestCase):
+    """進度以固定間隔節流：每一批都累計，但只在開始、間隔到期與資料集結束時送出"""
+
+    def test_progress_is_throttled(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('user_7', channel)
+        task = SimpleNamespace(request=SimpleNamespace(id='task-1', is_eager=True))
+
+        progress = ImportProgress(task, 7)
+        with mock.patch('apps.house.progress.publish_task_event') as publish:
+            batches = list(progress.track(HOUSE_DATASET, ([None] * 1000 for _ in range(50)), total=50000))
+
+        self.assertEqual(len(batches), 50)
+        self.assertEqual(publish.call_count, 2)
+        final = publish.call_args.kwargs['progress']
+        self.assertEqual(final['processed'], 50000)
+        self.assertEqual(final['total'], 50000)
+        self.assertEqual(final['eta_seconds'], 0)
+
+        first = async_to_sync(layer.receive)(channel)
+        last = async_to_sync(layer.receive)(channel)
+        self.assertEqual((first['status'], first['kind']), ('progress', 'import'))
+        self.assertEqual(first['progress']['processed'], 0)
+        self.assertIn('50,000 / 50,000', last['message'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class ResumableImportTests(TestCase):
+    """中斷的匯入以檔案 SHA-256 找回工作，從檢查點繼續"""
+
+    upload = {'sha256': 'a' * 64, 'filename': '房屋.xlsx'}
+
+    def setUp(self):
+        Agent.objects.create(name='王小明', city='台北市', town='大安區')
+        Buyer.objects.create(name='李小華')
+
+    def _batch(self, start, total_price=1000):
+        return [
+            (row, {'address': f'和平東路{row}號', 'city': '台北市', 'house_type': '公寓', 'total_price': total_price,
+                   'agent_name': '王小明', 'buyer_name': '李小華'})
+            for row in range(start, start + 2)
+        ]
+
+    def test_unfinished_job_is_resumed(self):
+        job = ImportJob.resume_or_create(self.upload)
+        self.assertEqual(ImportJob.resume_or_create(self.upload).pk, job.pk)
+
+        job.mark(ImportJob.STATUS_SUCCEEDED)
+        self.assertNotEqual(ImportJob.resume_or_create(self.upload).pk, job.pk)
+
+    def test_resumed_import_skips_committed_batches(self):
+        job = ImportJob.resume_or_create(self.upload)
+
+        def interrupted():
+            yield self._batch(2)
+            yield self._batch(4)
+            raise RuntimeError('worker lost')
+
+        with self.assertRaises(RuntimeError):
+            import_houses(interrupted(), job.checkpoint(HOUSE_DATASET))
+        self.assertEqual(House.objects.count(), 4)
+        self.assertEqual(job.checkpoints.get(key=HOUSE_DATASET).batches_done, 2)
+
+        # 重新執行時前兩批已寫入 (價格不同也不會被覆蓋)，只寫入剩下的批次
+        checkpoint = ImportJob.resume_or_create(self.upload).checkpoint(HOUSE_DATASET)
+        import_houses(iter([self._batch(2, 1), self._batch(4, 1), self._batch(6)]), checkpoint)
+
+        self.assertEqual(checkpoint.skipped, 2)
+        self.assertEqual(House.objects.count(), 6)
+        self.assertEqual(House.objects.filter(total_price=1).count(), 0)
+        self.assertEqual(job.checkpoints.get(key=HOUSE_DATASET).batches_done, 3)
+
+    def test_copy_path_checkpoints_each_batch(self):
+        """PostgreSQL COPY 路徑 (以假的 cursor 代替) 也是每一批一個交易，檢查點逐批推進"""
+        job = ImportJob.resume_or_create(self.upload)
+        real_connection = importers.connection
+        copied = []
+
+        class FakeCursor:
+            rowcount = 0
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, sql):
+                pass
+
+            def copy_expert(self, sql, stream):
+                if len(copied) == 2:
+                    raise RuntimeError('worker lost')
+                rows = list(csv.reader(io.StringIO(stream.read())))
+                # 寫入這一批時，上一批的檢查點已經提交
+                copied.append((len(rows), job.checkpoints.get(key=HOUSE_DATASET).batches_done
+                               if job.checkpoints.exists() else 0, real_connection.in_atomic_block))
+                self.rowcount = len(rows)
+
+        class FakeConnection:
+            vendor = 'postgresql'
+
+            def cursor(self):
+                return FakeCursor()
+
+            def __getattr__(self, name):
+                return getattr(real_connection, name)
+
+        with mock.patch.object(importers, 'connection', FakeConnection()), \
+                self.assertRaises(RuntimeError):
+            import_houses(iter([self._batch(2), self._batch(4), self._batch(6)]), job.checkpoint(HOUSE_DATASET))
+
+        self.assertEqual(copied, [(2, 0, True), (2, 1, True)])
+        self.assertEqual(job.checkpoints.get(key=HOUSE_DATASET).batches_done, 2)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class CoalescedSignalsTests(TestCase):
+    """coalesce_signals 區塊內不逐筆推播，離開時每種資料只送出一則摘要"""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)('house_updates', self.channel)
+        self.agent = Agent.objects.create(name='王小明')
+        self.buyer = Buyer.objects.create(name='李小華')
+
+    def _house(self, address):
+        return House(
+            city='台北市', town='大安區', house_type='公寓', address=address,
+            agent=self.agent, buyers=self.buyer, total_price=1000,
+        )
+
+    def _receive_all(self):
+        # 通知在背景執行緒送出，先等佇列清空
+        dispatcher.flush()
+
+        async def drain():
+            messages = []
+            while True:
+                try:
+                    messages.append(await asyncio.wait_for(self.layer.receive(self.channel), 0.05))
+                except asyncio.TimeoutError:
+                    return messages
+        return async_to_sync(drain)()
+
+    def test_block_emits_one_summary(self):
+        with mock.patch('apps.house.signals.cache') as cache, \
+                mock.patch('apps.house.signals.invalidate_city') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True), coalesce_signals():
+                for index in range(3):
+                    self._house(f'和平東路{index}號').save()
+                house = House.objects.get(address='和平東路0號')
+                house.total_price = 1200
+                house.save()
+                House.objects.filter(address='和平東路2號').delete()
+                # 巢狀區塊併入最外層
+                with coalesce_signals():
+                    record_bulk_change(House, 'upsert', 500)
+
+            cache.delete.assert_called_once_with('api_house_list')
+            invalidate.assert_called_once_with('台北市')
+
+        messages = self._receive_all()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['action'], 'bulk')
+        self.assertEqual(messages[0]['counts'], {'create': 3, 'update': 1, 'delete': 1, 'upsert': 500})
+        self.assertIn('新增 3 筆', messages[0]['message'])
+
+    def test_signals_are_per_row_outside_block(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._house('和平東路1號').save()
+            house = self._house('和平東路2號')
+            house.save()
+            house.delete()
+        messages = self._receive_all()
+        self.assertEqual([m['action'] for m in messages], ['create', 'create', 'delete'])
+        self.assertEqual(messages[1]['id'], messages[2]['id'])
+
+    def test_rolled_back_changes_are_not_notified(self):
+        with mock.patch('apps.house.signals.cache') as cache, self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self._house('和平東路1號').save()
+                raise RuntimeError
+            self._house('和平東路2號').save()
+
+        cache.delete.assert_called_once_with('api_house_list')
+        messages = self._receive_all()
+        self.assertEqual([m['message'] for m in messages], ['新屋上架：和平東路2號'])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class RowDeltaTests(TransactionTestCase):
+    """單筆異動在交易提交後由背景執行緒渲染列表的單列，列表 WebSocket 只開放 staff"""
+
+    def test_row_is_rendered_after_commit(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('buyer_updates', channel)
+
+        buyer = Buyer.objects.create(name='李小華', phone='0912345678')
+        buyer.name = '李大華'
+        buyer.save()
+        dispatcher.flush()
+        Buyer.objects.filter(pk=buyer.pk).delete()
+        dispatcher.flush()
+
+        created, updated, deleted = [async_to_sync(layer.receive)(channel) for _ in range(3)]
+        self.assertEqual(created['id'], buyer.pk)
+        self.assertIn(f'id="buyer-row-{buyer.pk}"', created['html'])
+        # 在背景執行緒重新讀取，渲染的是提交後的資料 (第二次存檔時已改名)
+        self.assertIn('李大華', updated['html'])
+        # 已刪除的資料只有 id
+        self.assertEqual(deleted['id'], buyer.pk)
+        self.assertNotIn('html', deleted)
+
+    def test_list_sockets_require_staff(self):
+        User = get_user_model()
+        member = User.objects.create_user(username='member', password='x')
+        staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+
+        async def connect(user):
+            communicator = WebsocketCommunicator(BuyerListConsumer.as_asgi(), '/ws/buyers/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)(AnonymousUser()))
+        self.assertFalse(async_to_sync(connect)(member))
+        self.assertTrue(async_to_sync(connect)(staff))
+
+
+class NotificationDispatcherTests(SimpleTestCase):
+    """Celery 子 process 結束時 (不會執行 atexit) 也會送完佇列中的通知"""
+
+    def test_worker_process_shutdown_flushes_queue(self):
+        with mock.patch.object(dispatcher, 'flush') as flush:
+            worker_process_shutdown.send(sender=None, pid=1, exitcode=0)
+        flush.assert_called_once_with()
+
+
+class DedupeHouseAddressesTests(TestCase):
+    """重複地址不在 migration 中自動刪除，由 dedupe_house_addresses 保留資料最完整的一筆"""
+
+    def test_keeper_is_most_complete_then_newest(self):
+        sparse = House(pk=9, address='和平東路1號', house_type='公寓', total_price=1000)
+        complete = House(pk=3, address='和平東路1號', house_type='公寓', total_price=1000, city='台北市', town='大安區')
+        self.assertEqual(choose_keeper([sparse, complete]).pk, 3)
+        self.assertEqual(choose_keeper([House(pk=1, **self._fields()), House(pk=2, **self._fields())]).pk, 2)
+
+    def _fields(self):
+        return {'address': '和平東路2號', 'house_type': '公寓', 'total_price': 1000}
+
+    def test_migration_fails_with_duplicate_addresses(self):
+        migration = importlib.import_module('apps.house.migrations.0005_house_address_uniq')
+        house_model = mock.MagicMock()
+        (house_model.objects.values.return_value.annotate.return_value
+            .filter.return_value.order_by.return_value.values_list.return_value) = [('和平東路1號', 2)]
+        apps = mock.Mock(get_model=mock.Mock(return_value=house_model))
+
+        with self.assertRaises(RuntimeError) as caught:
+            migration.check_duplicate_addresses(apps, None)
+        self.assertIn('和平東路1號 (2 筆)', str(caught.exception))
+        self.assertIn('dedupe_house_addresses', str(caught.exception))
+
+    def test_command_without_duplicates(self):
+        out = io.StringIO()
+        call_command('dedupe_house_addresses', '--dry-run', stdout=out)
+        self.assertIn('沒有地址重複', out.getvalue())
@@ -23,7 +23,8 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.files.storage import default_storage # 新增這個
 from django.core.files.base import ContentFile # 新增這個
 from .tasks import import_excel_task # 新增這個
-import base64
+from apps.core.uploads import stage_upload
+from .importers import DATASET_COLUMN_MAPS, SUPPORTED_EXTENSIONS
 
 import os
 from django.conf import settings
@@ -475,23 +476,23 @@ class ExcelUploadView(LoginRequiredMixin, UserPassesTestMixin, View):
             return JsonResponse({'success': False, 'error': '沒有上傳檔案。'}, status=400)
 
         excel_file = request.FILES['file']
-        
+
+        # 【新增】支援 .xlsx / .csv / .parquet；CSV / Parquet 一個檔案只包含一個資料集
+        extension = os.path.splitext(excel_file.name)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            return JsonResponse({'success': False, 'error': '只支援 .xlsx、.csv 或 .parquet 檔案。'}, status=400)
+
+        dataset = request.POST.get('dataset') or None
+        if dataset is not None and dataset not in DATASET_COLUMN_MAPS:
+            return JsonResponse({'success': False, 'error': f'不支援的資料類型: {dataset}'}, status=400)
+
         try:
-            # === 修改開始：改用 Base64 傳送內容 ===
-            
-            # 1. 讀取檔案的二進位內容
-            file_content = excel_file.read()
-            
-            # 2. 轉成 base64 字串 (因為 Redis 只能傳送文字，不能直接傳 binary)
-            # decode('utf-8') 是為了把 bytes 轉成 string
-            file_content_b64 = base64.b64encode(file_content).decode('utf-8')
-
-            # 3. 呼叫 Celery Task
-            # 注意：我們傳送的是「內容字串」，不再是「路徑」
-            # 我們也把檔名傳過去，方便 logging 辨識
-            task = import_excel_task.delay(file_content_b64, request.user.id, filename=excel_file.name)
-
-            # === 修改結束 ===
+            # 1. 分段寫入暫存區 (media/tmp)，Celery 任務只收到檔案的 handle，
+            #    不再把整個檔案 base64 後經過 Redis broker
+            upload = stage_upload(excel_file)
+
+            # 2. 呼叫 Celery Task
+            task = import_excel_task.delay(upload, request.user.id, dataset=dataset)
 
             return JsonResponse({
                 'success': True, 
@@ -5,6 +5,7 @@ Celery 設定檔
 """
 import os
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init, worker_process_init
 
 # 設定 Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
@@ -19,6 +20,67 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_init.connect
+def preload_valuation_model(sender=None, **kwargs):
+    """
+    worker 主行程啟動時 (prefork 建立子行程之前) 先載入估價模型，
+    子行程繼承已載入的模型，以 copy-on-write 共用記憶體，不必各自重新 unpickle
+    """
+    from django.conf import settings
+    if not getattr(settings, 'VALUATION_MODEL_PRELOAD', True):
+        return
+
+    from apps.core.services import HousePriceService
+    pool_cls = getattr(sender, 'pool_cls', None)
+    if 'prefork' in getattr(pool_cls, '__module__', str(pool_cls)):
+        HousePriceService.load_model()
+    else:
+        # solo / threads 等不會 fork 的 pool，直接在主行程暖機
+        HousePriceService.warm_up()
+
+
+@worker_process_init.connect
+def warm_up_valuation_model(**kwargs):
+    """
+    每個子行程啟動後執行一次暖機預測
+    (XGBoost 的 OpenMP 執行緒不能在 fork 前建立，所以暖機預測放在子行程中做)
+    """
+    from django.conf import settings
+    if not getattr(settings, 'VALUATION_MODEL_PRELOAD', True):
+        return
+
+    from apps.core.services import HousePriceService
+    HousePriceService.warm_up()
+
+
+@task_prerun.connect
+def publish_task_started(task_id=None, **kwargs):
+    """任務開始執行時發布 STARTED 事件 (SSE 端點會即時轉給瀏覽器)"""
+    from apps.core.task_events import publish_task_event
+    publish_task_event(task_id, 'STARTED')
+
+
+@task_postrun.connect
+def publish_task_finished(task_id=None, state=None, retval=None, **kwargs):
+    """
+    任務結束時發布最終狀態 (SUCCESS / FAILURE) 與回傳結果
+
+    匯入任務把房屋交給 chord 平行寫入時 (回傳 status 'started' 與 callback_id)，任務本身還沒完成，
+    只發布一次 PROGRESS；最終狀態由 chord callback 以原任務的 ID 發布 (見 apps/house/tasks.py)
+    """
+    from apps.core.task_events import publish_task_event, task_finished
+    if state == 'SUCCESS' and isinstance(retval, dict) and retval.get('status') == 'started':
+        # callback 比這裡先結束時 (例如 eager 模式) 已經發布過最終狀態，不能再蓋掉
+        if not task_finished(task_id):
+            publish_task_event(
+                task_id, 'PROGRESS', message=retval.get('message'), callback_id=retval.get('callback_id')
+            )
+    elif state == 'SUCCESS':
+        publish_task_event(task_id, state, result=retval)
+    else:
+        publish_task_event(task_id, state or 'FAILURE', error=str(retval))
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     """測試用的任務"""
@@ -250,6 +250,65 @@ CACHES = {
 }
 
 
+# ==========================================
+# 地理編碼快取設定 (Geocode Cache)
+# ==========================================
+# Nominatim 查詢結果會同時存入 Redis 與資料庫 (GeocodeCache)
+# 依定位精確度給予不同的存活時間（單位：秒）
+GEOCODE_CACHE_TTL = {
+    'exact': 60 * 60 * 24 * 90,  # 門牌精確定位：90 天
+    'road': 60 * 60 * 24 * 30,   # 路名退一步定位：30 天
+    'miss': 60 * 60 * 6,         # 查無結果：6 小時後再重試
+}
+
+# 優先使用離線的道路中心點 (RoadCentroid) 定位，查不到才呼叫 Nominatim
+# 設為 False 時，道路中心點只在 Nominatim 失敗時作為備援
+GEOCODE_GAZETTEER_FIRST = True
+
+
+# ==========================================
+# 周邊實價搜尋設定 (Comparable Search)
+# ==========================================
+# 使用每個縣市的空間索引 (BallTree) 找出最近的房屋
+COMPARABLE_SPATIAL_INDEX = True
+
+# Redis 無法使用時，空間索引最多沿用多久就重建（單位：秒）
+SPATIAL_INDEX_MAX_AGE = 60 * 10
+
+# 不使用空間索引時，資料庫查詢先以此半徑的經緯度範圍篩選（單位：公里）
+# 半徑內不足筆數會逐次加倍，超過上限後改查整個縣市
+COMPARABLE_SEARCH_RADIUS_KM = 1.0
+COMPARABLE_MAX_RADIUS_KM = 32.0
+
+
+# ==========================================
+# 估價模型設定
+# ==========================================
+# Celery worker 啟動時 (fork 子行程之前) 先載入估價模型，子行程以 copy-on-write 共用
+VALUATION_MODEL_PRELOAD = True
+
+# 模型登錄目錄 (各版本模型與 ACTIVE 使用中版本)，見 apps/core/model_registry.py
+VALUATION_MODEL_REGISTRY_DIR = BASE_DIR / 'apps' / 'core' / 'ml_models' / 'registry'
+
+# worker 每隔幾秒檢查一次使用中的模型版本（單位：秒）
+MODEL_REGISTRY_CHECK_INTERVAL = 10
+
+# 估價結果快取時間（單位：秒）
+# key 包含正規化後的輸入、模型版本與該縣市的資料版本，House 異動或換模型時自然失效
+VALUATION_RESULT_CACHE_TTL = 60 * 60 * 6
+
+
+# ==========================================
+# 任務狀態事件 (SSE) 設定
+# ==========================================
+# 任務最後一個狀態事件在 Redis 保留的時間（單位：秒）
+TASK_EVENTS_TTL = 60 * 60
+
+# SSE 連線最長維持時間與 keep-alive 間隔（單位：秒）
+TASK_EVENTS_SSE_TIMEOUT = 60 * 5
+TASK_EVENTS_SSE_HEARTBEAT = 15
+
+
 # ==========================================
 # ASGI 應用設定（支援 WebSocket）
 # ==========================================
@@ -292,9 +351,42 @@ CELERY_RESULT_SERIALIZER = 'json'
 # 啟動時重試連線（消除 Celery 6.0 棄用警告）
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# 匯入任務使用 acks_late：任務完成才 ack，執行超過 visibility_timeout 仍未 ack 的訊息會被 Redis 重新投遞，
+# 因此要比最長的匯入時間更長（單位：秒）
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 60 * 60 * 6}
+
 # ==========================================
 # Celery Beat 定時任務設定
 # ==========================================
 
 # 使用 django-celery-beat 的資料庫排程器
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# 固定排程 (DatabaseScheduler 啟動時會同步到資料庫)
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-staged-uploads': {
+        'task': 'apps.core.tasks.cleanup_staged_uploads_task',
+        'schedule': 60 * 60,  # 每小時
+    },
+}
+
+# ==========================================
+# 上傳暫存區設定
+# ==========================================
+# 上傳檔案暫存在 MEDIA_ROOT/tmp，超過此時間仍未被處理就會被清除（單位：秒）
+STAGED_UPLOAD_MAX_AGE = 60 * 60 * 24
+
+# ==========================================
+# 資料匯入設定
+# ==========================================
+# 資料庫為 PostgreSQL 時，房屋每一批以 COPY 寫入暫存表再合併 (見 apps/house/importers.py)
+HOUSE_IMPORT_USE_COPY = True
+
+# 房屋資料驗證完成後依地址分成幾份，由多個 worker 平行寫入 (1 表示在同一個任務內寫入)
+HOUSE_IMPORT_PARTITIONS = 4
+
+# 匯入進度最短間隔（單位：秒），每秒最多送出幾次進度，不會每一批都推播
+IMPORT_PROGRESS_INTERVAL = 0.5
+
+# 列表頁即時通知由背景執行緒批次送出，每批最多幾則
+SIGNAL_NOTIFY_BATCH_SIZE = 100